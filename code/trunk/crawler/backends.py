@@ -0,0 +1,350 @@
+#!/usr/bin/env python
+"""In-process frontier and store backends for the crawler, so small crawls and
+benchmarks don't need Redis or MongoDB, nor pay for round trips to them.
+
+The frontiers have the same interface and semantics as RedisFrontier (see
+frontier.py), but can only be shared by the threads of a single process. The
+store implements the part of pymongo's Collection interface the crawler uses.
+"""
+
+import copy
+import sqlite3
+import threading
+import time
+from collections import deque
+
+from settings import FRONTIER_BATCH_SIZE, LEASE_TIME
+
+
+class MemoryFrontier(object):
+    """A frontier kept in memory, in a deque of the users to crawl next, a set
+    mirroring it, a dictionary of the leased users and their expiry times and
+    a set of the users done. It is lost when the process exits."""
+    def __init__(self, batch_size=FRONTIER_BATCH_SIZE, lease_time=LEASE_TIME):
+        self.batch_size = batch_size
+        self.lease_time = lease_time
+        self.queue = deque()
+        self.todo = set()
+        self.leases = {}
+        self.done = set()
+        self.checkpoint = None
+        self.lock = threading.Lock()
+
+    def add(self, item):
+        return self.add_many([item]) == 1
+
+    def add_many(self, items, scores=None):
+        added = 0
+        with self.lock:
+            for item in items:
+                if (item not in self.done and item not in self.todo and
+                    item not in self.leases):
+                    self.todo.add(item)
+                    self.queue.append(item)
+                    added += 1
+        return added
+
+    def pop(self):
+        with self.lock:
+            if not self.queue:
+                return None
+            item = self.queue.popleft()
+            self.todo.discard(item)
+            self.leases[item] = time.time() + self.lease_time
+            return item
+
+    def ack(self, item):
+        self.ack_many([item])
+
+    def ack_many(self, items):
+        with self.lock:
+            for item in items:
+                self.leases.pop(item, None)
+                self.done.add(item)
+
+    def release(self, item):
+        self.drop(item)
+        return self.add(item)
+
+    def drop(self, item):
+        with self.lock:
+            self.leases.pop(item, None)
+
+    def reclaim_expired(self):
+        now = time.time()
+        with self.lock:
+            expired = [item for item, expiry in self.leases.items()
+                       if expiry <= now]
+            for item in expired:
+                del self.leases[item]
+                if item not in self.done and item not in self.todo:
+                    self.todo.add(item)
+                    self.queue.appendleft(item)
+        return len(expired)
+
+    def has_leases(self):
+        return bool(self.leases)
+
+    def count_todo(self):
+        return len(self.queue)
+
+    def count_done(self):
+        return len(self.done)
+
+    def is_consistent(self):
+        return len(self.todo) == len(self.queue)
+
+    def repair(self):
+        with self.lock:
+            queued = set(self.queue)
+            for item in self.todo - queued:
+                self.queue.append(item)
+            self.todo |= queued
+
+    def get_done(self):
+        with self.lock:
+            return set(self.done)
+
+    def mark_done_many(self, items):
+        with self.lock:
+            self.done.update(items)
+
+    def unmark_done_many(self, items):
+        with self.lock:
+            self.done.difference_update(items)
+
+    def get_sync_checkpoint(self):
+        return self.checkpoint
+
+    def set_sync_checkpoint(self, checkpoint):
+        self.checkpoint = checkpoint
+
+
+class SqliteFrontier(object):
+    """A frontier kept in an SQLite database, so that a crawl can be stopped
+    and resumed without any server. The to-do queue and set are one table,
+    ordered by sequence number, so they can't diverge. Users given back go to
+    the front of the queue, with a sequence number lower than any other."""
+    def __init__(self, filename, batch_size=FRONTIER_BATCH_SIZE,
+                 lease_time=LEASE_TIME):
+        self.filename = filename
+        self.batch_size = batch_size
+        self.lease_time = lease_time
+        # The connection is shared by the crawler's threads, guarded by lock
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(filename, check_same_thread=False)
+        self.db.execute("""CREATE TABLE IF NOT EXISTS todo (
+                               seq INTEGER PRIMARY KEY,
+                               item TEXT UNIQUE NOT NULL)""")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS leases (
+                               item TEXT PRIMARY KEY,
+                               expires REAL NOT NULL)""")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS done (
+                               item TEXT PRIMARY KEY)""")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS meta (
+                               key TEXT PRIMARY KEY,
+                               value TEXT)""")
+        self.db.commit()
+
+    def add(self, item):
+        return self.add_many([item]) == 1
+
+    def add_many(self, items, scores=None):
+        added = 0
+        with self.lock:
+            before = self.db.total_changes
+            for start in range(0, len(items), self.batch_size):
+                batch = items[start:start+self.batch_size]
+                self.db.executemany("""INSERT OR IGNORE INTO todo (item)
+                                       SELECT ? WHERE NOT EXISTS
+                                       (SELECT 1 FROM done WHERE item = ?)
+                                       AND NOT EXISTS
+                                       (SELECT 1 FROM leases WHERE item = ?)""",
+                                    [(item, item, item) for item in batch])
+            added = self.db.total_changes - before
+            self.db.commit()
+        return added
+
+    def pop(self):
+        with self.lock:
+            row = self.db.execute("""SELECT seq, item FROM todo
+                                     ORDER BY seq LIMIT 1""").fetchone()
+            if row is None:
+                return None
+            seq, item = row
+            self.db.execute("DELETE FROM todo WHERE seq = ?", (seq,))
+            self.db.execute("INSERT OR REPLACE INTO leases VALUES (?, ?)",
+                            (item, time.time() + self.lease_time))
+            self.db.commit()
+        return item
+
+    def ack(self, item):
+        self.ack_many([item])
+
+    def ack_many(self, items):
+        with self.lock:
+            self.db.executemany("DELETE FROM leases WHERE item = ?",
+                                [(item,) for item in items])
+            self.db.executemany("INSERT OR IGNORE INTO done VALUES (?)",
+                                [(item,) for item in items])
+            self.db.commit()
+
+    def release(self, item):
+        self.drop(item)
+        return self.add(item)
+
+    def drop(self, item):
+        with self.lock:
+            self.db.execute("DELETE FROM leases WHERE item = ?", (item,))
+            self.db.commit()
+
+    def reclaim_expired(self):
+        with self.lock:
+            expired = [row[0] for row in self.db.execute(
+                          "SELECT item FROM leases WHERE expires <= ?",
+                          (time.time(),))]
+            for item in expired:
+                self.db.execute("DELETE FROM leases WHERE item = ?", (item,))
+                self.db.execute("""INSERT OR IGNORE INTO todo (seq, item)
+                                   SELECT (SELECT COALESCE(MIN(seq), 0)
+                                           FROM todo) - 1, ?
+                                   WHERE NOT EXISTS
+                                   (SELECT 1 FROM done WHERE item = ?)""",
+                                (item, item))
+            self.db.commit()
+        return len(expired)
+
+    def _count(self, table):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM " +
+                                   table).fetchone()[0]
+
+    def has_leases(self):
+        return self._count("leases") > 0
+
+    def count_todo(self):
+        return self._count("todo")
+
+    def count_done(self):
+        return self._count("done")
+
+    def is_consistent(self):
+        return True
+
+    def repair(self):
+        return
+
+    def get_done(self):
+        with self.lock:
+            return set(row[0] for row in
+                       self.db.execute("SELECT item FROM done"))
+
+    def mark_done_many(self, items):
+        with self.lock:
+            self.db.executemany("INSERT OR IGNORE INTO done VALUES (?)",
+                                [(item,) for item in items])
+            self.db.commit()
+
+    def unmark_done_many(self, items):
+        with self.lock:
+            self.db.executemany("DELETE FROM done WHERE item = ?",
+                                [(item,) for item in items])
+            self.db.commit()
+
+    def get_sync_checkpoint(self):
+        with self.lock:
+            row = self.db.execute("""SELECT value FROM meta
+                                     WHERE key = 'checkpoint'""").fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    def set_sync_checkpoint(self, checkpoint):
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                            ("checkpoint", repr(checkpoint)))
+            self.db.commit()
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+def matches(document, spec):
+    """Whether a document matches a MongoDB query, as far as the crawler's
+    queries go: equality and the $exists, $in, $gt, $gte, $lt and $lte
+    operators."""
+    for field, condition in spec.iteritems():
+        present = field in document
+        value = document.get(field)
+        if not isinstance(condition, dict):
+            if value != condition:
+                return False
+            continue
+        for operator, operand in condition.iteritems():
+            if operator == "$exists":
+                ok = present == bool(operand)
+            elif operator == "$in":
+                ok = present and value in operand
+            elif operator == "$gt":
+                ok = present and value > operand
+            elif operator == "$gte":
+                ok = present and value >= operand
+            elif operator == "$lt":
+                ok = present and value < operand
+            elif operator == "$lte":
+                ok = present and value <= operand
+            else:
+                raise ValueError("Unsupported query operator: " + operator)
+            if not ok:
+                return False
+    return True
+
+
+class MemoryStore(object):
+    """A store kept in a dictionary of documents by _id, standing in for a
+    MongoDB collection. Documents are copied in and out, as they would be
+    through the database, and the fields to return are ignored."""
+    def __init__(self):
+        self.documents = {}
+        self.lock = threading.Lock()
+
+    def save(self, document, safe=False):
+        with self.lock:
+            self.documents[document["_id"]] = copy.deepcopy(document)
+        return document["_id"]
+
+    def find(self, spec=None, fields=None, timeout=True):
+        with self.lock:
+            found = [copy.deepcopy(document)
+                     for document in self.documents.itervalues()
+                     if matches(document, spec or {})]
+        return iter(found)
+
+    def find_one(self, spec=None, fields=None):
+        for document in self.find(spec, fields):
+            return document
+        return None
+
+    def count(self):
+        return len(self.documents)
+
+    def ensure_index(self, key):
+        return
+
+    def update(self, spec, document, safe=False):
+        """Update the first document matching spec with the $set and $addToSet
+        (with $each) operators."""
+        with self.lock:
+            for stored in self.documents.itervalues():
+                if matches(stored, spec):
+                    break
+            else:
+                return
+            for field, value in document.get("$set", {}).iteritems():
+                stored[field] = copy.deepcopy(value)
+            for field, value in document.get("$addToSet", {}).iteritems():
+                items = stored.setdefault(field, [])
+                for item in value["$each"]:
+                    if item not in items:
+                        items.append(copy.deepcopy(item))
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+"""Benchmark of the API client and the crawler against a local stand-in for the
+API (see mixcloud/tests/fake_api.py), so changes to their performance can be
+measured offline. Reports users per second, requests per user and peak memory.
+
+In "api" mode, each of the served users is fetched once, with MixcloudAPI and
+User. In "crawl" mode, a UserCrawler crawls from the served users, with an
+in-process frontier and store (see backends.py), until it runs out of users.
+Only the served users are crawled, unless users which aren't served are stubbed
+by the fake API. The fake API is served from this process unless the root of
+one already running is given.
+
+The API's rate limiter is turned off, so that what is measured is the client
+and the crawler rather than the throttle, unless asked to keep it."""
+
+import resource
+import time
+from contextlib import contextmanager
+
+from mixcloud.api import MixcloudAPI
+from mixcloud.metrics import Metrics
+from mixcloud.projection import ANALYTICS_PROJECTION
+from mixcloud.resources import User
+from mixcloud.throttle import unlimited
+from mixcloud.tests.fake_api import (FakeAPIServer, DEFAULT_FIXTURES,
+                                     load_fixtures, load_store, generate_users)
+from settings import MONGO_COLLECTION
+from backends import MemoryFrontier, MemoryStore
+from usercrawler import UserCrawler
+
+
+def get_peak_memory():
+    """Peak resident memory of the process so far, in MB."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def count_requests(metrics):
+    stats = metrics.get_stats()["counters"]
+    return sum(counter["total"] for name, counter in stats.iteritems()
+               if name.startswith("api.requests."))
+
+
+def bench_api(api, usernames, projection=None):
+    """Fetch each user in full, returning how many were fetched."""
+    for username in usernames:
+        User(api, username, projection=projection).populate()
+    return len(usernames)
+
+
+class ServedFrontier(MemoryFrontier):
+    """A frontier which only ever queues the users given, e.g. those served."""
+    def __init__(self, served, **kwargs):
+        MemoryFrontier.__init__(self, **kwargs)
+        self.served = set(served)
+
+    def add_many(self, items, scores=None):
+        return MemoryFrontier.add_many(self, [item for item in items
+                                              if item in self.served], scores)
+
+
+def bench_crawl(api, usernames, metrics, projection=None, buffered=False,
+                everyone=False):
+    """Crawl from the users given until no users are left, returning how many
+    were crawled. Only those users are crawled, unless 'everyone' is set, in
+    which case any user discovered is crawled too."""
+    store = MemoryStore()
+    if everyone:
+        frontier = MemoryFrontier()
+    else:
+        frontier = ServedFrontier(usernames)
+    crawler = UserCrawler(usernames, api, store, None, projection=projection,
+                          buffered=buffered, frontier=frontier,
+                          metrics=metrics)
+    crawler.start()
+    return store.count()
+
+
+@contextmanager
+def serving(users, options):
+    """Serve the users at the fake API in this process, unless a root was given,
+    and yield the API's root."""
+    if options.root:
+        yield options.root
+        return
+    server = FakeAPIServer(users, port=0, latency=options.latency,
+                           jitter=options.jitter,
+                           rate_limit=options.rate_limit,
+                           retry_after=options.retry_after,
+                           stub_missing=options.stub_missing).start()
+    try:
+        yield server.root
+    finally:
+        server.stop()
+        print "Server:", server.stats["requests"], "requests,",
+        print server.stats["bytes"], "bytes, by status:",
+        print server.stats["status"]
+
+
+def main(options, filenames):
+    if options.generate:
+        users = generate_users(options.generate, options.degree)
+    elif options.from_store is not None:
+        users = load_store(MONGO_COLLECTION, options.from_store)
+    else:
+        users = load_fixtures(filenames or DEFAULT_FIXTURES)
+    usernames = sorted(users)
+    projection = options.analytics and ANALYTICS_PROJECTION or None
+    metrics = Metrics()
+    with serving(users, options) as root:
+        limiter = None
+        if not options.throttle:
+            limiter = unlimited()
+        api = MixcloudAPI(metrics=metrics, api_root=root, limiter=limiter)
+        started = time.time()
+        if options.mode == "api":
+            done = bench_api(api, usernames, projection)
+        else:
+            done = bench_crawl(api, usernames, metrics, projection,
+                               options.buffered, options.stub_missing)
+        elapsed = time.time() - started
+        api.close_connections()
+    requests = count_requests(metrics)
+    print "Mode:", options.mode, "|", len(users), "users served"
+    print "Users:", done, "in %.2f s" % elapsed
+    print "Users/s: %.2f" % (done / max(elapsed, 1e-6))
+    print "Requests/user: %.2f" % (float(requests) / max(done, 1))
+    print "Peak memory: %.1f MB" % get_peak_memory()
+
+
+if __name__ == "__main__":
+    from optparse import OptionParser
+
+    parser = OptionParser(usage="usage: %prog [options] [fixtures ...]")
+    parser.add_option("-m", "--mode", dest="mode", default="crawl",
+                      choices=["api", "crawl"],
+                      help="What to benchmark: api or crawl")
+    parser.add_option("-R", "--root", dest="root", default=None,
+                      help="Root URI of a fake API already running, instead "
+                      "of serving one from this process")
+    parser.add_option("-g", "--generate", dest="generate", type="int",
+                      default=0,
+                      help="Serve this many generated users instead of the "
+                      "captured ones")
+    parser.add_option("-S", "--from-store", dest="from_store", type="int",
+                      default=None,
+                      help="Serve this many users from the crawler's store "
+                      "instead of the captured ones, or all of them if 0")
+    parser.add_option("-d", "--degree", dest="degree", type="int", default=20,
+                      help="Connections of each generated user")
+    parser.add_option("-l", "--latency", dest="latency", type="float",
+                      default=0.0, help="Seconds each request takes")
+    parser.add_option("-j", "--jitter", dest="jitter", type="float",
+                      default=0.0,
+                      help="Up to how many more seconds a request takes")
+    parser.add_option("-r", "--rate-limit", dest="rate_limit", type="float",
+                      default=None,
+                      help="Requests per second allowed before blocking")
+    parser.add_option("-a", "--retry-after", dest="retry_after", type="int",
+                      default=1, help="Seconds a blocked client waits for")
+    parser.add_option("-M", "--stub-missing", action="store_true",
+                      dest="stub_missing", default=False,
+                      help="Serve unknown users as users with no connections,"
+                      " and crawl every user discovered")
+    parser.add_option("-t", "--throttle", action="store_true",
+                      dest="throttle", default=False,
+                      help="Keep the API's own rate limiter")
+    parser.add_option("-u", "--buffer-writes", action="store_true",
+                      dest="buffered", default=False,
+                      help="Write users to the store in bulk")
+    parser.add_option("-A", "--analytics", action="store_true",
+                      dest="analytics", default=False,
+                      help="Only fetch what the analytics need")
+    options, args = parser.parse_args()
+    try:
+        main(options, args)
+    except KeyboardInterrupt:
+        print "\nBYE!"
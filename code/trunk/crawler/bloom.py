@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+"""A Bloom filter kept as a Redis bitmap, to tell whether a user has been seen
+by the crawl in a fraction of the memory a set of usernames takes."""
+
+import math
+import struct
+from hashlib import md5
+
+# Redis bitmaps are strings, which are limited to 512MB
+MAX_BITS = 2 ** 32
+
+
+def get_size(capacity, error_rate):
+    """Return the number of bits and of hash functions a Bloom filter needs
+    to hold 'capacity' items with the given false-positive rate."""
+    bits = int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+    bits = min(bits, MAX_BITS)
+    hashes = int(round(float(bits) / capacity * math.log(2)))
+    return bits, max(1, hashes)
+
+
+class BloomFilter(object):
+    """The Bloom filter stored under a Redis key. It only works out which bits
+    an item maps to; the bits themselves are read and set in Redis, in batches
+    (see BloomFrontier in frontier.py).
+
+    Items are hashed once with MD5, the two halves of which are combined into
+    as many bit positions as needed (Kirsch-Mitzenmacher double hashing)."""
+    def __init__(self, cache, key, capacity, error_rate):
+        self.cache = cache
+        self.key = key
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.bits, self.hashes = get_size(capacity, error_rate)
+
+    def positions(self, item):
+        if isinstance(item, unicode):
+            item = item.encode("utf-8")
+        first, second = struct.unpack(">QQ", md5(item).digest())
+        return [(first + i * second) % self.bits for i in range(self.hashes)]
+
+    def exists(self):
+        return self.cache.exists(self.key)
+
+    def add_many(self, items):
+        """Set the bits of all the given items, in one round trip."""
+        pipe = self.cache.pipeline(transaction=False)
+        for item in items:
+            for position in self.positions(item):
+                pipe.setbit(self.key, position, 1)
+        pipe.execute()
+
+    def clear(self):
+        self.cache.delete(self.key)
+
+    def get_memory(self):
+        """Bytes the filter takes in Redis once full."""
+        return self.bits // 8
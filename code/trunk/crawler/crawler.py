@@ -1,10 +1,18 @@
 #!/usr/bin/env python
 
-from mixcloud.api import MixcloudAPI, MixcloudAPIException, PROXIES
-from mixcloud.resources import User
-from settings import MONGO_COLLECTION, CACHE, USER_QUEUE, USER_TODO, USER_SET
-from settings import DEBUG
-from pymongo.errors import OperationFailure 
+from mixcloud.api import MixcloudAPI, PROXIES
+from mixcloud.api import DEFAULT_API
+from mixcloud.cache import ResponseCache
+from mixcloud.metrics import serve_metrics, write_metrics
+from mixcloud.projection import ANALYTICS_PROJECTION
+from connections import forget_connections
+from settings import MONGO_COLLECTION, CACHE, USER_PRIORITY_QUEUE
+from settings import FRONTIER_FILE
+from usercrawler import UserCrawler
+from backends import MemoryFrontier, SqliteFrontier, MemoryStore
+from priority import get_policy
+from multiprocessing import Process
+from optparse import OptionParser
 
 # Get the reference to the collection in the database as specified in settings
 crawl_store = MONGO_COLLECTION
@@ -13,153 +21,81 @@ crawl_store = MONGO_COLLECTION
 crawl_cache = CACHE
 
 
-class UserCrawler:
-    """Take a list of seed users, a storage object (MongoDB database) and a 
-    cache object (Redis cache), ready to begin a breadth-first search, with the 
-    search queue pre-populated with the seeds. It is assumed that all seed items
-    are valid ones.
-    !!! FIX: store and cache have to MongoDB or Redis, maybe fix this with some 
-    refactoring - make it possible to plug in a pure Python cache, perhaps."""
-    def __init__(self, seed_list, api, store, cache, 
-                 todo_queue=USER_QUEUE,
-                 todo_set=USER_TODO,
-                 done_set=USER_SET):
-        self.api = api
-        self.store = store
-        self.cache = cache
-        #These are key values (strings) to use in the cache.
-        self.todo_queue = todo_queue
-        self.todo_set = todo_set
-        self.done_set = done_set
-        
-        self.sync_cache_with_store()
-        
-        for each in seed_list:
-            items_added = 0
-            if self.add_to_todo(each):
-                items_added += 1
-        print items_added, "seed users were added to the to-do list."
-        
-    def __str__(self):
-        done = self.cache.scard(self.done_set)
-        todo = self.cache.scard(self.todo_set)
-        return "Crawler - done: " + str(done) + ", todo: " + str(todo) 
-    
-    def start(self):
-        while not self.is_todo_empty():
-            parent = self.get_next_user()
-            self.enqueue_user_connections(parent)
-            self.store_user(parent)
-
-    def get_next_user(self):
-        next = self.pop_from_todo()
-        try:
-            next_user = User(self.api, next)
-            next_user.populate()
-        except KeyboardInterrupt, k:
-            # Re-queue the user if interrupted
-            self.add_to_todo(next)
-            raise k            
-        except MixcloudAPIException, mce:
-            # This handles the case of a missing/renamed user, by just skipping
-            # it and returning the next user 
-            try:
-                if mce.status == 404:
-                    return self.get_next_user()
-                else:
-                    raise mce
-            except AttributeError, ae:
-                print "AttributeError: problem handling API Exception!"
-                print ae.message, ae.args
-                raise mce
-        return next_user
-    
-    def enqueue_user_connections(self, user_obj):
-        conn_list = user_obj.get_social_connections()
-        for each in conn_list:
-            self.add_to_todo(each)
-
-    def store_user(self, user_obj):
-        to_store = user_obj.get_user_id()
-        try:
-            if not DEBUG:
-                self.store.save(user_obj.get_data(), safe=True)
-        except Exception, error:
-            print error
-            print "Could not save " + to_store + ", re-queuing it."
-            self.add_to_todo(to_store)
-            raise error
-        self.cache.sadd(self.done_set, to_store)
-        print to_store
-
-    def add_to_todo(self, item):
-        """Only update the todo set and queue if item is not already in to-do 
-        set."""
-        if not self.cache.sismember(self.done_set, item):
-            if not self.cache.sismember(self.todo_set, item):
-                self.cache.sadd(self.todo_set, item)
-                self.cache.rpush(self.todo_queue, item)
-                return True
-        return False
-    
-    def pop_from_todo(self):
-        item = self.cache.lpop(self.todo_queue)
-        self.cache.srem(self.todo_set, item)
-        return item
-    
-    def is_todo_empty(self):
-        if self.check_and_fix_internals():
-            condition = (self.cache.scard(self.todo_set) == 0 and
-                         self.cache.llen(self.todo_queue) == 0 )
-            if condition:
-                return True
-        return False
-    
-    def check_and_fix_internals(self):
-        """This method does a simple check to see if there is a one-to-one 
-        mapping between the to-do structures."""
-        #!!!FIX: check against DB, too!
-        if self.cache.scard(self.todo_set) == self.cache.llen(self.todo_queue):
-            return True
-        else:
-            ## !!!FIX: do some fixing!
-            self.sync_cache_todo_structs()
-            return True
-        return False
-        
-    def sync_cache_with_store(self):
-        cursor = self.store.find(spec={"username": {"$exists": True}},
-                                 fields=["username"],
-                                 timeout=False)
-        stored_users = set([each["username"] for each in cursor])
-        
-        cached_done_users = self.cache.smembers(self.done_set)
-        if stored_users != cached_done_users:
-            # Some stored users are missing from the cache
-            if stored_users > cached_done_users:
-                for each in (stored_users - cached_done_users):
-                    self.cache.sadd(self.done_set, each)
-            # Unlikely case that there are items in the cache that aren't in the
-            # store - we trust the store and see update the cache
-            elif stored_users < cached_done_users:
-                for each in (cached_done_users - stored_users):
-                    self.cache.srem(self.done_set, each)
-            # The very unlikely case that the sets overlap but not cover each 
-            # other - again trust the store 
-            else:
-                self.cache.delete(self.done_set)
-                for each in stored_users:
-                    self.cache.sadd(self.done_set, each)
-            
-    
-    def sync_cache_todo_structs(self):
-        curr_queue = self.cache.lrange(self.todo_queue, 0, -1)
-        curr_set = self.cache.smembers(self.todo_set)
-        
+def get_api(options):
+    """Get the Mixcloud API as set up by the command line options."""
+    response_cache = None
+    if options.response_cache:
+        response_cache = ResponseCache(options.response_cache)
+    if options.proxies:
+        return MixcloudAPI(PROXIES, cache=response_cache,
+                           api_root=options.api_root)
+    return MixcloudAPI(cache=response_cache, api_root=options.api_root)
 
-if __name__ == "__main__":
-    from optparse import OptionParser
-    
+
+def get_projection(options):
+    if options.lean:
+        return ANALYTICS_PROJECTION
+    return None
+
+
+def get_crawler_params(options):
+    """Keyword arguments for the crawler, as set up by the command line options.
+    """
+    params = {"projection": get_projection(options),
+              "compact": options.compact,
+              "buffered": options.buffered}
+    if options.order != "bfs":
+        params["priority"] = get_policy(options.order)
+        params["todo_queue"] = USER_PRIORITY_QUEUE
+    if options.frontier == "memory":
+        params["frontier"] = MemoryFrontier()
+    elif options.frontier == "sqlite":
+        params["frontier"] = SqliteFrontier(FRONTIER_FILE)
+    return params
+
+
+def get_crawler_class(options):
+    if options.pipelined:
+        from pipeline import PipelinedUserCrawler
+        return PipelinedUserCrawler
+    return UserCrawler
+
+
+def export_metrics(options, worker_id=None):
+    """Serve or write the metrics, as set up by the command line options. Each
+    worker process has metrics of its own, served on the next ports up or 
+    written to files suffixed with the worker's id."""
+    if options.metrics_port:
+        port = options.metrics_port
+        if worker_id is not None:
+            port += worker_id + 1
+        serve_metrics(port)
+    if options.metrics_file:
+        filename = options.metrics_file
+        if worker_id is not None:
+            filename += "." + str(worker_id)
+        write_metrics(filename)
+
+
+def run_worker(worker_id, options):
+    """Crawl in a worker process, sharing the frontier with the others, over 
+    connections of its own."""
+    print "Worker", worker_id, "started."
+    # Don't share the parent's sockets: the store and cache connect anew
+    forget_connections()
+    export_metrics(options, worker_id)
+    crawler_class = get_crawler_class(options)
+    crawler = crawler_class([], get_api(options), crawl_store, crawl_cache,
+                            sync=False,
+                            **get_crawler_params(options))
+    try:
+        crawler.start()
+    except KeyboardInterrupt:
+        pass
+    print "Worker", worker_id, "done."
+
+
+def get_parser():
     parser = OptionParser()
     parser.add_option("-f", "--input-file", dest="input",
                       help="Text file from which to read seed items from. "
@@ -171,29 +107,124 @@ if __name__ == "__main__":
                       help="Use the default proxies provided to overcome rate"
                       " limit of API - NOTE: you must set up the the "
                       "connections to the proxies manually using 'ssh -D'")
+    parser.add_option("-l", "--lean", action="store_true", dest="lean",
+                      default=False,
+                      help="Only fetch and store the fields needed for the "
+                      "analytics: usernames, counts and user/slug edges")
+    parser.add_option("-c", "--response-cache", dest="response_cache",
+                      default=None, 
+                      help="File in which to cache API responses between runs")
+    parser.add_option("-w", "--workers", dest="workers", type="int", default=1,
+                      help="Number of crawler processes sharing the frontier")
+    parser.add_option("-P", "--pipelined", action="store_true", 
+                      dest="pipelined", default=False,
+                      help="Fetch, parse and store users concurrently, in "
+                      "separate stages")
+    parser.add_option("-b", "--bloom", action="store_true", dest="compact",
+                      default=False,
+                      help="Remember the users seen in a Bloom filter rather "
+                      "than a set, to save memory on large crawls")
+    parser.add_option("-o", "--order", dest="order", default="bfs",
+                      choices=["bfs", "discovery", "degree"],
+                      help="Order to crawl users in: bfs (the default), or by "
+                      "priority, scoring users by the number of times they "
+                      "were discovered (discovery), or weighting each "
+                      "discovery by the degree of the user it was made from "
+                      "(degree)")
+    parser.add_option("-u", "--buffer-writes", action="store_true", 
+                      dest="buffered", default=False,
+                      help="Write users to the store in bulk, rather than one "
+                      "at a time")
+    parser.add_option("-r", "--recrawl", action="store_true", dest="recrawl",
+                      default=False,
+                      help="Refresh the stored users, or those in the input "
+                      "file, fetching only what changed, instead of crawling")
+    parser.add_option("--metrics-port", dest="metrics_port", type="int",
+                      default=None,
+                      help="Serve the crawl's metrics as JSON over HTTP on "
+                      "this port of localhost")
+    parser.add_option("--metrics-file", dest="metrics_file", default=None,
+                      help="File to write the crawl's metrics to as JSON, "
+                      "every few seconds")
+    parser.add_option("--frontier", dest="frontier", default="redis",
+                      choices=["redis", "memory", "sqlite"],
+                      help="Where to keep the frontier: in the cache (redis, "
+                      "the default), in memory, or in a local SQLite file "
+                      "which survives restarts (sqlite)")
+    parser.add_option("--store", dest="store", default="mongo",
+                      choices=["mongo", "memory"],
+                      help="Where to store the users: in MongoDB (mongo, the "
+                      "default) or in memory, e.g. for benchmarks")
+    parser.add_option("--api-root", dest="api_root", default=DEFAULT_API,
+                      help="Root URI of the API, e.g. that of a local fake "
+                      "one (see mixcloud/tests/fake_api.py)")
+    return parser
+
+
+def check_options(parser, options):
+    """Exit through the parser if the options can't be used together."""
+    if options.compact and options.order != "bfs":
+        parser.error("A Bloom filter can only be used with the bfs order.")
+    if options.frontier != "redis" and (options.compact or options.workers > 1
+                                        or options.order != "bfs"):
+        parser.error("An in-process frontier can only be used by one crawler, "
+                     "in the bfs order, without a Bloom filter.")
+    if options.store == "memory" and options.frontier != "memory":
+        # On startup, the done set is synced with the store, which would
+        # forget every user done in a frontier which outlasts the crawl
+        parser.error("An in-memory store starts empty, so it can only be used "
+                     "with an in-memory frontier, by one crawler.")
+    if options.store == "memory" and options.recrawl:
+        parser.error("An in-memory store starts empty, so there is nothing "
+                     "in it to recrawl.")
 
+
+if __name__ == "__main__":
+    parser = get_parser()
     options, args = parser.parse_args()
+    check_options(parser, options)
+    if options.store == "memory":
+        crawl_store = MemoryStore()
 
     inlist = None
-    try:
-        with open(options.input, "r") as infile:
-            inlist = infile.read()
-            inlist = inlist.strip().splitlines()
-    except IOError, io:
-        print io
-        print "Invalid filename."
-        exit()
+    if options.input or not options.recrawl:
+        try:
+            with open(options.input, "r") as infile:
+                inlist = infile.read()
+                inlist = inlist.strip().splitlines()
+        except IOError, io:
+            print io
+            print "Invalid filename."
+            exit()
 
     # Get the Mixcloud API
-    mcapi = None
-    if options.proxies:
-        mcapi = MixcloudAPI(PROXIES)
-    else:
-        mcapi = MixcloudAPI()
+    mcapi = get_api(options)
+    export_metrics(options)
+
+    if options.recrawl:
+        from recrawl import UserRecrawler
+        recrawler = UserRecrawler(mcapi, crawl_store, get_projection(options))
+        try:
+            recrawler.start(inlist)
+        except KeyboardInterrupt, k:
+            print k
+        print str(recrawler)
+        exit()
 
     try:
-        crawler = UserCrawler(inlist, mcapi, crawl_store, crawl_cache)        
-        crawler.start()
+        crawler_class = get_crawler_class(options)
+        crawler = crawler_class(inlist, mcapi, crawl_store, crawl_cache,
+                                **get_crawler_params(options))
+        if options.workers > 1:
+            # The seeded frontier is shared with the workers through the cache
+            workers = [Process(target=run_worker, args=(i, options))
+                       for i in range(options.workers)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        else:
+            crawler.start()
     except KeyboardInterrupt, k:
         print k
         print str(crawler)
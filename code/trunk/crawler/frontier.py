@@ -0,0 +1,490 @@
+#!/usr/bin/env python
+"""The crawl frontier: the users still to be crawled, those being crawled and 
+those already done, kept in Redis so that every update is a single round trip
+and several crawlers can share it."""
+
+import time
+from itertools import chain
+
+from bloom import BloomFilter
+from settings import (FRONTIER_BATCH_SIZE, LEASE_TIME, BLOOM_CAPACITY,
+                      BLOOM_ERROR_RATE)
+
+# Add the users given as arguments to the to-do queue and set, unless they are
+# already in the to-do set or the done set, or leased by a crawler. Returns how
+# many were added.
+ADD_SCRIPT = """
+local added = 0
+for i, item in ipairs(ARGV) do
+    if redis.call("SISMEMBER", KEYS[1], item) == 0 and
+       not redis.call("ZSCORE", KEYS[4], item) and
+       redis.call("SADD", KEYS[2], item) == 1 then
+        redis.call("RPUSH", KEYS[3], item)
+        added = added + 1
+    end
+end
+return added
+"""
+
+# Pop the next user off the to-do queue, remove it from the to-do set and lease
+# it until the expiry time given, or return nil if the queue is empty.
+POP_SCRIPT = """
+local item = redis.call("LPOP", KEYS[1])
+if item then
+    redis.call("SREM", KEYS[2], item)
+    redis.call("ZADD", KEYS[3], ARGV[1], item)
+end
+return item
+"""
+
+# Give up the leases on the users in ARGV, each followed by the expiry time its
+# holder leased it until, unless the lease has been taken over since, with
+# another expiry time. Returns the users whose leases were given up.
+UNLEASE_SCRIPT = """
+local unleased = {}
+for i = 1, #ARGV, 2 do
+    local item = ARGV[i]
+    local expiry = redis.call("ZSCORE", KEYS[1], item)
+    if expiry and tonumber(expiry) == tonumber(ARGV[i+1]) then
+        redis.call("ZREM", KEYS[1], item)
+        table.insert(unleased, item)
+    end
+end
+return unleased
+"""
+
+# Put the users whose leases expired before the time given back at the front of
+# the to-do queue, unless they are done or already queued again. Returns how 
+# many leases expired.
+RECLAIM_SCRIPT = """
+local expired = redis.call("ZRANGEBYSCORE", KEYS[1], "-inf", ARGV[1])
+for i, item in ipairs(expired) do
+    redis.call("ZREM", KEYS[1], item)
+    if redis.call("SISMEMBER", KEYS[2], item) == 0 and
+       redis.call("SADD", KEYS[3], item) == 1 then
+        redis.call("LPUSH", KEYS[4], item)
+    end
+end
+return #expired
+"""
+
+# Add the users in ARGV, each followed by its score, to the to-do sorted set and
+# set, unless they are already done or leased; the scores of users which are
+# already queued are added to their priority. Returns how many users were new.
+PRIORITY_ADD_SCRIPT = """
+local added = 0
+for i = 1, #ARGV, 2 do
+    local item = ARGV[i]
+    if redis.call("SISMEMBER", KEYS[1], item) == 0 and
+       not redis.call("ZSCORE", KEYS[4], item) then
+        if redis.call("SADD", KEYS[2], item) == 1 then
+            added = added + 1
+        end
+        redis.call("ZINCRBY", KEYS[3], ARGV[i+1], item)
+    end
+end
+return added
+"""
+
+# Like POP_SCRIPT, for the user with the highest priority.
+PRIORITY_POP_SCRIPT = """
+local item = redis.call("ZREVRANGE", KEYS[1], 0, 0)[1]
+if item then
+    redis.call("ZREM", KEYS[1], item)
+    redis.call("SREM", KEYS[2], item)
+    redis.call("ZADD", KEYS[3], ARGV[1], item)
+end
+return item
+"""
+
+# Like RECLAIM_SCRIPT, putting the users back with the priority given.
+PRIORITY_RECLAIM_SCRIPT = """
+local expired = redis.call("ZRANGEBYSCORE", KEYS[1], "-inf", ARGV[1])
+for i, item in ipairs(expired) do
+    redis.call("ZREM", KEYS[1], item)
+    if redis.call("SISMEMBER", KEYS[2], item) == 0 and
+       redis.call("SADD", KEYS[3], item) == 1 then
+        redis.call("ZADD", KEYS[4], ARGV[2], item)
+    end
+end
+return #expired
+"""
+
+# Queue users which the Bloom filter (KEYS[1]) hasn't seen yet, setting their
+# bits. ARGV holds the number of bits per user, whether to queue the users even
+# if they have been seen, then each user followed by its bit positions. Returns
+# how many were added and the users which may have been seen already.
+BLOOM_ADD_SCRIPT = """
+local hashes = tonumber(ARGV[1])
+local force = ARGV[2] == "1"
+local added = 0
+local maybe = {}
+for i = 3, #ARGV, hashes + 1 do
+    local item = ARGV[i]
+    local seen = not force
+    if seen then
+        for j = 1, hashes do
+            if redis.call("GETBIT", KEYS[1], ARGV[i+j]) == 0 then
+                seen = false
+                break
+            end
+        end
+    end
+    if seen then
+        table.insert(maybe, item)
+    elseif redis.call("SADD", KEYS[2], item) == 1 then
+        redis.call("RPUSH", KEYS[3], item)
+        for j = 1, hashes do
+            redis.call("SETBIT", KEYS[1], ARGV[i+j], 1)
+        end
+        added = added + 1
+    end
+end
+return {added, maybe}
+"""
+
+
+def unique(items):
+    """Return the items without duplicates, in their original order."""
+    seen = set()
+    result = []
+    for item in items:
+        if item not in seen:
+            seen.add(item)
+            result.append(item)
+    return result
+
+
+class RedisFrontier(object):
+    """The frontier of a crawl, made up of four Redis structures: a queue
+    (list) of the users to crawl next, a set mirroring the queue for fast
+    membership tests, a sorted set of the users being crawled, scored by the
+    time their lease expires, and a set of the users already crawled and 
+    stored.
+    
+    A crawler popping a user holds a lease on it until it acknowledges that the
+    user is stored, with ack(), or gives it back, with release(). If it dies in
+    between, the lease expires after lease_time seconds and reclaim_expired()
+    puts the user back in the queue, so no user is lost or crawled twice by 
+    crawlers sharing the frontier.
+
+    Each frontier remembers the expiry time of the leases it took, which tells
+    them apart from those another crawler took on the same user after it was
+    reclaimed: ack(), release() and drop() only give up a lease still held
+    until that time, so a slow crawler can't end another's lease."""
+    def __init__(self, cache, todo_queue, todo_set, done_set, leases,
+                 sync_checkpoint=None, batch_size=FRONTIER_BATCH_SIZE,
+                 lease_time=LEASE_TIME):
+        self.cache = cache
+        self.todo_queue = todo_queue
+        self.todo_set = todo_set
+        self.done_set = done_set
+        self.leases = leases
+        self.sync_checkpoint = sync_checkpoint
+        self.batch_size = batch_size
+        self.lease_time = lease_time
+        self._add_script = cache.register_script(ADD_SCRIPT)
+        self._pop_script = cache.register_script(POP_SCRIPT)
+        self._reclaim_script = cache.register_script(RECLAIM_SCRIPT)
+        self._unlease_script = cache.register_script(UNLEASE_SCRIPT)
+        # The expiry times of the leases taken, by user, kept as strings so
+        # they compare exactly with Redis's
+        self.held = {}
+
+    def add(self, item):
+        return self.add_many([item]) == 1
+
+    def add_many(self, items, scores=None):
+        """Queue all the given users which are neither queued, leased nor done
+        yet, checking and inserting each batch atomically in one round trip.
+        Returns the number of users queued. Any scores, by user, are only
+        used by a PriorityFrontier."""
+        items = unique(items)
+        added = 0
+        for start in range(0, len(items), self.batch_size):
+            batch = items[start:start+self.batch_size]
+            added += self._add_script(keys=[self.done_set, self.todo_set,
+                                            self.todo_queue, self.leases],
+                                      args=batch)
+        return added
+
+    def pop(self):
+        """Atomically take the next user off the to-do queue and set and lease
+        it, in one round trip. Returns None if there are no users to do."""
+        expiry = repr(time.time() + self.lease_time)
+        item = self._pop_script(keys=[self.todo_queue, self.todo_set, 
+                                      self.leases],
+                                args=[expiry])
+        if item is not None:
+            self.held[item] = expiry
+        return item
+
+    def _unlease(self, items, client=None):
+        """Give up the leases this frontier holds on the given users, in one
+        round trip, or queued on the pipeline given as client. Returns the
+        users whose leases were given up, unless queued."""
+        args = []
+        for item in items:
+            args.extend([item, self.held.pop(item, "")])
+        return self._unlease_script(keys=[self.leases], args=args,
+                                    client=client)
+
+    def ack(self, item):
+        """Mark a leased user as done, once it is safely stored."""
+        self.ack_many([item])
+
+    def ack_many(self, items):
+        """Mark several leased users as done at once."""
+        if not items:
+            return
+        pipe = self.cache.pipeline(transaction=True)
+        self._unlease(items, client=pipe)
+        pipe.sadd(self.done_set, *items)
+        pipe.execute()
+
+    def release(self, item):
+        """Give up the lease on a user and queue it again, unless another
+        crawler has taken it over."""
+        if not self._unlease([item]):
+            return False
+        return self.add(item)
+
+    def drop(self, item):
+        """Give up the lease on a user without queueing it again, e.g. if it 
+        no longer exists."""
+        self._unlease([item])
+
+    def reclaim_expired(self):
+        """Queue the users whose leases have expired again, returning how many
+        there were."""
+        return self._reclaim_script(keys=[self.leases, self.done_set,
+                                          self.todo_set, self.todo_queue],
+                                    args=[time.time()])
+
+    def has_leases(self):
+        return self.cache.zcard(self.leases) > 0
+
+    def count_todo(self):
+        return self.cache.llen(self.todo_queue)
+
+    def count_done(self):
+        return self.cache.scard(self.done_set)
+
+    def get_done(self):
+        return self.cache.smembers(self.done_set)
+
+    def get_sync_checkpoint(self):
+        """Return the checkpoint of the last sync of the done set with the 
+        store, see UserCrawler.sync_cache_with_store()."""
+        return self.cache.get(self.sync_checkpoint)
+
+    def set_sync_checkpoint(self, checkpoint):
+        self.cache.set(self.sync_checkpoint, repr(checkpoint))
+
+    def mark_done_many(self, items):
+        """Add users to the done set, in batches, in one round trip."""
+        self._update_done_set("sadd", items)
+
+    def unmark_done_many(self, items):
+        """Remove users from the done set, in batches, in one round trip."""
+        self._update_done_set("srem", items)
+
+    def _update_done_set(self, command, items):
+        items = list(items)
+        pipe = self.cache.pipeline(transaction=False)
+        for start in range(0, len(items), self.batch_size):
+            batch = items[start:start+self.batch_size]
+            getattr(pipe, command)(self.done_set, *batch)
+        pipe.execute()
+
+    def is_consistent(self):
+        return self.cache.scard(self.todo_set) == self.count_todo()
+
+    def repair(self):
+        """Make the to-do set and queue hold the same users again, should they
+        have diverged, by adding whatever is missing from either."""
+        queued = self.cache.lrange(self.todo_queue, 0, -1)
+        members = self.cache.smembers(self.todo_set)
+        pipe = self.cache.pipeline()
+        for item in set(queued) - members:
+            pipe.sadd(self.todo_set, item)
+        for item in members - set(queued):
+            pipe.rpush(self.todo_queue, item)
+        pipe.execute()
+
+
+class PriorityFrontier(RedisFrontier):
+    """A frontier whose queue is a sorted set rather than a list, so that the
+    user with the highest priority is crawled next instead of the one queued
+    first. A user's priority is the sum of the scores given to it every time
+    it is added, e.g. by one of the policies in priority.py. Leased users which
+    are given back go to the front of the queue."""
+    def __init__(self, cache, todo_queue, todo_set, done_set, leases, 
+                 **kwargs):
+        RedisFrontier.__init__(self, cache, todo_queue, todo_set, done_set,
+                               leases, **kwargs)
+        self._add_script = cache.register_script(PRIORITY_ADD_SCRIPT)
+        self._pop_script = cache.register_script(PRIORITY_POP_SCRIPT)
+        self._reclaim_script = cache.register_script(PRIORITY_RECLAIM_SCRIPT)
+
+    def add_many(self, items, scores=None):
+        """Queue the given users, or add to their priority if they are queued
+        already. Users without a score get 1 for each time they appear."""
+        if scores is None:
+            scores = {}
+            for item in items:
+                scores[item] = scores.get(item, 0) + 1
+        items = unique(items)
+        added = 0
+        for start in range(0, len(items), self.batch_size):
+            args = []
+            for item in items[start:start+self.batch_size]:
+                args.extend([item, scores.get(item, 1)])
+            added += self._add_script(keys=[self.done_set, self.todo_set,
+                                            self.todo_queue, self.leases],
+                                      args=args)
+        return added
+
+    def release(self, item):
+        if not self._unlease([item]):
+            return False
+        return self.add_many([item], {item: float("inf")}) == 1
+
+    def reclaim_expired(self):
+        return self._reclaim_script(keys=[self.leases, self.done_set,
+                                          self.todo_set, self.todo_queue],
+                                    args=[time.time(), "+inf"])
+
+    def count_todo(self):
+        return self.cache.zcard(self.todo_queue)
+
+    def repair(self):
+        queued = set(self.cache.zrange(self.todo_queue, 0, -1))
+        members = self.cache.smembers(self.todo_set)
+        pipe = self.cache.pipeline()
+        for item in queued - members:
+            pipe.sadd(self.todo_set, item)
+        for item in members - queued:
+            pipe.zadd(self.todo_queue, item, 1)
+        pipe.execute()
+
+
+class BloomFrontier(RedisFrontier):
+    """A frontier which remembers the users it has seen, i.e. queued, leased or
+    done, in a Bloom filter rather than in a set of usernames, so that a crawl
+    of tens of millions of users fits in a small, fixed amount of memory. The
+    done set only holds the users dropped, e.g. because they no longer exist,
+    which the store has no record of. The users done are counted under the
+    done_count key instead, for monitoring.
+
+    Users the filter hasn't seen are queued straight away. The others may be
+    false positives, at the given error_rate, so they are looked up exactly in
+    the to-do set, the leases, the users dropped and lastly the store, which
+    has the final say on which users are done."""
+    def __init__(self, cache, store, todo_queue, todo_set, done_set, leases,
+                 seen_filter, done_count, capacity=BLOOM_CAPACITY,
+                 error_rate=BLOOM_ERROR_RATE, **kwargs):
+        RedisFrontier.__init__(self, cache, todo_queue, todo_set, done_set,
+                               leases, **kwargs)
+        self.store = store
+        self.seen = BloomFilter(cache, seen_filter, capacity, error_rate)
+        self.done_count = done_count
+        self.false_positives = 0
+        self._bloom_add_script = cache.register_script(BLOOM_ADD_SCRIPT)
+
+    def add_many(self, items, scores=None):
+        items = unique(items)
+        added = 0
+        for start in range(0, len(items), self.batch_size):
+            batch = items[start:start+self.batch_size]
+            batch_added, maybe = self._add_batch(batch, force=False)
+            added += batch_added
+            if maybe:
+                unseen = self.get_unseen(maybe)
+                self.false_positives += len(unseen)
+                added += self._add_batch(unseen, force=True)[0]
+        return added
+
+    def _add_batch(self, items, force):
+        if not items:
+            return 0, []
+        args = [self.seen.hashes, int(force)]
+        for item in items:
+            args.append(item)
+            args.extend(self.seen.positions(item))
+        return self._bloom_add_script(keys=[self.seen.key, self.todo_set,
+                                            self.todo_queue],
+                                      args=args)
+
+    def get_unseen(self, items):
+        """Return which of the given users are neither queued, leased, dropped
+        nor stored, checking exactly."""
+        pipe = self.cache.pipeline(transaction=False)
+        for item in items:
+            pipe.sismember(self.todo_set, item)
+            pipe.zscore(self.leases, item)
+            pipe.sismember(self.done_set, item)
+        replies = pipe.execute()
+        unknown = [item for i, item in enumerate(items)
+                   if not replies[3*i] and replies[3*i+1] is None and
+                   not replies[3*i+2]]
+        if not unknown:
+            return []
+        cursor = self.store.find(spec={"username": {"$in": unknown}},
+                                 fields=["username"])
+        stored = set(each["username"] for each in cursor)
+        return [item for item in unknown if item not in stored]
+
+    def ack_many(self, items):
+        if not items:
+            return
+        pipe = self.cache.pipeline(transaction=True)
+        self._unlease(items, client=pipe)
+        # The users' bits were set when they were queued, unless that was
+        # before the filter was in use
+        for item in items:
+            for position in self.seen.positions(item):
+                pipe.setbit(self.seen.key, position, 1)
+        pipe.incr(self.done_count, len(items))
+        pipe.execute()
+
+    def release(self, item):
+        if not self._unlease([item]):
+            return False
+        return self._add_batch([item], force=True)[0] == 1
+
+    def drop(self, item):
+        """Give up the lease on a user without queueing it again, remembering
+        it as dropped so that it isn't taken for a false positive and queued
+        again whenever it is linked to."""
+        pipe = self.cache.pipeline(transaction=True)
+        self._unlease([item], client=pipe)
+        for position in self.seen.positions(item):
+            pipe.setbit(self.seen.key, position, 1)
+        pipe.sadd(self.done_set, item)
+        pipe.execute()
+
+    def count_done(self):
+        return self.store.count()
+
+    def sync_with_store(self):
+        """Build the filter from the stored, queued and leased users, and count
+        the stored ones as done, unless it has been built already: bits can't
+        be unset, and any user wrongly left in the filter is caught by the
+        exact check against the store."""
+        if self.seen.exists():
+            return
+        cursor = self.store.find(spec={"username": {"$exists": True}},
+                                 fields=["username"],
+                                 timeout=False)
+        users = chain((each["username"] for each in cursor),
+                      self.cache.smembers(self.todo_set),
+                      self.cache.zrange(self.leases, 0, -1))
+        batch = []
+        for user in users:
+            batch.append(user)
+            if len(batch) == self.batch_size:
+                self.seen.add_many(batch)
+                batch = []
+        self.seen.add_many(batch)
+        self.cache.set(self.done_count, self.count_done())
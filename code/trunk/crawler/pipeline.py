@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+"""A crawler which fetches, parses and stores users concurrently, in separate
+stages connected by bounded queues."""
+
+import threading
+import time
+from Queue import Queue, Full
+from time import sleep
+
+from usercrawler import UserCrawler
+from settings import (PIPELINE_FETCHERS, PIPELINE_PARSERS, PIPELINE_STORERS,
+                      PIPELINE_QUEUE_SIZE, PIPELINE_IDLE_WAIT,
+                      RECLAIM_INTERVAL)
+
+# Put on a stage's queue to tell one of its workers to finish
+_DONE = object()
+
+
+class PipelinedUserCrawler(UserCrawler):
+    """A UserCrawler whose work is split in three stages, each run by its own
+    pool of threads, so that the network, the CPU and the store are all kept
+    busy at the same time:
+
+    - fetch: pop users off the frontier and populate them from the API,
+    - parse: queue the users' connections in the frontier,
+    - store: save the users in the store and mark them as done.
+
+    The stages are connected by queues of at most queue_size users, so a slow
+    stage holds back the ones before it rather than letting users pile up in
+    memory. Each user goes through them with the name it was leased as, which
+    is the one acked or released. The crawl ends once the frontier runs dry,
+    or after a user fails in any stage, in which case that user is queued
+    again and the error is raised once the users already fetched have gone
+    through the remaining stages. Interrupting the crawl again while they do
+    gives up on them, re-queuing every user still in the pipeline."""
+    def __init__(self, seed_list, api, store, cache,
+                 fetchers=PIPELINE_FETCHERS,
+                 parsers=PIPELINE_PARSERS,
+                 storers=PIPELINE_STORERS,
+                 queue_size=PIPELINE_QUEUE_SIZE,
+                 **kwargs):
+        UserCrawler.__init__(self, seed_list, api, store, cache, **kwargs)
+        self.fetchers = fetchers
+        self.parsers = parsers
+        self.storers = storers
+        self.queue_size = queue_size
+        self.stopping = threading.Event()
+        self.errors = []
+        # The names of the users leased but not yet stored, by which they are
+        # released if the pipeline is abandoned
+        self.in_flight = set()
+        self.in_flight_lock = threading.Lock()
+
+    def start(self):
+        parse_queue = Queue(self.queue_size)
+        store_queue = Queue(self.queue_size)
+        fetch_threads = self._start_stage(self.fetchers, self._fetch,
+                                          parse_queue)
+        parse_threads = self._start_stage(self.parsers, self._parse,
+                                          parse_queue, store_queue)
+        store_threads = self._start_stage(self.storers, self._store,
+                                          store_queue)
+        try:
+            last_reclaim = time.time()
+            while (not self.stopping.is_set() and
+                   any(thread.is_alive() for thread in fetch_threads)):
+                # Join with a timeout, so KeyboardInterrupt gets through
+                fetch_threads[0].join(PIPELINE_IDLE_WAIT)
+                self._flush_writes_if_due()
+                if time.time() - last_reclaim > RECLAIM_INTERVAL:
+                    self.frontier.reclaim_expired()
+                    last_reclaim = time.time()
+        except KeyboardInterrupt, k:
+            self.stopping.set()
+            self.errors.append(k)
+        try:
+            # Let the users already fetched drain through the later stages
+            self._join(fetch_threads)
+            self._finish_stage(parse_threads, parse_queue)
+            self._finish_stage(store_threads, store_queue)
+        except KeyboardInterrupt, k:
+            # Interrupted again, e.g. while a fetch waits out the rate limit
+            self.stopping.set()
+            self.errors.append(k)
+            self._release_in_flight()
+        try:
+            self.flush_writes()
+        except Exception, error:
+            self._fail(error)
+        if self.errors:
+            raise self.errors[0]
+
+    def _start_stage(self, count, target, *queues):
+        threads = []
+        for i in range(count):
+            thread = threading.Thread(target=target, args=queues)
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+        return threads
+
+    def _finish_stage(self, threads, queue):
+        for thread in threads:
+            # Put with a timeout, so KeyboardInterrupt gets through
+            while True:
+                try:
+                    queue.put(_DONE, timeout=PIPELINE_IDLE_WAIT)
+                    break
+                except Full:
+                    pass
+        self._join(threads)
+
+    def _join(self, threads):
+        """Wait for threads to finish, with a timeout so KeyboardInterrupt gets
+        through."""
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(PIPELINE_IDLE_WAIT)
+
+    def _add_in_flight(self, username):
+        with self.in_flight_lock:
+            self.in_flight.add(username)
+
+    def _remove_in_flight(self, username):
+        with self.in_flight_lock:
+            self.in_flight.discard(username)
+
+    def _release_in_flight(self):
+        """Re-queue the users still in the pipeline, which its threads are
+        left to finish with."""
+        with self.in_flight_lock:
+            in_flight = list(self.in_flight)
+            self.in_flight.clear()
+        for username in in_flight:
+            self.frontier.release(username)
+
+    def _flush_writes_if_due(self):
+        try:
+            self.flush_writes_if_due()
+        except Exception, error:
+            # The users written have been re-queued by the writer
+            self._fail(error)
+
+    def _fail(self, error, leased_as=None):
+        """Stop fetching users after an error, re-queuing the failed user, by
+        the name it was leased as."""
+        print "Pipeline stage failed:", error
+        self.errors.append(error)
+        self.stopping.set()
+        if leased_as is not None:
+            self._remove_in_flight(leased_as)
+            self.frontier.release(leased_as)
+
+    def _fetch(self, out_queue):
+        while not self.stopping.is_set():
+            try:
+                with self.metrics.timed("crawler.pop"):
+                    username = self.pop_from_todo()
+            except Exception, error:
+                self._fail(error)
+                return
+            if username is None:
+                # Users still in the pipeline, or leased by other crawlers, may
+                # lead to more users being queued
+                if not self.frontier.has_leases():
+                    return
+                sleep(PIPELINE_IDLE_WAIT)
+                continue
+            self._add_in_flight(username)
+            try:
+                user = self.fetch_user(username)
+            except Exception, error:
+                self._fail(error, username)
+                return
+            if user is None:
+                self._remove_in_flight(username)
+            else:
+                out_queue.put((username, user))
+
+    def _parse(self, in_queue, out_queue):
+        while True:
+            popped = in_queue.get()
+            if popped is _DONE:
+                return
+            username, user = popped
+            try:
+                self.enqueue_user_connections(user)
+            except Exception, error:
+                self._fail(error, username)
+                continue
+            out_queue.put(popped)
+
+    def _store(self, in_queue):
+        while True:
+            popped = in_queue.get()
+            if popped is _DONE:
+                return
+            username, user = popped
+            try:
+                self.store_user(user, username)
+            except Exception, error:
+                # store_user() has already re-queued the user
+                self._fail(error)
+            self._remove_in_flight(username)
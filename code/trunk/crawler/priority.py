@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+"""Policies scoring the users discovered by the crawl, for the priority
+frontier (see PriorityFrontier in frontier.py). Each time a user is discovered,
+the score the policy gives it is added to its priority, and the user with the
+highest priority is crawled next."""
+
+import math
+from collections import OrderedDict
+
+from settings import CONNS
+
+
+class DiscoveryPolicy(object):
+    """Every discovery counts the same, so the priority of a user is the number
+    of times it has been found among the connections of crawled users: its
+    degree in the part of the graph crawled so far."""
+    def get_scores(self, user_obj, connections):
+        scores = OrderedDict()
+        for each in connections:
+            scores[each] = scores.get(each, 0) + 1
+        return scores
+
+
+class DegreePolicy(DiscoveryPolicy):
+    """A discovery counts for more the more connected the user it was made
+    from is, going by the user's counts of followers, followings, etc. Users
+    linked to the hubs of the graph are crawled first, which reaches its dense
+    core sooner."""
+    def get_weight(self, user_obj):
+        degree = sum(user_obj.data.get(count, 0) or 0
+                     for count in CONNS.values())
+        return 1 + math.log(1 + degree)
+
+    def get_scores(self, user_obj, connections):
+        weight = self.get_weight(user_obj)
+        scores = DiscoveryPolicy.get_scores(self, user_obj, connections)
+        for each in scores:
+            scores[each] *= weight
+        return scores
+
+
+POLICIES = {
+    "discovery": DiscoveryPolicy,
+    "degree": DegreePolicy
+}
+
+
+def get_policy(name):
+    return POLICIES[name]()
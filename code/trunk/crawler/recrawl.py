@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+"""Refresh the users already in the store, fetching as little as possible: only
+the base data of each user, plus the metaconnections whose counts changed (or
+all of them if the user was updated), and of those only the items added since
+the last crawl where possible."""
+
+import time
+
+from mixcloud.api import MixcloudAPIException
+from mixcloud.resources import User
+from mixcloud.settings import METACONN_COUNTS
+from settings import DEBUG, STORED_TIME_FIELD, WATERMARK_FIELD
+
+
+class UserRecrawler(object):
+    """Fetch the base data of every stored user (or of those given) and compare
+    it with what is stored. Only the metaconnections whose counts differ from
+    the stored ones, or which are not stored at all, are paged through again,
+    unless the user's updated_time differs from the stored one, in which case
+    they all are; and only the fields which changed are written back, with a
+    $set, rather than the whole document. Users which no longer exist are left
+    as they are.
+
+    Metaconnections which can be fetched by time, such as listens and 
+    favorites, are only fetched since the user was last crawled, and the new
+    items are appended to the stored ones with $addToSet. If the new items 
+    don't account for the change in count, e.g. because some were removed,
+    or the count didn't change at all, the metaconnection is fetched in full
+    after all."""
+    def __init__(self, api, store, projection=None):
+        self.api = api
+        self.store = store
+        self.projection = projection
+        self.stats = {"unchanged": 0, "updated": 0, "missing": 0,
+                      "metaconns": 0}
+
+    def __str__(self):
+        return "Recrawler - " + ", ".join(key + ": " + str(value)
+                                          for key, value in self.stats.items())
+
+    def get_stored_fields(self):
+        """The fields to read of the stored users: all of them, except for the
+        items of the metaconnections, which would be large and are not needed
+        to tell what has changed. Stored metaconnections come back empty."""
+        return dict((conn, {"$slice": 0}) for conn in METACONN_COUNTS)
+
+    def iter_stored_users(self, usernames=None):
+        fields = self.get_stored_fields()
+        if usernames is None:
+            cursor = self.store.find(spec={"username": {"$exists": True}},
+                                     fields=fields,
+                                     timeout=False)
+            for stored in cursor:
+                yield stored
+            return
+        for username in usernames:
+            stored = self.store.find_one({"_id": username}, fields=fields)
+            if stored is None:
+                print "Not in the store:", username
+                continue
+            yield stored
+
+    def start(self, usernames=None):
+        for stored in self.iter_stored_users(usernames):
+            delta = self.refresh_user(stored)
+            if delta is not None:
+                print stored["_id"], sorted(delta.keys())
+
+    def refresh_user(self, stored):
+        """Bring a stored user up to date, returning the fields written, or
+        None if the user no longer exists."""
+        user = User(self.api, stored["_id"], projection=self.projection,
+                    since=stored.get(WATERMARK_FIELD))
+        try:
+            user.fetch_data()
+        except MixcloudAPIException, mce:
+            if getattr(mce, "status", None) == 404:
+                self.stats["missing"] += 1
+                return None
+            raise mce
+        changed = user.get_changed_metaconns(stored)
+        appended = self.fetch_appended_metaconns(user, stored, changed)
+        user.set_since_time(None)
+        user.populate_metaconns([conn for conn in changed 
+                                 if conn not in appended])
+        user.data = user.projection.apply(user.data)
+        self.stats["metaconns"] += len(changed)
+
+        delta = self.get_delta(user.data, stored, changed)
+        if not delta and not appended:
+            self.stats["unchanged"] += 1
+            return delta
+        delta[STORED_TIME_FIELD] = time.time()
+        delta[WATERMARK_FIELD] = user.metaconns_until
+        update = {"$set": delta}
+        if appended:
+            update["$addToSet"] = dict((conn, {"$each": items})
+                                       for conn, items in appended.items())
+        if not DEBUG:
+            self.store.update({"_id": stored["_id"]}, update, safe=True)
+        self.stats["updated"] += 1
+        delta.update(appended)
+        return delta
+
+    def fetch_appended_metaconns(self, user, stored, changed):
+        """Fetch the items added since the last crawl to those changed 
+        metaconnections which can be fetched by time, returning them by
+        metaconnection if they account for the change in its count."""
+        if user.metaconns_since is None:
+            return {}
+        appended = {}
+        for conn in changed:
+            count_field = METACONN_COUNTS.get(conn)
+            # Those whose count is unchanged were only updated, and an edit
+            # to an old item wouldn't be among the new ones
+            if (conn not in stored or count_field not in stored or 
+                stored[count_field] == user.data.get(count_field) or
+                not user.dyn_resources[conn].pages_by_time):
+                continue
+            items = list(user.iter_metaconn(conn))
+            if stored[count_field] + len(items) == user.data.get(count_field):
+                appended[conn] = items
+        return appended
+
+    def get_delta(self, data, stored, changed):
+        """Return the fields of the fresh data which differ from the stored
+        ones, taking the metaconnections fetched again as changed."""
+        delta = {}
+        for field, value in data.iteritems():
+            if field in METACONN_COUNTS:
+                if field in changed:
+                    delta[field] = value
+            elif field != "_id" and stored.get(field) != value:
+                delta[field] = value
+        return delta
@@ -9,9 +9,10 @@ import pymongo
 from redis import Redis
 from mixcloud import user
 from mixcloud.api import MixcloudAPI
+from mixcloud.cache import ResponseCache
 
-# Get the Mixcloud API
-mcapi = MixcloudAPI()
+# Get the Mixcloud API, caching responses as cloudcasts rarely change
+mcapi = MixcloudAPI(cache=ResponseCache("save-cloudcasts-responses.db"))
 
 # Connect to mixcloud db on Mongo
 mongo_conn = pymongo.Connection()
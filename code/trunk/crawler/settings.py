@@ -2,8 +2,8 @@
 """Crawler settings, using Redis as in-memory cache and MongoDB as storage by 
 default"""
 
-from redis import Redis
-import pymongo
+from connections import lazy_connection, lazy_database, lazy_collection
+from jsonconfig import MongoConfig, RedisConfig
 
 DEBUG = False
 
@@ -21,13 +21,17 @@ MONGO_PASSWORD = None
 MONGO_SLAVE_OK = False #whether or not  
 MONGO_TIMEOUT = None #network timeout for the connection in seconds
 
-MONGO_CONNECTION = pymongo.Connection(host=MONGO_HOST,
-                                      port=MONGO_PORT,
-                                      slave_okay=MONGO_SLAVE_OK,
-                                      network_timeout=MONGO_TIMEOUT)
+MONGO_CONFIG = MongoConfig(host=MONGO_HOST,
+                           port=MONGO_PORT,
+                           slave_okay=MONGO_SLAVE_OK,
+                           network_timeout=MONGO_TIMEOUT,
+                           dbname=MONGO_DBNAME,
+                           collection=MONGO_COLLECTION_NAME)
 
-MONGO_DB = MONGO_CONNECTION[MONGO_DBNAME]
-MONGO_COLLECTION = MONGO_DB[MONGO_COLLECTION_NAME]
+# Only connected to when first used, see connections.py
+MONGO_CONNECTION = lazy_connection(MONGO_CONFIG)
+MONGO_DB = lazy_database(MONGO_CONFIG)
+MONGO_COLLECTION = lazy_collection(MONGO_CONFIG)
 
 ################################################################################
 ### Redis-specific settings ####################################################
@@ -38,18 +42,66 @@ REDIS_PORT = 6379
 REDIS_DB = 0
 REDIS_PASSWORD = None
 
-REDIS_CONNECTION = Redis(host=REDIS_HOST,
-                         port=REDIS_PORT,
-                         db=REDIS_DB,
-                         password=REDIS_PASSWORD)
+REDIS_CONFIG = RedisConfig(host=REDIS_HOST,
+                           port=REDIS_PORT,
+                           db=REDIS_DB,
+                           password=REDIS_PASSWORD)
+
+REDIS_CONNECTION = lazy_connection(REDIS_CONFIG)
 
 CACHE = REDIS_CONNECTION
 
 # Prep cache keys for user queue (to-do list) and user set (done list)
 CACHE_KEY_PREFIX = "mc:crawl3:"
 USER_QUEUE = CACHE_KEY_PREFIX + "userq"
+USER_PRIORITY_QUEUE = CACHE_KEY_PREFIX + "userpq"
 USER_TODO = CACHE_KEY_PREFIX + "usertodo"
 USER_SET = CACHE_KEY_PREFIX + "userset"
+USER_LEASES = CACHE_KEY_PREFIX + "userleases"
+USER_SEEN = CACHE_KEY_PREFIX + "userseen"
+USER_DONE_COUNT = CACHE_KEY_PREFIX + "userdonecount"
+USER_SYNC_CHECKPOINT = CACHE_KEY_PREFIX + "usersynced"
+
+# Field in which the time a user was stored is recorded
+STORED_TIME_FIELD = "stored_time"
+# Field in which the time up to which a user's metaconnections were fetched is
+# recorded, so that only the items added since then are fetched on a re-crawl
+WATERMARK_FIELD = "crawled_until"
+# The done set is synced with the users stored since the last sync, going back
+# this many more seconds to allow for the clocks of several crawlers differing
+SYNC_CHECKPOINT_MARGIN = 10 * 60
+
+# Seconds a crawler may hold a user before it's given to another crawler
+LEASE_TIME = 30 * 60
+# Seconds between checks for expired leases, and waits for leased users to be 
+# done when there is nothing left to pop
+RECLAIM_INTERVAL = 60
+# Seconds a crawler waits for more users to be queued by others
+WORKER_IDLE_WAIT = 5
+
+# Threads per stage of the pipelined crawler, see pipeline.py
+PIPELINE_FETCHERS = 8
+PIPELINE_PARSERS = 1
+PIPELINE_STORERS = 2
+PIPELINE_QUEUE_SIZE = 16 # max users waiting between two stages
+PIPELINE_IDLE_WAIT = 1 # in seconds
+
+# Users are written to the store in bulk once this many are buffered, or the
+# first of them has been waiting for this many seconds, when buffering writes
+WRITE_BUFFER_SIZE = 100
+WRITE_BUFFER_INTERVAL = 5
+
+# SQLite file in which to keep the frontier, if it is kept locally
+FRONTIER_FILE = "frontier.db"
+
+# Max number of users checked and queued in one round trip to the cache
+FRONTIER_BATCH_SIZE = 1000
+
+# Number of users the Bloom filter of seen users is sized for, and the
+# proportion of unseen users it takes as seen (which are then checked in the
+# store). 50 million users at 0.1% take about 90MB in the cache.
+BLOOM_CAPACITY = 50 * 1000 * 1000
+BLOOM_ERROR_RATE = 0.001
 
 
 _CONN_TYPES = ["cloudcast", "follower", "following", "favorite", "listen"]
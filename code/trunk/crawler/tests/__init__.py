@@ -0,0 +1,9 @@
+"""Unit tests of the crawler, which can all be run from this directory, with
+lib on the path like the crawler itself:
+
+    PYTHONPATH=../lib python -m unittest discover -t . -s tests -p "*_test.py"
+
+The tests of the Redis frontiers are skipped unless a Redis server is running
+on localhost. They keep their keys in database 15, under a prefix of their
+own, and delete them after each test.
+"""
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+"""Behavioural tests of the in-process frontiers and store in backends.py."""
+
+import os
+import tempfile
+import unittest
+
+from backends import MemoryFrontier, SqliteFrontier, MemoryStore, matches
+from tests.frontier_test import FrontierTests
+
+
+class MemoryFrontierTest(FrontierTests, unittest.TestCase):
+    def make_frontier(self, batch_size=1000, lease_time=60):
+        return MemoryFrontier(batch_size, lease_time)
+
+
+class SqliteFrontierTest(FrontierTests, unittest.TestCase):
+    def make_frontier(self, batch_size=1000, lease_time=60):
+        return SqliteFrontier(":memory:", batch_size, lease_time)
+
+    def test_persists(self):
+        handle, filename = tempfile.mkstemp(suffix=".db")
+        os.close(handle)
+        try:
+            frontier = SqliteFrontier(filename)
+            frontier.add_many(["a", "b"])
+            frontier.pop()
+            frontier.close()
+            frontier = SqliteFrontier(filename, lease_time=-1)
+            self.assertFalse(frontier.add("a"))
+            self.assertEqual(frontier.count_todo(), 1)
+            frontier.close()
+        finally:
+            os.remove(filename)
+
+
+class MatchesTest(unittest.TestCase):
+    def test_equality(self):
+        self.assertTrue(matches({"_id": "a", "n": 1}, {"n": 1}))
+        self.assertFalse(matches({"_id": "a", "n": 1}, {"n": 2}))
+        self.assertFalse(matches({"_id": "a"}, {"n": 1}))
+
+    def test_operators(self):
+        document = {"username": "a", "n": 5}
+        self.assertTrue(matches(document, {"username": {"$exists": True}}))
+        self.assertFalse(matches(document, {"n": {"$exists": False}}))
+        self.assertTrue(matches(document, {"username": {"$in": ["a", "b"]}}))
+        self.assertTrue(matches(document, {"n": {"$gt": 4, "$lte": 5}}))
+        self.assertFalse(matches(document, {"n": {"$lt": 5}}))
+        self.assertFalse(matches(document, {"missing": {"$gte": 0}}))
+
+    def test_unsupported_operator(self):
+        self.assertRaises(ValueError, matches, {"n": 1}, {"n": {"$ne": 2}})
+
+
+class MemoryStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.store = MemoryStore()
+        self.store.save({"_id": "a", "username": "a", "stored": 1,
+                         "listens": ["x"]})
+        self.store.save({"_id": "b", "username": "b", "stored": 2})
+
+    def test_find(self):
+        found = self.store.find(spec={"stored": {"$gt": 1}})
+        self.assertEqual([each["_id"] for each in found], ["b"])
+        self.assertEqual(self.store.find_one({"_id": "a"})["stored"], 1)
+        self.assertEqual(self.store.find_one({"_id": "c"}), None)
+        self.assertEqual(self.store.count(), 2)
+
+    def test_copies(self):
+        document = {"_id": "c", "listens": []}
+        self.store.save(document)
+        document["listens"].append("x")
+        found = self.store.find_one({"_id": "c"})
+        self.assertEqual(found["listens"], [])
+        found["listens"].append("y")
+        self.assertEqual(self.store.find_one({"_id": "c"})["listens"], [])
+
+    def test_save_replaces(self):
+        self.store.save({"_id": "a", "username": "a"})
+        self.assertEqual(self.store.count(), 2)
+        self.assertFalse("stored" in self.store.find_one({"_id": "a"}))
+
+    def test_update(self):
+        self.store.update({"_id": "a"},
+                          {"$set": {"stored": 3},
+                           "$addToSet": {"listens": {"$each": ["x", "y"]},
+                                         "favorites": {"$each": ["z"]}}})
+        updated = self.store.find_one({"_id": "a"})
+        self.assertEqual(updated["stored"], 3)
+        self.assertEqual(updated["listens"], ["x", "y"])
+        self.assertEqual(updated["favorites"], ["z"])
+
+    def test_update_missing(self):
+        self.store.update({"_id": "c"}, {"$set": {"stored": 3}})
+        self.assertEqual(self.store.count(), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+"""Behavioural tests of the Bloom filter frontier in frontier.py."""
+
+import unittest
+
+from backends import MemoryStore
+from frontier import BloomFrontier
+from tests.frontier_test import REDIS, KEYS, RedisTestCase
+
+
+@unittest.skipIf(REDIS is None, "no Redis server on localhost")
+class BloomFrontierTest(RedisTestCase):
+    def setUp(self):
+        self.store = MemoryStore()
+        self.frontier = BloomFrontier(REDIS, self.store, KEYS["queue"],
+                                      KEYS["todo"], KEYS["done"],
+                                      KEYS["leases"], KEYS["seen"],
+                                      KEYS["done_count"], capacity=1000,
+                                      error_rate=0.01)
+
+    def test_add_skips_seen(self):
+        self.assertEqual(self.frontier.add_many(["a", "b", "a"]), 2)
+        self.assertEqual(self.frontier.add_many(["a", "b", "c"]), 1)
+        self.assertEqual(self.frontier.false_positives, 0)
+
+    def test_leased_not_added_again(self):
+        self.frontier.add("a")
+        self.frontier.pop()
+        self.assertFalse(self.frontier.add("a"))
+
+    def test_store_has_final_say(self):
+        self.frontier.add_many(["a", "b"])
+        for _ in range(2):
+            self.frontier.ack(self.frontier.pop())
+        self.store.save({"_id": "a", "username": "a"})
+        # Both are in the filter, but only a is stored, so b is taken for a
+        # false positive and queued again
+        self.assertEqual(self.frontier.add_many(["a", "b"]), 1)
+        self.assertEqual(self.frontier.false_positives, 1)
+        self.assertEqual(self.frontier.pop(), "b")
+        self.assertEqual(self.frontier.count_done(), 1)
+
+    def test_release(self):
+        self.frontier.add("a")
+        self.assertTrue(self.frontier.release(self.frontier.pop()))
+        self.assertEqual(self.frontier.pop(), "a")
+
+    def test_dropped_not_added_again(self):
+        self.frontier.add("a")
+        self.frontier.drop(self.frontier.pop())
+        self.assertFalse(self.frontier.add("a"))
+        self.assertEqual(self.frontier.false_positives, 0)
+        self.assertFalse(self.frontier.has_leases())
+
+    def test_done_counted(self):
+        self.frontier.add_many(["a", "b"])
+        self.frontier.ack_many([self.frontier.pop(), self.frontier.pop()])
+        self.assertEqual(REDIS.get(KEYS["done_count"]), "2")
+
+    def test_sync_with_store(self):
+        self.store.save({"_id": "a", "username": "a"})
+        self.frontier.sync_with_store()
+        self.assertEqual(self.frontier.add_many(["a", "b"]), 1)
+        self.assertEqual(REDIS.get(KEYS["done_count"]), "1")
+
+
+if __name__ == "__main__":
+    unittest.main()
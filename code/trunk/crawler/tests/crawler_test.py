@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+"""Tests of the crawler's command line options in crawler.py."""
+
+import unittest
+
+from crawler import get_parser, check_options
+
+
+class CheckOptionsTest(unittest.TestCase):
+    def check(self, *args):
+        """Return the errors the options given on the command line raise."""
+        parser = get_parser()
+        options, rest = parser.parse_args(list(args))
+        errors = []
+        parser.error = errors.append
+        check_options(parser, options)
+        return errors
+
+    def test_defaults(self):
+        self.assertEqual(self.check(), [])
+
+    def test_memory_store_needs_memory_frontier(self):
+        self.assertEqual(len(self.check("--store", "memory")), 1)
+        self.assertEqual(len(self.check("--store", "memory",
+                                        "--frontier", "sqlite")), 1)
+        self.assertEqual(self.check("--store", "memory",
+                                    "--frontier", "memory"), [])
+
+    def test_memory_store_one_worker(self):
+        self.assertNotEqual(self.check("--store", "memory",
+                                       "--frontier", "memory", "-w", "2"), [])
+
+    def test_memory_store_recrawl(self):
+        self.assertNotEqual(self.check("--store", "memory",
+                                       "--frontier", "memory", "--recrawl"),
+                            [])
+
+
+if __name__ == "__main__":
+    unittest.main()
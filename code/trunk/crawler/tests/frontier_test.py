@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+"""Behavioural tests of the Redis frontier in frontier.py. FrontierTests holds
+the behaviour every frontier shares, and is run against the others too."""
+
+import os
+import unittest
+
+from frontier import RedisFrontier
+
+try:
+    from redis import Redis
+    REDIS = Redis(db=15)
+    REDIS.ping()
+except Exception:
+    REDIS = None
+
+PREFIX = "test:frontier:%d:" % os.getpid()
+KEYS = dict((name, PREFIX + name) for name in ["queue", "todo", "done",
+                                               "leases", "seen", "checkpoint",
+                                               "done_count"])
+
+
+class FrontierTests(object):
+    """Mixed into a TestCase whose make_frontier() takes the batch size and
+    lease time."""
+    def test_add_skips_queued_and_duplicates(self):
+        frontier = self.make_frontier()
+        self.assertEqual(frontier.add_many(["a", "b", "a"]), 2)
+        self.assertEqual(frontier.add_many(["b", "c"]), 1)
+        self.assertFalse(frontier.add("a"))
+        self.assertEqual(frontier.count_todo(), 3)
+
+    def test_add_in_batches(self):
+        frontier = self.make_frontier(batch_size=2)
+        self.assertEqual(frontier.add_many(["a", "b", "c", "d", "e"]), 5)
+        self.assertEqual(frontier.count_todo(), 5)
+
+    def test_pop_in_order_added(self):
+        frontier = self.make_frontier()
+        frontier.add_many(["a", "b", "c"])
+        self.assertEqual([frontier.pop() for i in range(3)], ["a", "b", "c"])
+        self.assertEqual(frontier.pop(), None)
+        self.assertEqual(frontier.count_todo(), 0)
+
+    def test_pop_keeps_structures_consistent(self):
+        frontier = self.make_frontier()
+        frontier.add_many(["a", "b"])
+        frontier.pop()
+        self.assertTrue(frontier.is_consistent())
+        self.assertFalse(frontier.add("b"))
+
+    def test_leased_not_added_again(self):
+        frontier = self.make_frontier()
+        frontier.add("a")
+        self.assertEqual(frontier.pop(), "a")
+        self.assertTrue(frontier.has_leases())
+        self.assertFalse(frontier.add("a"))
+        self.assertEqual(frontier.add_many(["a", "b"]), 1)
+        self.assertEqual(frontier.pop(), "b")
+
+    def test_ack(self):
+        frontier = self.make_frontier()
+        frontier.add_many(["a", "b"])
+        frontier.ack(frontier.pop())
+        frontier.ack_many([frontier.pop()])
+        self.assertFalse(frontier.has_leases())
+        self.assertEqual(frontier.count_done(), 2)
+        self.assertEqual(frontier.add_many(["a", "b"]), 0)
+
+    def test_release(self):
+        frontier = self.make_frontier()
+        frontier.add_many(["a", "b"])
+        self.assertEqual(frontier.pop(), "a")
+        self.assertTrue(frontier.release("a"))
+        self.assertFalse(frontier.has_leases())
+        self.assertEqual(frontier.count_todo(), 2)
+        self.assertEqual(set([frontier.pop(), frontier.pop()]),
+                         set(["a", "b"]))
+
+    def test_drop(self):
+        frontier = self.make_frontier()
+        frontier.add("a")
+        frontier.drop(frontier.pop())
+        self.assertFalse(frontier.has_leases())
+        self.assertEqual(frontier.count_todo(), 0)
+        self.assertEqual(frontier.count_done(), 0)
+        self.assertTrue(frontier.add("a"))
+
+    def test_reclaim_expired(self):
+        frontier = self.make_frontier(lease_time=-1)
+        frontier.add_many(["a", "b"])
+        self.assertEqual(frontier.pop(), "a")
+        self.assertEqual(frontier.reclaim_expired(), 1)
+        self.assertFalse(frontier.has_leases())
+        self.assertEqual(frontier.pop(), "a")
+        self.assertEqual(frontier.pop(), "b")
+
+    def test_reclaim_keeps_live_leases(self):
+        frontier = self.make_frontier()
+        frontier.add("a")
+        frontier.pop()
+        self.assertEqual(frontier.reclaim_expired(), 0)
+        self.assertTrue(frontier.has_leases())
+        self.assertEqual(frontier.pop(), None)
+
+    def test_done_set(self):
+        frontier = self.make_frontier(batch_size=2)
+        frontier.mark_done_many(["a", "b", "c"])
+        frontier.unmark_done_many(["b"])
+        self.assertEqual(set(frontier.get_done()), set(["a", "c"]))
+        self.assertEqual(frontier.count_done(), 2)
+        self.assertEqual(frontier.add_many(["a", "b", "c"]), 1)
+
+    def test_sync_checkpoint(self):
+        frontier = self.make_frontier()
+        self.assertEqual(frontier.get_sync_checkpoint(), None)
+        frontier.set_sync_checkpoint(1234.5)
+        self.assertEqual(float(frontier.get_sync_checkpoint()), 1234.5)
+
+
+class RedisTestCase(unittest.TestCase):
+    def tearDown(self):
+        REDIS.delete(*KEYS.values())
+
+
+@unittest.skipIf(REDIS is None, "no Redis server on localhost")
+class RedisFrontierTest(FrontierTests, RedisTestCase):
+    def make_frontier(self, batch_size=1000, lease_time=60):
+        return RedisFrontier(REDIS, KEYS["queue"], KEYS["todo"], KEYS["done"],
+                             KEYS["leases"], KEYS["checkpoint"], batch_size,
+                             lease_time)
+
+    def test_repair(self):
+        frontier = self.make_frontier()
+        frontier.add("a")
+        REDIS.rpush(KEYS["queue"], "b", "c")
+        REDIS.sadd(KEYS["todo"], "d")
+        self.assertFalse(frontier.is_consistent())
+        frontier.repair()
+        self.assertTrue(frontier.is_consistent())
+        self.assertEqual(frontier.count_todo(), 4)
+
+    def take_over(self):
+        """Have a crawler lease a user which, its lease expired, is reclaimed
+        and leased by another crawler. Returns both crawlers' frontiers."""
+        slow = self.make_frontier(lease_time=-1)
+        slow.add("a")
+        slow.pop()
+        other = self.make_frontier()
+        self.assertEqual(other.reclaim_expired(), 1)
+        self.assertEqual(other.pop(), "a")
+        return slow, other
+
+    def test_stale_ack_keeps_lease(self):
+        slow, other = self.take_over()
+        slow.ack("a")
+        self.assertTrue(other.has_leases())
+        self.assertEqual(other.count_done(), 1)
+        other.ack("a")
+        self.assertFalse(other.has_leases())
+
+    def test_stale_release_keeps_lease(self):
+        slow, other = self.take_over()
+        self.assertFalse(slow.release("a"))
+        slow.drop("a")
+        self.assertTrue(other.has_leases())
+        self.assertEqual(other.count_todo(), 0)
+        self.assertTrue(other.release("a"))
+        self.assertFalse(other.has_leases())
+        self.assertEqual(other.pop(), "a")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+"""Behavioural tests of the priority frontier in frontier.py and of the
+policies scoring users for it, in priority.py."""
+
+import math
+import unittest
+
+from frontier import PriorityFrontier
+from priority import get_policy
+from tests.frontier_test import REDIS, KEYS, RedisTestCase
+
+
+class FakeUser(object):
+    def __init__(self, **data):
+        self.data = data
+
+
+class PolicyTest(unittest.TestCase):
+    def test_discovery(self):
+        scores = get_policy("discovery").get_scores(FakeUser(),
+                                                    ["a", "b", "a"])
+        self.assertEqual(dict(scores), {"a": 2, "b": 1})
+
+    def test_degree(self):
+        policy = get_policy("degree")
+        hub = FakeUser(follower_count=99, following_count=None)
+        scores = policy.get_scores(hub, ["a", "b", "a"])
+        weight = 1 + math.log(100)
+        self.assertAlmostEqual(scores["a"], 2 * weight)
+        self.assertAlmostEqual(scores["b"], weight)
+        self.assertEqual(dict(policy.get_scores(FakeUser(), ["a"])),
+                         {"a": 1})
+
+
+@unittest.skipIf(REDIS is None, "no Redis server on localhost")
+class PriorityFrontierTest(RedisTestCase):
+    def make_frontier(self, lease_time=60):
+        return PriorityFrontier(REDIS, KEYS["queue"], KEYS["todo"],
+                                KEYS["done"], KEYS["leases"],
+                                lease_time=lease_time)
+
+    def test_pop_by_priority(self):
+        frontier = self.make_frontier()
+        self.assertEqual(frontier.add_many(["a", "b", "c"],
+                                           {"a": 1, "b": 3, "c": 2}), 3)
+        self.assertEqual([frontier.pop() for i in range(3)], ["b", "c", "a"])
+        self.assertEqual(frontier.pop(), None)
+
+    def test_scores_add_up(self):
+        frontier = self.make_frontier()
+        frontier.add_many(["a", "b"], {"a": 2, "b": 3})
+        self.assertEqual(frontier.add_many(["a", "a"]), 0)
+        self.assertEqual(frontier.count_todo(), 2)
+        self.assertEqual(frontier.pop(), "a")
+
+    def test_leased_not_added_again(self):
+        frontier = self.make_frontier()
+        frontier.add("a")
+        frontier.pop()
+        self.assertEqual(frontier.add_many(["a"], {"a": 10}), 0)
+        self.assertEqual(frontier.count_todo(), 0)
+
+    def test_release_to_front(self):
+        frontier = self.make_frontier()
+        frontier.add_many(["a", "b"], {"a": 2, "b": 1})
+        self.assertEqual(frontier.pop(), "a")
+        frontier.add_many(["b"], {"b": 5})
+        self.assertTrue(frontier.release("a"))
+        self.assertEqual(frontier.pop(), "a")
+
+    def test_reclaim_to_front(self):
+        frontier = self.make_frontier(lease_time=-1)
+        frontier.add_many(["a", "b"], {"a": 2, "b": 1})
+        frontier.pop()
+        frontier.add_many(["b"], {"b": 5})
+        self.assertEqual(frontier.reclaim_expired(), 1)
+        self.assertEqual(frontier.pop(), "a")
+
+    def test_repair(self):
+        frontier = self.make_frontier()
+        frontier.add("a")
+        REDIS.sadd(KEYS["todo"], "b")
+        self.assertFalse(frontier.is_consistent())
+        frontier.repair()
+        self.assertTrue(frontier.is_consistent())
+        self.assertEqual(frontier.count_todo(), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
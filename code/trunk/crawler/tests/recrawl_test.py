@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+"""Behavioural tests of the re-crawl mode in recrawl.py, refreshing users first
+crawled from the local stand-in for the API after changing what it serves."""
+
+import time
+import unittest
+
+from mixcloud.tests.fake_api import (FakeAPIServer, INTERACTION_METACONNS,
+                                     TIME_FORMAT)
+from backends import MemoryStore
+from recrawl import UserRecrawler
+from settings import STORED_TIME_FIELD, WATERMARK_FIELD
+from tests.usercrawler_test import (CrawlerTestCase, CaseInsensitiveAPIServer,
+                                    make_user, set_counts)
+
+
+def make_listen(slug, created):
+    """A listen, as served, created 'created' seconds from now."""
+    return {"user": "other", "cloudcast_slug": slug,
+            "created_time": time.strftime(TIME_FORMAT,
+                                          time.gmtime(time.time() + created))}
+
+
+class TimedAPIServer(CaseInsensitiveAPIServer):
+    """Serves the listens and favorites with their creation times, so they can
+    be fetched since a given time."""
+    def get_items(self, user, conn):
+        items = FakeAPIServer.get_items(self, user, conn)
+        if conn in INTERACTION_METACONNS:
+            for item, served in zip(items, user.get(conn) or []):
+                item["created_time"] = served["created_time"]
+        return items
+
+
+class RecrawlTestCase(CrawlerTestCase):
+    """Crawls the users served into a store before each test."""
+    def setUp(self):
+        CrawlerTestCase.setUp(self)
+        self.store = MemoryStore()
+        self.make_crawler(["amirhhz"], store=self.store).start()
+        self.recrawler = UserRecrawler(self.api, self.store)
+
+    def refresh(self, username):
+        stored, = self.recrawler.iter_stored_users([username])
+        return self.recrawler.refresh_user(stored)
+
+
+class UserRecrawlerTest(RecrawlTestCase):
+    def test_unchanged(self):
+        before = self.store.find_one({"_id": "amirhhz"})
+        self.assertEqual(self.refresh("amirhhz"), {})
+        self.assertEqual(self.recrawler.stats["unchanged"], 1)
+        self.assertEqual(self.store.find_one({"_id": "amirhhz"}), before)
+
+    def test_changed_count(self):
+        served = self.server.users["amirhhz"]
+        served["followers"].append("new")
+        served["name"] = "Amir"
+        set_counts(served)
+        delta = self.refresh("amirhhz")
+        self.assertEqual(sorted(delta),
+                         sorted(["follower_count", "followers", "name",
+                                 STORED_TIME_FIELD, WATERMARK_FIELD]))
+        stored = self.store.find_one({"_id": "amirhhz"})
+        self.assertEqual(stored["followers"], ["new"])
+        self.assertEqual(stored["follower_count"], 1)
+        self.assertEqual(stored["following"], ["other"])
+        self.assertEqual(stored["name"], "Amir")
+        self.assertEqual(self.recrawler.stats["updated"], 1)
+
+    def test_updated_time(self):
+        self.server.users["amirhhz"]["updated_time"] = "2012-01-01T00:00:00Z"
+        self.refresh("amirhhz")
+        self.server.users["amirhhz"]["updated_time"] = "2012-02-01T00:00:00Z"
+        delta = self.refresh("amirhhz")
+        # An edit needn't change any count, so every metaconnection is fetched
+        for conn in ["cloudcasts", "favorites", "followers", "following",
+                     "listens"]:
+            self.assertTrue(conn in delta)
+
+    def test_missing(self):
+        del self.server.users["amirhhz"]
+        self.assertEqual(self.refresh("amirhhz"), None)
+        self.assertEqual(self.recrawler.stats["missing"], 1)
+        self.assertEqual(self.store.find_one({"_id": "amirhhz"})["following"],
+                         ["other"])
+
+
+class AppendedMetaconnsTest(RecrawlTestCase):
+    users = {"amirhhz": make_user("amirhhz", following=["other"],
+                                  listens=[make_listen("old-mix", -3600)]),
+             "other": make_user("other", followers=["amirhhz"])}
+    server_class = TimedAPIServer
+
+    def test_appended(self):
+        served = self.server.users["amirhhz"]
+        served["listens"].append(make_listen("new-mix", 3600))
+        set_counts(served)
+        delta = self.refresh("amirhhz")
+        self.assertEqual(delta["listens"],
+                         [{"user": "other", "cloudcast_slug": "new-mix"}])
+        stored = self.store.find_one({"_id": "amirhhz"})
+        self.assertEqual([item["cloudcast_slug"] for item in stored["listens"]],
+                         ["old-mix", "new-mix"])
+        self.assertEqual(stored["listen_count"], 2)
+        self.assertEqual(stored["following"], ["other"])
+
+    def test_removed_fetches_all(self):
+        served = self.server.users["amirhhz"]
+        served["listens"] = [make_listen("new-mix", 3600),
+                             make_listen("newer-mix", 3600)]
+        set_counts(served)
+        self.refresh("amirhhz")
+        # The new items don't account for the change in count, so the stored
+        # ones are replaced by all of those served
+        stored = self.store.find_one({"_id": "amirhhz"})
+        self.assertEqual([item["cloudcast_slug"] for item in stored["listens"]],
+                         ["new-mix", "newer-mix"])
+
+
+if __name__ == "__main__":
+    unittest.main()
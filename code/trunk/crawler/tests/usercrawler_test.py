@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+"""Behavioural tests of the crawler in usercrawler.py and pipeline.py, crawling
+users served by a local stand-in for the API (see mixcloud/tests/fake_api.py)
+into the in-process frontier and store in backends.py."""
+
+import copy
+import thread
+import threading
+import time
+import unittest
+
+from mixcloud.api import MixcloudAPI
+from mixcloud.metrics import Metrics
+from mixcloud.projection import Projection
+from mixcloud.settings import METACONN_COUNTS
+from mixcloud.throttle import unlimited
+from mixcloud.tests.fake_api import FakeAPIServer
+from backends import MemoryFrontier, MemoryStore
+from pipeline import PipelinedUserCrawler
+from settings import STORED_TIME_FIELD, SYNC_CHECKPOINT_MARGIN
+from usercrawler import UserCrawler
+
+
+def make_user(username, following=(), followers=(), listens=()):
+    user = {"username": username, "key": "/%s/" % username,
+            "name": username.capitalize(), "type": "user",
+            "following": list(following), "followers": list(followers),
+            "listens": list(listens), "favorites": [], "cloudcasts": []}
+    set_counts(user)
+    return user
+
+
+def set_counts(user):
+    """Set the counts in a served user's base data to those of its items."""
+    for conn, count_field in METACONN_COUNTS.iteritems():
+        if conn in user:
+            user[count_field] = len(user[conn])
+
+
+class CaseInsensitiveAPIServer(FakeAPIServer):
+    """Finds users whatever the case of their name, as the API does, and
+    serves them under their own username."""
+    def get_user(self, username):
+        return FakeAPIServer.get_user(self, username.lower())
+
+
+class FailingStore(MemoryStore):
+    def save(self, document, safe=False):
+        raise IOError("store is down")
+
+
+class CrawlerTestCase(unittest.TestCase):
+    """Serves a copy of 'users', by username, for the duration of each test,
+    which the test can change as server.users."""
+    users = {"amirhhz": make_user("amirhhz", following=["other"]),
+             "other": make_user("other", followers=["amirhhz"])}
+    server_class = CaseInsensitiveAPIServer
+
+    def setUp(self):
+        self.server = self.server_class(copy.deepcopy(self.users),
+                                        port=0).start()
+        self.api = MixcloudAPI(api_root=self.server.root, limiter=unlimited(),
+                               metrics=Metrics())
+
+    def tearDown(self):
+        self.api.close_connections()
+        self.server.stop()
+
+    def make_crawler(self, seeds, store=None, frontier=None,
+                     crawler_class=UserCrawler, **kwargs):
+        return crawler_class(seeds, self.api, store or MemoryStore(), None,
+                             frontier=frontier or MemoryFrontier(),
+                             metrics=Metrics(), **kwargs)
+
+
+class LeasedNameTest(CrawlerTestCase):
+    """The seeds are in another case than the usernames the API returns, so the
+    users must be acked or released by the name they were leased as."""
+    def assert_crawled(self, crawler):
+        crawler.start()
+        self.assertFalse(crawler.frontier.has_leases())
+        self.assertTrue("Amirhhz" in crawler.frontier.get_done())
+        self.assertEqual(sorted(crawler.store.documents),
+                         ["amirhhz", "other"])
+
+    def test_acked_as_leased(self):
+        self.assert_crawled(self.make_crawler(["Amirhhz"]))
+
+    def test_buffered_acked_as_leased(self):
+        self.assert_crawled(self.make_crawler(["Amirhhz"], buffered=True))
+
+    def test_pipelined_acked_as_leased(self):
+        self.assert_crawled(self.make_crawler(
+            ["Amirhhz"], crawler_class=PipelinedUserCrawler))
+
+    def test_released_as_leased(self):
+        crawler = self.make_crawler(["Amirhhz"], store=FailingStore())
+        self.assertRaises(IOError, crawler.start)
+        self.assertFalse(crawler.frontier.has_leases())
+        self.assertTrue("Amirhhz" in crawler.frontier.todo)
+
+
+class StuckFetchCrawler(PipelinedUserCrawler):
+    """Fetches users as if waiting out the rate limit, until 'unstuck' is
+    set."""
+    def __init__(self, *args, **kwargs):
+        PipelinedUserCrawler.__init__(self, *args, **kwargs)
+        self.unstuck = threading.Event()
+
+    def fetch_user(self, username):
+        # Bounded, so the test fails rather than hangs if the interrupts don't
+        # get through
+        self.unstuck.wait(10)
+        return make_user(username)
+
+
+class InterruptTest(unittest.TestCase):
+    def test_second_interrupt_releases(self):
+        frontier = MemoryFrontier()
+        crawler = StuckFetchCrawler(["amirhhz"], None, MemoryStore(), None,
+                                    frontier=frontier, metrics=Metrics(),
+                                    fetchers=1)
+        timers = [threading.Timer(delay, thread.interrupt_main)
+                  for delay in (0.5, 1.5)]
+        for timer in timers:
+            timer.start()
+        try:
+            started = time.time()
+            self.assertRaises(KeyboardInterrupt, crawler.start)
+            # Without waiting for the fetch to come unstuck
+            self.assertTrue(time.time() - started < 5)
+            self.assertFalse(frontier.has_leases())
+            self.assertTrue("amirhhz" in frontier.todo)
+        finally:
+            crawler.unstuck.set()
+            for timer in timers:
+                timer.cancel()
+
+
+class PartialProjectionTest(CrawlerTestCase):
+    def test_identity_fields_kept(self):
+        crawler = self.make_crawler(["amirhhz"],
+                                    projection=Projection(fields=["name"]))
+        crawler.start()
+        stored = crawler.store.find_one({"_id": "amirhhz"})
+        self.assertEqual(stored["username"], "amirhhz")
+        self.assertEqual(stored["following"], ["other"])
+        self.assertFalse("type" in stored)
+
+
+class SyncTest(unittest.TestCase):
+    """Syncing the done set with the store, in full or since the checkpoint."""
+    def setUp(self):
+        self.store = MemoryStore()
+        self.store_user("a", 100)
+        self.store_user("b", 200)
+        self.frontier = MemoryFrontier()
+        self.crawler = UserCrawler(None, None, self.store, None, sync=False,
+                                   frontier=self.frontier, metrics=Metrics())
+
+    def store_user(self, username, stored_time):
+        self.store.save({"_id": username, "username": username,
+                         STORED_TIME_FIELD: stored_time})
+
+    def test_full_without_checkpoint(self):
+        self.frontier.mark_done_many(["a", "gone"])
+        self.crawler.sync_cache_with_store()
+        self.assertEqual(self.frontier.get_done(), set(["a", "b"]))
+        self.assertEqual(self.frontier.get_sync_checkpoint(), 200)
+
+    def test_checkpoint_advances(self):
+        self.crawler.sync_cache_with_store()
+        checkpoint = 200 + 2 * SYNC_CHECKPOINT_MARGIN
+        self.frontier.set_sync_checkpoint(checkpoint)
+        # Stored just before the checkpoint, within the margin, and after it
+        self.store_user("c", checkpoint - SYNC_CHECKPOINT_MARGIN / 2)
+        self.store_user("d", checkpoint + 1)
+        # Marked as done, but only stored before the checkpoint
+        self.frontier.unmark_done_many(["a"])
+        self.crawler.sync_cache_with_store()
+        self.assertEqual(self.frontier.get_done(), set(["b", "c", "d"]))
+        self.assertEqual(self.frontier.get_sync_checkpoint(), checkpoint + 1)
+        # Nothing new since, so the checkpoint stays where it is
+        self.crawler.sync_cache_with_store()
+        self.assertEqual(self.frontier.get_sync_checkpoint(), checkpoint + 1)
+
+    def test_full_when_more_done_than_stored(self):
+        self.crawler.sync_cache_with_store()
+        self.frontier.mark_done_many(["gone", "lost"])
+        self.crawler.sync_cache_with_store()
+        self.assertEqual(self.frontier.get_done(), set(["a", "b"]))
+        self.assertEqual(self.frontier.get_sync_checkpoint(), 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
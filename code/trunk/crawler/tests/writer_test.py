@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+"""Behavioural tests of the buffered writer in writer.py, writing to the
+in-process store and frontier in backends.py."""
+
+import unittest
+
+from mixcloud.metrics import Metrics
+from backends import MemoryFrontier, MemoryStore
+from writer import BufferedWriter
+
+
+class BulkOperation(object):
+    """Like pymongo's unordered bulk operation, for upserts by _id only."""
+    def __init__(self, store):
+        self.store = store
+        self.documents = []
+
+    def find(self, spec):
+        return self
+
+    def upsert(self):
+        return self
+
+    def replace_one(self, document):
+        self.documents.append(document)
+
+    def execute(self, write_concern=None):
+        self.store.executed += 1
+        self.store.write_concerns.append(write_concern)
+        for document in self.documents:
+            self.store.save(document)
+
+
+class BulkStore(MemoryStore):
+    def __init__(self):
+        MemoryStore.__init__(self)
+        self.executed = 0
+        self.write_concerns = []
+
+    def initialize_unordered_bulk_op(self):
+        return BulkOperation(self)
+
+
+class FailingBulkStore(BulkStore):
+    def save(self, document, safe=False):
+        raise IOError("store is down")
+
+
+class LegacyStore(MemoryStore):
+    """Like an older pymongo collection, which takes any unknown attribute to
+    be a sub-collection."""
+    def __getattr__(self, name):
+        return MemoryStore()
+
+
+class BufferedWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.frontier = MemoryFrontier()
+        self.frontier.add_many(["a", "b", "c"])
+
+    def make_writer(self, store, size=3):
+        return BufferedWriter(store, self.frontier, size=size, interval=60,
+                              metrics=Metrics())
+
+    def add_popped(self, writer):
+        """Pop each user off the frontier and buffer its document."""
+        while True:
+            username = self.frontier.pop()
+            if username is None:
+                return
+            writer.add(username, {"_id": username, "username": username})
+
+    def test_bulk_acks_batch(self):
+        store = BulkStore()
+        writer = self.make_writer(store)
+        self.frontier.pop()
+        writer.add("a", {"_id": "a"})
+        # Not due yet, so a is still leased and not stored
+        self.assertEqual(store.count(), 0)
+        self.assertTrue(self.frontier.has_leases())
+        self.add_popped(writer)
+        self.assertEqual(store.executed, 1)
+        self.assertEqual(store.write_concerns, [{"w": 1}])
+        self.assertEqual(sorted(store.documents), ["a", "b", "c"])
+        self.assertEqual(self.frontier.get_done(), set(["a", "b", "c"]))
+        self.assertFalse(self.frontier.has_leases())
+        self.assertEqual(writer.buffer, [])
+
+    def test_without_bulk(self):
+        store = MemoryStore()
+        writer = self.make_writer(store, size=10)
+        self.add_popped(writer)
+        self.assertEqual(store.count(), 0)
+        self.assertEqual(writer.flush(), 3)
+        self.assertEqual(store.count(), 3)
+        self.assertEqual(self.frontier.count_done(), 3)
+        self.assertEqual(writer.flush(), 0)
+
+    def test_without_bulk_api(self):
+        store = LegacyStore()
+        writer = self.make_writer(store)
+        self.add_popped(writer)
+        self.assertEqual(store.count(), 3)
+        self.assertEqual(self.frontier.count_done(), 3)
+
+    def test_failed_flush_releases_batch(self):
+        store = FailingBulkStore()
+        writer = self.make_writer(store, size=10)
+        self.add_popped(writer)
+        self.assertRaises(IOError, writer.flush)
+        self.assertEqual(store.executed, 1)
+        self.assertFalse(self.frontier.has_leases())
+        self.assertEqual(self.frontier.count_done(), 0)
+        self.assertEqual(sorted(self.frontier.todo), ["a", "b", "c"])
+        self.assertEqual(writer.buffer, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+"""The crawler itself, which walks the social graph of Mixcloud users from a list
+of seeds, see crawler.py for running it."""
+
+from mixcloud.api import MixcloudAPIException
+from mixcloud.metrics import METRICS
+from mixcloud.resources import User
+from settings import USER_QUEUE, USER_TODO, USER_SET, USER_LEASES, USER_SEEN
+from settings import USER_DONE_COUNT
+from settings import RECLAIM_INTERVAL, WORKER_IDLE_WAIT
+from settings import USER_SYNC_CHECKPOINT, SYNC_CHECKPOINT_MARGIN
+from settings import STORED_TIME_FIELD, WATERMARK_FIELD
+from settings import DEBUG
+from frontier import RedisFrontier, BloomFrontier, PriorityFrontier
+from writer import BufferedWriter
+from time import sleep
+import time
+
+
+class UserCrawler:
+    """Take a list of seed users, a storage object (MongoDB database) and a 
+    cache object (Redis cache), ready to begin a breadth-first search, with the 
+    search queue pre-populated with the seeds. It is assumed that all seed items
+    are valid ones. An optional Projection narrows down the data fetched and
+    stored for each user.
+    Several crawlers, in as many processes or machines, can share the same 
+    frontier: users are leased while being crawled (see frontier.py). Only one
+    of them needs to sync the cache with the store and add the seeds, the 
+    others can be created with sync=False and no seeds.
+    With compact=True, the users seen so far are kept in a Bloom filter rather
+    than in the done set, to save memory on large crawls (see frontier.py).
+    Given a priority policy (see priority.py), users are crawled by priority
+    rather than in the order they were found; the to-do queue must then be a
+    different key, as it is kept in a sorted set rather than a list.
+    With buffered=True, users are written to the store in bulk (see writer.py).
+    The store and cache are normally MongoDB and Redis, but any frontier can be
+    given instead of the cache, such as the in-process ones in backends.py,
+    which also has an in-memory store.
+    The time spent in each stage, and the users crawled, are recorded in the
+    given Metrics (see mixcloud/metrics.py)."""
+    def __init__(self, seed_list, api, store, cache, 
+                 todo_queue=USER_QUEUE,
+                 todo_set=USER_TODO,
+                 done_set=USER_SET,
+                 leases=USER_LEASES,
+                 projection=None,
+                 sync=True,
+                 compact=False,
+                 seen_filter=USER_SEEN,
+                 done_count=USER_DONE_COUNT,
+                 sync_checkpoint=USER_SYNC_CHECKPOINT,
+                 priority=None,
+                 buffered=False,
+                 frontier=None,
+                 metrics=METRICS):
+        self.api = api
+        self.store = store
+        self.cache = cache
+        #These are key values (strings) to use in the cache.
+        self.todo_queue = todo_queue
+        self.todo_set = todo_set
+        self.done_set = done_set
+        self.projection = projection
+        self.priority = priority
+        self.metrics = metrics
+        if frontier is not None:
+            self.frontier = frontier
+        elif priority is not None:
+            self.frontier = PriorityFrontier(cache, todo_queue, todo_set, 
+                                             done_set, leases, 
+                                             sync_checkpoint=sync_checkpoint)
+        elif compact:
+            self.frontier = BloomFrontier(cache, store, todo_queue, todo_set,
+                                          done_set, leases, seen_filter,
+                                          done_count,
+                                          sync_checkpoint=sync_checkpoint)
+        else:
+            self.frontier = RedisFrontier(cache, todo_queue, todo_set, 
+                                          done_set, leases,
+                                          sync_checkpoint=sync_checkpoint)
+        self.writer = None
+        if buffered:
+            self.writer = BufferedWriter(store, self.frontier, 
+                                         metrics=metrics)
+        
+        if sync:
+            self.sync_cache_with_store()
+            self.check_and_fix_internals()
+        
+        if seed_list:
+            items_added = self.add_many_to_todo(seed_list)
+            print items_added, "seed users were added to the to-do list."
+        
+    def __str__(self):
+        done = self.frontier.count_done()
+        todo = self.frontier.count_todo()
+        return "Crawler - done: " + str(done) + ", todo: " + str(todo) 
+    
+    def start(self):
+        try:
+            self.crawl()
+        finally:
+            self.flush_writes()
+
+    def crawl(self):
+        last_reclaim = 0
+        while True:
+            self.flush_writes_if_due()
+            if time.time() - last_reclaim > RECLAIM_INTERVAL:
+                self.frontier.reclaim_expired()
+                last_reclaim = time.time()
+            popped = self.get_next_user()
+            if popped is None:
+                self.flush_writes()
+                # Other crawlers may still be working on users, whose 
+                # connections will be queued, or whose leases may expire
+                if not self.frontier.has_leases():
+                    break
+                sleep(WORKER_IDLE_WAIT)
+                continue
+            username, parent = popped
+            self.enqueue_user_connections(parent)
+            self.store_user(parent, username)
+
+    def get_next_user(self):
+        """Pop users off the to-do list until one can be populated and return 
+        the name it was popped as and the user, or return None once the list
+        is empty. The name is the one leased, which may differ from the user's
+        own username, e.g. in case."""
+        while True:
+            with self.metrics.timed("crawler.pop"):
+                next = self.pop_from_todo()
+            if next is None:
+                return None
+            try:
+                next_user = self.fetch_user(next)
+            except:
+                # Re-queue the user if interrupted or if the API failed, rather
+                # than leave it leased until the lease expires
+                self.frontier.release(next)
+                raise
+            if next_user is not None:
+                return next, next_user
+
+    def fetch_user(self, username):
+        """Populate a leased user from the API and return it. A missing or 
+        renamed user is dropped from the frontier, and None returned, so the
+        crawl just moves on to the next user. Any other error is raised, with
+        the user still leased."""
+        user = User(self.api, username, projection=self.projection)
+        try:
+            with self.metrics.timed("crawler.fetch"):
+                user.populate()
+        except MixcloudAPIException, mce:
+            if getattr(mce, "status", None) == 404:
+                self.metrics.incr("crawler.missing")
+                self.frontier.drop(username)
+                return None
+            raise
+        return user
+    
+    def enqueue_user_connections(self, user_obj):
+        with self.metrics.timed("crawler.enqueue"):
+            conn_list = user_obj.get_social_connections()
+            scores = None
+            if self.priority is not None:
+                scores = self.priority.get_scores(user_obj, conn_list)
+            added = self.add_many_to_todo(conn_list, scores)
+        self.metrics.incr("crawler.discovered", len(conn_list))
+        self.metrics.incr("crawler.queued", added)
+
+    def store_user(self, user_obj, leased_as):
+        """Save a user and mark it as done in the frontier, under the name it
+        was leased as."""
+        with self.metrics.timed("crawler.store"):
+            self._store_user(user_obj, leased_as)
+        self.metrics.incr("crawler.users")
+
+    def _store_user(self, user_obj, leased_as):
+        to_store = user_obj.get_user_id()
+        data = user_obj.get_data()
+        data[STORED_TIME_FIELD] = time.time()
+        data[WATERMARK_FIELD] = user_obj.metaconns_until
+        if self.writer is not None:
+            self.writer.add(leased_as, data)
+            return
+        try:
+            if not DEBUG:
+                self.store.save(data, safe=True)
+        except Exception, error:
+            print error
+            print "Could not save " + to_store + ", re-queuing it."
+            self.frontier.release(leased_as)
+            raise error
+        self.frontier.ack(leased_as)
+        print to_store
+
+    def flush_writes(self):
+        if self.writer is not None:
+            self.writer.flush()
+
+    def flush_writes_if_due(self):
+        if self.writer is not None:
+            self.writer.flush_if_due()
+
+    def add_to_todo(self, item):
+        """Only update the todo set and queue if item is not already in to-do 
+        set."""
+        return self.frontier.add(item)
+
+    def add_many_to_todo(self, items, scores=None):
+        """Add a whole list of items to the to-do set and queue in one go,
+        skipping those already to-do or done. Returns how many were added."""
+        return self.frontier.add_many(items, scores)
+    
+    def pop_from_todo(self):
+        """Take the next item off the to-do queue and set in one atomic step, 
+        returning None if there is nothing left to do."""
+        return self.frontier.pop()
+    
+    def is_todo_empty(self):
+        return self.frontier.count_todo() == 0
+    
+    def check_and_fix_internals(self):
+        """This method does a simple check to see if there is a one-to-one 
+        mapping between the to-do structures. Since the structures are only
+        ever updated atomically, this is only needed once, on start-up, to 
+        catch any damage done before that."""
+        #!!!FIX: check against DB, too!
+        if not self.frontier.is_consistent():
+            self.sync_cache_todo_structs()
+        return True
+        
+    def sync_cache_with_store(self):
+        """Make the done set match the users in the store. Only the users stored
+        since the last sync are looked at, unless there was no sync yet or the
+        done set has more users than the store, in which case all of them are
+        compared."""
+        if isinstance(self.frontier, BloomFrontier):
+            self.frontier.sync_with_store()
+            return
+        checkpoint = self.frontier.get_sync_checkpoint()
+        if (checkpoint is None or 
+            self.frontier.count_done() > self.store.count()):
+            self.full_sync_cache_with_store()
+        else:
+            self.incremental_sync_cache_with_store(float(checkpoint))
+
+    def iter_stored_users(self, spec=None):
+        """Yield the (username, time stored) pairs of the users in the store. 
+        The time is None for users stored before it was recorded."""
+        full_spec = {"username": {"$exists": True}}
+        full_spec.update(spec or {})
+        cursor = self.store.find(spec=full_spec,
+                                 fields=["username", STORED_TIME_FIELD],
+                                 timeout=False)
+        for each in cursor:
+            yield each["username"], each.get(STORED_TIME_FIELD)
+
+    def incremental_sync_cache_with_store(self, checkpoint):
+        self.store.ensure_index(STORED_TIME_FIELD)
+        spec = {STORED_TIME_FIELD: {"$gt": checkpoint - SYNC_CHECKPOINT_MARGIN}}
+        latest = checkpoint
+        batch = []
+        for username, stored_time in self.iter_stored_users(spec):
+            latest = max(latest, stored_time)
+            batch.append(username)
+            if len(batch) == self.frontier.batch_size:
+                self.frontier.mark_done_many(batch)
+                batch = []
+        self.frontier.mark_done_many(batch)
+        self.frontier.set_sync_checkpoint(latest)
+
+    def full_sync_cache_with_store(self):
+        latest = 0
+        stored_users = set()
+        for username, stored_time in self.iter_stored_users():
+            latest = max(latest, stored_time)
+            stored_users.add(username)
+        cached_done_users = self.frontier.get_done()
+        # Trust the store over the cache
+        self.frontier.mark_done_many(stored_users - cached_done_users)
+        self.frontier.unmark_done_many(cached_done_users - stored_users)
+        self.frontier.set_sync_checkpoint(latest)
+            
+    def sync_cache_todo_structs(self):
+        self.frontier.repair()
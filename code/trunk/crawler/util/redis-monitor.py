@@ -1,46 +1,168 @@
 #!/usr/bin/env python
+"""Monitor a crawl's frontier in Redis: how many users are done, to do and being
+crawled, the rates at which users are completed and discovered over a rolling
+window, and the projected time until the frontier runs dry. The keys are those
+of crawler/settings.py, under another prefix if one is given."""
 
-from redis import Redis
-from time import sleep
-from datetime import datetime
-
-# Connect to and setup redis
-cache = Redis()
-# Prep redis keys for user queue (to-do list) and user set (done list)
-rd_prefix = "mc:crawl3:"
-user_q = rd_prefix + "userq"
-user_todo = rd_prefix + "usertodo"
-user_set = rd_prefix + "userset"
-
-# uq = userq, ut = usertodo, us=userset
-curr_uq_cnt = cache.llen(user_q)
-curr_ut_cnt = cache.scard(user_todo)
-curr_us_cnt = cache.scard(user_set)
-curr_expected = curr_us_cnt+curr_ut_cnt
-prev_uq_cnt = 0
-prev_ut_cnt = 0
-prev_us_cnt = 0
-prev_expected = 0
-try:
-    while True:
-        print "-"*10, datetime.now(), "-"*20
-
-        prev_us_cnt = curr_us_cnt
-        curr_us_cnt = cache.scard(user_set)    
-        print "Set:".rjust(8), str(curr_us_cnt).rjust(8), "| delta:", curr_us_cnt-prev_us_cnt
-
-        prev_ut_cnt = curr_ut_cnt
-        curr_ut_cnt = cache.scard(user_todo) 
-        print "Todo:".rjust(8), str(curr_ut_cnt).rjust(8), "| delta:", curr_ut_cnt-prev_ut_cnt
-
-        prev_uq_cnt = curr_uq_cnt
-        curr_uq_cnt = cache.llen(user_q)
-        print "Queued:".rjust(8), str(curr_uq_cnt).rjust(8), "| delta:", curr_uq_cnt-prev_uq_cnt
-        prev_expected = curr_expected
-        curr_expected = curr_us_cnt+curr_ut_cnt
-        print "Current Expected Total:", curr_expected, "| delta:", curr_expected-prev_expected
-        print "Last save:", cache.lastsave()
-        print 
-        sleep(30)
-except KeyboardInterrupt:
-    exit()
+import os
+import sys
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+# Run from its own directory: the crawler's settings are in the parent
+# directory, and the connections they use in lib
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "..", "lib"))
+sys.path.insert(0, os.path.join(HERE, ".."))
+from connections import get_connection
+from settings import (REDIS_CONFIG, CACHE_KEY_PREFIX, USER_TODO, USER_SET,
+                      USER_LEASES, USER_DONE_COUNT)
+
+
+class CrawlMonitor(object):
+    """Samples the sizes of the frontier's sets with one pipelined round trip,
+    keeping the samples of the last 'window' seconds to work out rates from.
+
+    The to-do set mirrors the to-do queue, whether it is a list or a sorted
+    set, so it is counted instead. A user is discovered when it is first
+    queued, so the discovery rate is the rate at which the total of users done,
+    to do and leased grows. A Bloom filter frontier (crawler.py --bloom) counts
+    the users it has done rather than keeping them in the done set, so the
+    count is added to the set's size."""
+    def __init__(self, cache, prefix=CACHE_KEY_PREFIX, window=60):
+        self.cache = cache
+        self.prefix = prefix
+        self.todo_set = prefix + USER_TODO[len(CACHE_KEY_PREFIX):]
+        self.done_set = prefix + USER_SET[len(CACHE_KEY_PREFIX):]
+        self.done_count = prefix + USER_DONE_COUNT[len(CACHE_KEY_PREFIX):]
+        self.leases = prefix + USER_LEASES[len(CACHE_KEY_PREFIX):]
+        self.window = window
+        self.samples = deque()
+
+    def sample(self):
+        pipe = self.cache.pipeline(transaction=False)
+        pipe.scard(self.done_set)
+        pipe.get(self.done_count)
+        pipe.scard(self.todo_set)
+        pipe.zcard(self.leases)
+        done, done_count, todo, leased = pipe.execute()
+        done += int(done_count or 0)
+        now = time.time()
+        sample = {"time": now, "done": done, "todo": todo, "leased": leased,
+                  "seen": done + todo + leased}
+        self.samples.append(sample)
+        while now - self.samples[0]["time"] > self.window:
+            self.samples.popleft()
+        return sample
+
+    def get_rates(self):
+        """Return the completion and discovery rates, in users per second, over
+        the samples in the window, or None if there aren't enough samples."""
+        if len(self.samples) < 2:
+            return None
+        first, last = self.samples[0], self.samples[-1]
+        elapsed = last["time"] - first["time"]
+        if elapsed <= 0:
+            return None
+        return {"completion": (last["done"] - first["done"]) / elapsed,
+                "discovery": (last["seen"] - first["seen"]) / elapsed}
+
+    def get_eta(self, sample, rates):
+        """Seconds until the frontier runs dry at the current rates, or None if
+        it is not shrinking."""
+        shrinking = rates["completion"] - rates["discovery"]
+        if shrinking <= 0:
+            return None
+        return (sample["todo"] + sample["leased"]) / shrinking
+
+    def report(self, sample):
+        line = "%s done: %9d  todo: %9d  leased: %5d" % (
+                    datetime.now().strftime("%H:%M:%S"), sample["done"],
+                    sample["todo"], sample["leased"])
+        rates = self.get_rates()
+        if rates is not None:
+            line += "  completed/s: %7.2f  discovered/s: %7.2f" % (
+                        rates["completion"], rates["discovery"])
+            eta = self.get_eta(sample, rates)
+            if eta is None:
+                line += "  ETA: frontier growing"
+            else:
+                line += "  ETA: " + str(timedelta(seconds=int(eta)))
+        print line
+
+    def poll(self, interval):
+        """Sample every 'interval' seconds."""
+        while True:
+            self.report(self.sample())
+            time.sleep(interval)
+
+    def watch(self, interval, db=0, enable=False):
+        """Sample whenever the frontier changes, as told by Redis's keyspace
+        notifications, but at most every 'interval' seconds, and at least that
+        often while the frontier keeps changing.
+        The server's configuration is left alone unless 'enable' is set, in
+        which case notifications of set and sorted set commands are turned on
+        if they are off, and stay on. Otherwise, if they are off, this falls
+        back to polling."""
+        events = self.cache.config_get("notify-keyspace-events").values()[0]
+        if not ("K" in events and ("A" in events or
+                                   ("s" in events and "z" in events))):
+            if not enable:
+                print ("Keyspace notifications of set and sorted set commands "
+                       "are off (notify-keyspace-events is %r), polling "
+                       "instead. Use --enable-notifications to turn them on."
+                       % events)
+                self.poll(interval)
+                return
+            self.cache.config_set("notify-keyspace-events", events + "Ksz")
+            print ("Set notify-keyspace-events to %r on the server, it is not "
+                   "restored on exit." % (events + "Ksz"))
+        pubsub = self.cache.pubsub()
+        pubsub.psubscribe("__keyspace@%d__:%s*" % (db, self.prefix))
+        last = 0
+        changed = True
+        while True:
+            message = pubsub.get_message(timeout=interval)
+            if message is not None and message["type"] == "pmessage":
+                changed = True
+            if changed and time.time() - last >= interval:
+                self.report(self.sample())
+                last = time.time()
+                changed = False
+
+
+if __name__ == "__main__":
+    from optparse import OptionParser
+
+    parser = OptionParser()
+    parser.add_option("-p", "--prefix", dest="prefix",
+                      default=CACHE_KEY_PREFIX,
+                      help="Prefix of the crawl's keys in Redis, by default "
+                      "that of the crawler's settings")
+    parser.add_option("-i", "--interval", dest="interval", type="float",
+                      default=1.0, help="Seconds between samples")
+    parser.add_option("-w", "--window", dest="window", type="float",
+                      default=60.0,
+                      help="Seconds over which rates are worked out")
+    parser.add_option("-n", "--notifications", action="store_true",
+                      dest="notifications", default=False,
+                      help="Only sample when the frontier changes, using "
+                      "keyspace notifications, or poll if they are off")
+    parser.add_option("--enable-notifications", action="store_true",
+                      dest="enable_notifications", default=False,
+                      help="With -n, turn the keyspace notifications on in the "
+                      "server's configuration if they are off. This changes "
+                      "notify-keyspace-events for every client, and for good")
+    options, args = parser.parse_args()
+
+    monitor = CrawlMonitor(get_connection(REDIS_CONFIG), options.prefix,
+                           options.window)
+    try:
+        if options.notifications:
+            monitor.watch(options.interval, REDIS_CONFIG.get("db") or 0,
+                          options.enable_notifications)
+        else:
+            monitor.poll(options.interval)
+    except KeyboardInterrupt:
+        exit()
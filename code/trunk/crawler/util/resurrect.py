@@ -1,6 +1,6 @@
 #!/usr/bin/env python
-from mixcloud import User, MixcloudAPI, MixcloudAPIException
-from resurrect_settings import MONGO_DB, UNTIL_TIME
+from mixcloud import User, MixcloudAPI, MixcloudAPIException, ResponseCache
+from resurrect_settings import MONGO_DB, UNTIL_TIME, RESPONSE_CACHE_FILE
 
 class Resurrection:
     """This class handles the problem of missing users in the dataset. It is 
@@ -9,7 +9,8 @@ class Resurrection:
     point in time are obtained."""
     def __init__(self, until=UNTIL_TIME):
         self.until = until 
-        self.api = MixcloudAPI()
+        # Resurrection runs are repeated over the same users, so keep responses
+        self.api = MixcloudAPI(cache=ResponseCache(RESPONSE_CACHE_FILE))
         # set a new whitelist without social connections which I am rebuilding
         # from the rest of the dataset
         self.api.set_metaconns_whitelist("cloudcasts", "favorites", "listens")
@@ -1,9 +1,11 @@
 #!/usr/bin/env python
 """Settings used by the resurrect script to fill in the gaps for the dead users 
 in MongoDB."""
-import pymongo
 import time
 
+from connections import lazy_connection, lazy_database, lazy_collection
+from jsonconfig import MongoConfig
+
 ###############################################################################
 ### MongoDB-specific settings ##################################################
 ################################################################################
@@ -18,13 +20,20 @@ MONGO_PASSWORD = None
 MONGO_SLAVE_OK = False #whether or not  
 MONGO_TIMEOUT = None #network timeout for the connection in seconds
 
-MONGO_CONNECTION = pymongo.Connection(host=MONGO_HOST,
-                                      port=MONGO_PORT,
-                                      slave_okay=MONGO_SLAVE_OK,
-                                      network_timeout=MONGO_TIMEOUT)
+MONGO_CONFIG = MongoConfig(host=MONGO_HOST,
+                           port=MONGO_PORT,
+                           slave_okay=MONGO_SLAVE_OK,
+                           network_timeout=MONGO_TIMEOUT,
+                           dbname=MONGO_DBNAME,
+                           collection=MONGO_COLLECTION_NAME)
+
+# Only connected to when first used, see connections.py
+MONGO_CONNECTION = lazy_connection(MONGO_CONFIG)
+MONGO_DB = lazy_database(MONGO_CONFIG)
+MONGO_COLLECTION = lazy_collection(MONGO_CONFIG)
 
-MONGO_DB = MONGO_CONNECTION[MONGO_DBNAME]
-MONGO_COLLECTION = MONGO_DB[MONGO_COLLECTION_NAME]
+### File in which API responses are cached between runs
+RESPONSE_CACHE_FILE = "resurrect-responses.db"
 
 ### UNTIL TIME - get information up to this point 
 UNTIL_YEAR = 2010
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+"""Buffered writing of crawled users to the store, in bulk."""
+
+import threading
+import time
+
+from mixcloud.metrics import METRICS
+from settings import DEBUG, WRITE_BUFFER_SIZE, WRITE_BUFFER_INTERVAL
+
+
+class BufferedWriter(object):
+    """Collects the users to store and writes them in one bulk upsert once
+    'size' of them are buffered, or the oldest has been waiting for 'interval'
+    seconds, so the crawl doesn't wait on the store for every user.
+
+    Users are only marked as done in the frontier once the bulk write they are
+    in has been acknowledged. If it fails, they are all queued again and the
+    error is raised. Until then they stay leased, so flushing well within the
+    lease time is enough for no user to be lost if the crawler dies."""
+    def __init__(self, store, frontier, size=WRITE_BUFFER_SIZE,
+                 interval=WRITE_BUFFER_INTERVAL, metrics=METRICS):
+        self.store = store
+        self.frontier = frontier
+        self.metrics = metrics
+        self.size = size
+        self.interval = interval
+        self.buffer = []
+        self.oldest = None
+        self.lock = threading.Lock()
+        # Looked up on the class: older pymongo collections take any unknown
+        # attribute of an instance to be a sub-collection
+        self.bulk = callable(getattr(type(store),
+                                     "initialize_unordered_bulk_op", None))
+
+    def add(self, user_id, document):
+        """Buffer a user's document, writing the buffer out if it is due. The
+        user is acked or released by user_id, which must be the name it was
+        leased as."""
+        with self.lock:
+            if not self.buffer:
+                self.oldest = time.time()
+            self.buffer.append((user_id, document))
+        self.flush_if_due()
+
+    def is_due(self):
+        return bool(self.buffer) and (len(self.buffer) >= self.size or
+                                      time.time() - self.oldest >= self.interval)
+
+    def flush_if_due(self):
+        if self.is_due():
+            self.flush()
+
+    def flush(self):
+        """Write all the buffered users to the store and mark them as done.
+        Returns how many were written."""
+        with self.lock:
+            batch, self.buffer = self.buffer, []
+        if not batch:
+            return 0
+        user_ids = [user_id for user_id, document in batch]
+        try:
+            if not DEBUG:
+                with self.metrics.timed("crawler.flush"):
+                    self.write([document for user_id, document in batch])
+        except Exception, error:
+            print error
+            print "Could not save", len(batch), "users, re-queuing them."
+            for user_id in user_ids:
+                self.frontier.release(user_id)
+            raise error
+        self.frontier.ack_many(user_ids)
+        for user_id in user_ids:
+            print user_id
+        return len(batch)
+
+    def write(self, documents):
+        """Upsert the documents, by _id, in one acknowledged bulk operation, or
+        one save at a time with a version of pymongo which can't do that."""
+        if not self.bulk:
+            # Degraded mode: a round trip per user, as without the buffer
+            for document in documents:
+                self.store.save(document, safe=True)
+            return
+        bulk = self.store.initialize_unordered_bulk_op()
+        for document in documents:
+            bulk.find({"_id": document["_id"]}).upsert().replace_one(document)
+        # The legacy Connection doesn't acknowledge writes by default, and the
+        # users are marked as done once this returns
+        bulk.execute({"w": 1})
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+"""A registry of the connections to MongoDB and Redis, opened lazily and shared
+by all the modules of a process which connect to the same server, so that 
+importing settings (e.g. to run a script with --help) doesn't connect to 
+anything, and a script using several settings modules only connects once."""
+
+import threading
+
+_connections = {}
+_lock = threading.Lock()
+
+
+def get_connection(config):
+    """Return the connection described by a jsonconfig.MongoConfig or 
+    RedisConfig, opening it if it hasn't been opened yet in this process. 
+    Both pymongo and redis pool the underlying sockets, so a connection can be
+    shared by threads."""
+    key = config.get_key()
+    with _lock:
+        if key not in _connections:
+            _connections[key] = config.connect()
+        return _connections[key]
+
+
+def forget_connections():
+    """Drop the connections opened so far, so that they are opened again on
+    next use. A forked process must call this before connecting, so as not to
+    share the sockets of its parent."""
+    with _lock:
+        _connections.clear()
+
+
+class Lazy(object):
+    """Stands in for the object factory() returns, which is only created when
+    one of its attributes or items is first used, or it is tested for truth,
+    measured or iterated over. The object isn't kept, but looked up in the
+    registry on each use, so that after forget_connections() the proxy moves
+    on to a new connection."""
+    def __init__(self, factory):
+        self._factory = factory
+
+    def _resolve(self):
+        return self._factory()
+
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
+
+    def __getitem__(self, name):
+        return self._resolve()[name]
+
+    # Special methods are looked up on the class, not through __getattr__
+    def __nonzero__(self):
+        return bool(self._resolve())
+
+    def __len__(self):
+        return len(self._resolve())
+
+    def __iter__(self):
+        return iter(self._resolve())
+
+
+def lazy_connection(config):
+    return Lazy(lambda: get_connection(config))
+
+
+def lazy_database(config):
+    """The database named in a MongoConfig, connected to on first use."""
+    return Lazy(lambda: get_connection(config)[config.get("dbname")])
+
+
+def lazy_collection(config):
+    """The collection named in a MongoConfig, connected to on first use."""
+    return Lazy(lambda: get_connection(config)[config.get("dbname")]
+                                              [config.get("collection")])
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+"""Simple wrapper to read and write configuration files."""
+import json
+
+class JSONConfig(object):
+    def __init__(self, filename=None):
+        if filename:
+            self.read_conf(filename)
+    
+    def read_conf(self, filename):
+        with open(filename, "r") as conf:
+            self._data = json.load(conf)
+    
+    def write_conf(self, filename):
+        with open(filename, "w") as conf:
+            json.dump(self._data, conf, indent=2)
+
+
+class ConnectionConfig(JSONConfig):
+    """Settings for a connection to a server, given as keyword arguments and
+    overridden by those in the file, if any. The connection itself is only
+    opened by the connect() method of the subclass for each kind of server."""
+    def __init__(self, filename=None, **settings):
+        self._data = settings
+        JSONConfig.__init__(self)
+        if filename:
+            overrides = JSONConfig(filename)._data
+            self._data = dict(settings, **overrides)
+
+    def get(self, name, default=None):
+        return self._data.get(name, default)
+
+    def get_key(self):
+        """A key identifying the server and options of the connection, so that
+        it can be shared by every module connecting the same way. By default,
+        every setting counts."""
+        return (self.__class__.__name__,) + tuple(sorted(self._data.items()))
+
+
+class MongoConfig(ConnectionConfig):
+    """host, port, slave_okay, network_timeout, plus the dbname and collection
+    used by default."""
+    def __init__(self, filename=None, **settings):
+        ConnectionConfig.__init__(self, filename, **settings)
+
+    def get_key(self):
+        return ("mongo", self.get("host", "localhost"), self.get("port", 27017),
+                self.get("slave_okay", False), self.get("network_timeout"))
+
+    def connect(self):
+        import pymongo
+        return pymongo.Connection(host=self.get("host", "localhost"),
+                                  port=self.get("port", 27017),
+                                  slave_okay=self.get("slave_okay", False),
+                                  network_timeout=self.get("network_timeout"))
+        
+
+class RedisConfig(ConnectionConfig):
+    """host, port, db and password."""
+    def __init__(self, filename=None, **settings):
+        ConnectionConfig.__init__(self, filename, **settings)
+
+    def get_key(self):
+        return ("redis", self.get("host", "localhost"), self.get("port", 6379),
+                self.get("db", 0), self.get("password"))
+
+    def connect(self):
+        from redis import Redis
+        return Redis(host=self.get("host", "localhost"),
+                     port=self.get("port", 6379),
+                     db=self.get("db", 0),
+                     password=self.get("password"))
+
+
+class ScrubberConfig(JSONConfig):
+    def __init__(self, filename=None):
+        JSONConfig.__init__(self, filename)
+        
+
+class RecommenderConfig(JSONConfig):
+    def __init__(self, filename=None):
+        JSONConfig.__init__(self, filename)
+        
+
+class StatsConfig(JSONConfig):
+    def __init__(self, filename=None):
+        JSONConfig.__init__(self, filename)
+
+
+class CrawlerConfig(JSONConfig):
+    def __init__(self, filename=None):
+        JSONConfig.__init__(self, filename)
@@ -1,2 +1,4 @@
 from api import MixcloudAPI, MixcloudAPIException, MixcloudAPIRateLimitException
-from resources import User, Cloudcast, MixcloudResourceException
\ No newline at end of file
+from resources import User, Cloudcast, MixcloudResourceException
+from cache import ResponseCache
+from projection import Projection, FULL_PROJECTION, ANALYTICS_PROJECTION
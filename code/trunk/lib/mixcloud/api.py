@@ -1,15 +1,23 @@
 #!/usr/bin/env python
 
-from collections import deque
+from math import ceil
 from time import sleep
+from Queue import Queue, Empty
+import threading
+import time
 from urllib import urlencode
 from httplib import HTTPException
 import httplib2
-import json
 import socks
 
-from settings import (METACONNS, RESPECT_TIME, DEFAULT_API, DEBUG, PROXIES,
-                      DEFAULT_METACONNS_WHITELIST, DEFAULT_METACONNS_BLACKLIST)
+from settings import (METACONNS, DEFAULT_API, DEBUG, PROXIES,
+                      DEFAULT_METACONNS_WHITELIST, DEFAULT_METACONNS_BLACKLIST,
+                      CONCURRENT_REQUESTS, DEFAULT_RETRY_AFTER)
+from throttle import RateLimiter
+from decoders import get_decoder
+from pool import ConnectionPool
+from scheduler import ProxyScheduler
+from metrics import METRICS, get_resource_type
 
 class MixcloudAPIException(HTTPException):
     def __init__(self, uri, status_code, *args):
@@ -34,34 +42,55 @@ class MixcloudAPI():
     """This handles connections to api.mixcloud.com, optionally via proxies.
     
 This class can be an initialised with a list, containing dictionaries (or 
-'None's) providing the parameters to pass on to httplib2.ProxyInfo()."""
-    def __init__(self, list_of_proxies=None):
+'None's) providing the parameters to pass on to httplib2.ProxyInfo().
 
+Requests may be issued from several threads at once (see request_many()): each
+request is sent through the route (proxy) picked by the scheduler, using a
+connection from a pool which keeps persistent connections per route, once the
+rate limiter, which keeps a token bucket per route, lets it through.
+
+Optionally, a ResponseCache (see cache.py) can be given to keep responses on 
+disk, so that they are only requested again once stale, and then conditionally.
+Responses are decoded with the fastest JSON decoder installed, unless another
+Decoder is given (see decoders.py).
+
+Requests are counted and timed, by resource type, in the process's Metrics 
+unless others are given (see metrics.py).
+
+Requests go to api.mixcloud.com unless another root URI is given, e.g. that of
+a local stand-in for the API (see tests/fake_api.py). A RateLimiter other than
+the default one can be given too, e.g. throttle.unlimited() for benchmarks.
+"""
+    def __init__(self, list_of_proxies=None, cache=None, decoder=None,
+                 metrics=METRICS, api_root=DEFAULT_API, limiter=None):
+
+        self.proxies = []
         if list_of_proxies:
-            self.proxies = deque()
             for prx_values in list_of_proxies:
                 if prx_values:
                     self.proxies.append(httplib2.ProxyInfo(**prx_values))
                     print "Added proxy:", prx_values
                 else:
                     self.proxies.append(None)
-            self.current_proxy = self.proxies[0]
-        else:
-            self.proxies = []
-            self.current_proxy = None
 
-        self.connection = None
-        self.open_connection()
+        self.pool = ConnectionPool()
+        self.limiter = limiter or RateLimiter()
+        self.scheduler = ProxyScheduler(self.proxies, self.limiter)
+        # Enough concurrent requests to keep every route busy
+        self.workers = CONCURRENT_REQUESTS * len(self.scheduler.routes)
+        self.cache = cache
+        self.decoder = decoder or get_decoder()
+        self.metrics = metrics
+        self.api_root = api_root.rstrip("/")
         self.metaconns_whitelist = DEFAULT_METACONNS_WHITELIST
         self.metaconns_blacklist = DEFAULT_METACONNS_BLACKLIST
         
         
             
-    @classmethod        
-    def get_uri(cls, resource_key, params):
-        path = cls.get_path(resource_key)
-        path = cls.add_params(path, params)
-        return DEFAULT_API + path
+    def get_uri(self, resource_key, params):
+        path = self.get_path(resource_key)
+        path = self.add_params(path, params)
+        return self.api_root + path
     
     @classmethod        
     def get_path(cls, resource_key):
@@ -78,22 +107,9 @@ This class can be an initialised with a list, containing dictionaries (or
         enc_params = urlencode(params)
         return base + "?" + enc_params
 
-    def switch_proxy(self):
-        "Rotate through proxies, if there are any."
-        if self.proxies:
-            self.proxies.rotate()
-            self.current_proxy = self.proxies[0]
-            print "INFO: API blocking: switched proxy..."
-            if self.current_proxy:
-                print str(self.current_proxy.astuple())
-
-    def open_connection(self):
-        """Open a httplib2 connection which is persistent under HTTP/1.1."""
-        self.connection = httplib2.Http(proxy_info=self.current_proxy)
-        
-    def reset_connection(self):
-        del self.connection
-        self.open_connection()
+    def close_connections(self):
+        """Close all the idle persistent connections in the pool."""
+        self.pool.close_all()
 
     def get_from_API(self, obj):
         """First get the base path of the object from its resource key and
@@ -104,55 +120,202 @@ This class can be an initialised with a list, containing dictionaries (or
         return self.request(uri)
 
     def get_from_API_paged(self, obj):
-        uri = self.get_uri(obj.resource_key, obj.resource_params)
+        """Fetch every page of a paged resource and return all their items in 
+        one list. See iter_pages()."""
         # Accumulate data over pages in a book
         book = []
-        page = self.request(uri)
-        try:
-            book.extend(page["data"])
-            while ( ("paging" in page.keys()) and
-                    ("next" in page["paging"].keys()) ):
-                uri = page["paging"]["next"]
-                page = self.request(uri)
-                book.extend(page["data"])                
-        except KeyError:
-            print "KeyError in get_from_API_paged() on:"
-            print uri
+        for data in self.iter_pages(obj):
+            book.extend(data)
         # Return uncurated data book, with all the junk
         return book
 
-    def request(self, uri, respect=RESPECT_TIME):
+    def iter_pages(self, obj, window=None):
+        """Yield the items of a paged resource one page at a time. If the number
+        of items is known in advance and the resource is paged by offset, the 
+        pages are fetched concurrently, 'window' pages at a time, otherwise the
+        "next" links are followed one page at a time. Rate limits are waited
+        out page by page, so that no page already fetched is fetched again."""
+        window = window or self.workers
+        uris = self.get_page_uris(obj)
+        if not uris:
+            uri = self.get_uri(obj.resource_key, obj.resource_params)
+            for data in self.iter_linked_pages(uri):
+                yield data
+            return
+        for start in range(0, len(uris), window):
+            batch = uris[start:start+window]
+            pages = self.request_many(batch, window, patient=True)
+            for uri, page in zip(batch, pages):
+                try:
+                    yield page["data"]
+                except KeyError:
+                    print "KeyError in iter_pages() on: " + uri
+                    return
+        # The expected count may be out of date, so pick up any remaining items
+        # by following links from the last page
+        if "paging" in page and "next" in page["paging"]:
+            for data in self.iter_linked_pages(page["paging"]["next"]):
+                yield data
+
+    def get_page_uris(self, obj):
+        """Return the URIs of all the pages of a resource, worked out from its
+        expected item count and page size, or None if they can't be predicted,
+        e.g. because only the items since a given time are wanted.
+        """
+        count = getattr(obj, "expected_count", None)
+        params = obj.resource_params
+        if (count is None or "offset" not in params or "limit" not in params or
+            "since" in params):
+            return None
+        uris = []
+        for offset in range(params["offset"], max(count, 1), params["limit"]):
+            page_params = dict(params)
+            page_params["offset"] = offset
+            uris.append(self.get_uri(obj.resource_key, page_params))
+        return uris
+
+    def iter_linked_pages(self, uri):
+        """Yield the data of the page at uri and of each subsequent page, found
+        by following the "next" links."""
+        while uri:
+            page = self.patiently(self.request, uri)
+            try:
+                yield page["data"]
+            except KeyError:
+                print "KeyError in iter_linked_pages() on: " + uri
+                return
+            uri = page.get("paging", {}).get("next")
+
+    def patiently(self, method, *args, **kwargs):
+        """Call one of the request methods, waiting and retrying for as long as
+        the API's rate limit is hit."""
+        while True:
+            try:
+                return method(*args, **kwargs)
+            except MixcloudAPIRateLimitException, rate_error:
+                print rate_error.message + " Waiting to retry ..."
+                # +1 to account potential clock async-ness
+                sleep(rate_error.retry+1)
+
+    def request(self, uri):
         """Request object at path from the server and return the JSON data of 
         the given resource as a Python object."""
-        sleep(respect) # just out of respect for the API server
         # While loop to force retry if blank returned
         if DEBUG:
             print uri
+        resource = get_resource_type(uri)
+        cached = None
+        headers = {}
+        if self.cache:
+            cached = self.cache.get(uri)
+            if cached and cached["fresh"]:
+                self.metrics.incr("api.cache_hits." + resource)
+                return self.decoder.decode(cached["content"])
+            headers = self.cache.get_validators(cached)
         # initialise content before loop
         content = None
-        # keep track of number of proxy switches within the function's scope
-        switching_tries = 0
         while (not content):
-            resp, content = self.connection.request(uri)
+            try:
+                proxy = self.scheduler.choose()
+            except LookupError:
+                # Every route is blocked: only wait as long as it takes for the
+                # first one to become available again
+                raise MixcloudAPIRateLimitException(
+                    uri=uri,
+                    retry=int(ceil(self.scheduler.next_available_in())))
+            connection = self.pool.checkout(proxy)
+            # Wait for the route's token bucket, out of respect for the API
+            self.metrics.observe("api.throttled", self.limiter.acquire(proxy))
+            started = time.time()
+            try:
+                resp, content = connection.request(uri, headers=headers)
+            except Exception:
+                # Don't reuse a connection left in an unknown state
+                self.pool.checkin(proxy, connection, healthy=False)
+                self.scheduler.finish(proxy, started, ok=False)
+                self.metrics.incr("api.errors." + resource)
+                raise
+            self.metrics.observe("api.latency." + resource, 
+                                 time.time() - started)
+            self.metrics.incr("api.requests." + resource)
+            self.metrics.incr("api.status." + str(resp.status))
+            self.metrics.incr("api.bytes", len(content or ""))
+            self.pool.checkin(proxy, connection)
+            self.scheduler.finish(proxy, started, 
+                                  ok=resp.status in (200, 304, 404))
+            # Unchanged since it was cached
+            if resp.status == 304 and cached:
+                self.cache.refresh(uri)
+                content = cached["content"]
+                break
             # Handle unsuccessful request:
             if resp.status != 200:
                 # Rate limit is hit when response status is 403
-                if (resp.status == 403 and
-                    (not self.proxies or switching_tries > len(self.proxies))):                    
-                    raise MixcloudAPIRateLimitException(
-                                                        uri=uri, 
-                                                        retry=int(resp["retry-after"]))
-                elif (resp.status == 403 
-                      and self.proxies and switching_tries <= len(self.proxies)):
-                    self.switch_proxy()
-                    self.reset_connection()
-                    # Reset content so while loop continues
+                if resp.status == 403:
+                    retry = max(1, int(resp.get("retry-after", 
+                                                DEFAULT_RETRY_AFTER)))
+                    self.limiter.record_block(proxy, retry)
+                    # One print per line, as requests run on several threads
+                    print ("INFO: API blocking: route blocked for %d s %s" %
+                           (retry, proxy and str(proxy.astuple()) or
+                            "(direct)"))
+                    # Reset content so while loop continues on another route
                     content = None
-                    switching_tries += 1
-                    continue                                    
+                    continue
                 raise MixcloudAPIException(uri, resp.status)
-        api_output = json.loads(content)
+            if self.cache and content:
+                self.cache.put(uri, content, 
+                               resp.get("etag"), resp.get("last-modified"))
+        self.limiter.record_success(proxy)
+        api_output = self.decoder.decode(content)
         return api_output
+
+    def request_many(self, uris, workers=None, patient=False):
+        """Request all the given URIs using a pool of worker threads and return
+        their JSON data in the same order as the URIs. The rate limiter still 
+        applies across all workers. If any request fails, the exception of the
+        first failed URI (in order) is raised once all workers finish. By 
+        default, there are CONCURRENT_REQUESTS workers per route. If patient,
+        each request waits out the API's rate limit on its own, so only the
+        requests which hit it are sent again."""
+        uris = list(uris)
+        workers = workers or self.workers
+
+        def request(uri):
+            if patient:
+                return self.patiently(self.request, uri)
+            return self.request(uri)
+
+        if workers <= 1 or len(uris) <= 1:
+            return [request(uri) for uri in uris]
+        results = [None] * len(uris)
+        errors = [None] * len(uris)
+        jobs = Queue()
+        for index, uri in enumerate(uris):
+            jobs.put((index, uri))
+
+        def work():
+            while True:
+                try:
+                    index, uri = jobs.get_nowait()
+                except Empty:
+                    return
+                try:
+                    results[index] = request(uri)
+                except Exception, error:
+                    errors[index] = error
+
+        threads = [threading.Thread(target=work) 
+                   for i in range(min(workers, len(uris)))]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for error in errors:
+            if error is not None:
+                raise error
+        return results
     
     def set_metaconns_blacklist(self, *blist):
         self.metaconns_blacklist = []
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+"""A persistent, on-disk cache of API responses, kept in an SQLite database."""
+
+import sqlite3
+import threading
+import time
+from urlparse import urlsplit, parse_qsl
+
+from settings import RESPONSE_CACHE_TTL, RESPONSE_CACHE_MAX_SIZE
+
+# Query parameters bounding a listing by time. The crawler sets until to the
+# current time and records it as crawled up to then, which a cached listing
+# would not be, so requests with either are never cached
+UNCACHED_PARAMS = ["until", "since"]
+
+
+def is_cacheable(uri):
+    """Whether the response to a URI can be cached: not if it is bounded by
+    time."""
+    query = urlsplit(uri)[3]
+    return not any(name in UNCACHED_PARAMS
+                   for name, value in parse_qsl(query, True))
+
+
+class ResponseCache(object):
+    """Stores the raw content of API responses keyed by their URI. Responses to
+    requests bounded by time (see UNCACHED_PARAMS) are neither stored nor
+    looked up.
+
+    Responses younger than 'ttl' seconds are fresh and can be used without
+    contacting the API at all. Older ones are stale, but are kept if they came
+    with an ETag or Last-Modified header so that they can be revalidated with a
+    conditional request. Once the total size of the stored content exceeds
+    'max_size' bytes, the least recently used responses are evicted."""
+    def __init__(self, filename, ttl=RESPONSE_CACHE_TTL,
+                 max_size=RESPONSE_CACHE_MAX_SIZE):
+        self.filename = filename
+        self.ttl = ttl
+        self.max_size = max_size
+        # The connection is shared by the API's worker threads, guarded by lock
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(filename, check_same_thread=False)
+        self.db.execute("""CREATE TABLE IF NOT EXISTS responses (
+                               uri TEXT PRIMARY KEY,
+                               content BLOB,
+                               etag TEXT,
+                               last_modified TEXT,
+                               stored REAL,
+                               accessed REAL,
+                               size INTEGER)""")
+        self.db.execute("""CREATE INDEX IF NOT EXISTS responses_accessed
+                           ON responses (accessed)""")
+        self.db.execute("""CREATE INDEX IF NOT EXISTS responses_stored
+                           ON responses (stored)""")
+        self.db.commit()
+        # Running total of the size of the stored content, so that it needn't
+        # be summed up on every put
+        self.size = self.db.execute("""SELECT COALESCE(SUM(size), 0)
+                                       FROM responses""").fetchone()[0]
+
+    def get(self, uri):
+        """Return a dictionary with the cached content of uri, its validators
+        and whether it is still fresh, or None if uri isn't cached."""
+        if not is_cacheable(uri):
+            return None
+        with self.lock:
+            row = self.db.execute("""SELECT content, etag, last_modified, stored
+                                     FROM responses WHERE uri = ?""",
+                                  (uri,)).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            self.db.execute("UPDATE responses SET accessed = ? WHERE uri = ?",
+                            (now, uri))
+            self.db.commit()
+        content, etag, last_modified, stored = row
+        return {"content": str(content),
+                "etag": etag,
+                "last_modified": last_modified,
+                "fresh": now - stored < self.ttl}
+
+    def get_validators(self, cached):
+        """Return the headers for a conditional request for a cached entry."""
+        headers = {}
+        if cached:
+            if cached["etag"]:
+                headers["if-none-match"] = cached["etag"]
+            if cached["last_modified"]:
+                headers["if-modified-since"] = cached["last_modified"]
+        return headers
+
+    def put(self, uri, content, etag=None, last_modified=None):
+        if not is_cacheable(uri):
+            return
+        now = time.time()
+        with self.lock:
+            row = self.db.execute("SELECT size FROM responses WHERE uri = ?",
+                                  (uri,)).fetchone()
+            if row is not None:
+                self.size -= row[0]
+            self.db.execute("""INSERT OR REPLACE INTO responses
+                               VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                            (uri, sqlite3.Binary(content), etag, last_modified,
+                             now, now, len(content)))
+            self.size += len(content)
+            self._evict()
+
+    def refresh(self, uri):
+        """Mark a stale response as fresh again, e.g. after a 304."""
+        with self.lock:
+            self.db.execute("UPDATE responses SET stored = ? WHERE uri = ?",
+                            (time.time(), uri))
+            self.db.commit()
+
+    def _evict(self):
+        """Drop expired responses which can't be revalidated, then the least
+        recently used ones until the cache is within its size limit. Must be
+        called with the lock held. Both only look at the responses to drop,
+        through the indexes on the times stored and accessed."""
+        evicted = self.db.execute("""SELECT uri, size FROM responses
+                                     WHERE stored < ? AND etag IS NULL
+                                     AND last_modified IS NULL""",
+                                  (time.time() - self.ttl,)).fetchall()
+        if self.size - sum(size for uri, size in evicted) > self.max_size:
+            evicted = set(evicted)
+            total = self.size - sum(size for uri, size in evicted)
+            cursor = self.db.execute("""SELECT uri, size FROM responses
+                                        ORDER BY accessed""")
+            for uri, size in cursor:
+                if total <= self.max_size:
+                    break
+                if (uri, size) not in evicted:
+                    evicted.add((uri, size))
+                    total -= size
+        self.db.executemany("DELETE FROM responses WHERE uri = ?",
+                            [(uri,) for uri, size in evicted])
+        self.size -= sum(size for uri, size in evicted)
+        self.db.commit()
+
+    def clear(self):
+        with self.lock:
+            self.db.execute("DELETE FROM responses")
+            self.db.commit()
+            self.size = 0
+
+    def close(self):
+        with self.lock:
+            self.db.close()
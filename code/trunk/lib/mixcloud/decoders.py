@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+"""JSON decoders for API responses. The fastest one installed is used by
+default, falling back to the standard library's json module."""
+
+
+def _import_loads(module_name, function_name):
+    """Return the decoding function of an optional module, or None if the
+    module isn't installed."""
+    try:
+        module = __import__(module_name)
+    except ImportError:
+        return None
+    return getattr(module, function_name, None)
+
+
+# Candidate decoders, fastest first, as (name, module, decoding function)
+DECODERS = [
+    ("ujson", "ujson", "loads"),
+    ("simplejson", "simplejson", "loads"),
+    ("json", "json", "loads"),
+]
+
+
+class Decoder(object):
+    """Decodes the content of API responses with the named decoder."""
+    def __init__(self, name="json"):
+        for decoder_name, module_name, function_name in DECODERS:
+            if decoder_name == name:
+                self.loads = _import_loads(module_name, function_name)
+                break
+        else:
+            raise ValueError("Unknown JSON decoder: " + str(name))
+        if self.loads is None:
+            raise ImportError("JSON decoder not installed: " + name)
+        self.name = name
+
+    def decode(self, content):
+        """Decode a response. Projections (see projection.py) cut the data
+        down afterwards, once, rather than on every response."""
+        return self.loads(content)
+
+
+def get_available_decoders():
+    return [name for name, module_name, function_name in DECODERS
+            if _import_loads(module_name, function_name)]
+
+
+def get_decoder(name=None):
+    """Return a Decoder using the named decoder, or the fastest one installed.
+    """
+    if name is None:
+        name = get_available_decoders()[0]
+    return Decoder(name)
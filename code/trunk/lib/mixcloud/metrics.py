@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+"""Counters and latency histograms of what a crawl is doing, e.g. requests per
+second, response times per resource type and time spent in each stage of the
+crawler, which can be served over HTTP or written to a file as JSON."""
+
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from contextlib import contextmanager
+from urlparse import urlparse
+
+from settings import METACONNS, METRICS_LATENCY_BUCKETS, METRICS_WRITE_INTERVAL
+
+
+def get_resource_type(uri):
+    """The type of resource at uri, for the metrics of requests to it: the
+    metaconnection for a dynamic resource, "user" or "cloudcast" otherwise."""
+    segments = [each for each in urlparse(uri).path.split("/") if each]
+    if segments and segments[-1] in METACONNS:
+        return segments[-1]
+    if len(segments) == 1:
+        return "user"
+    if len(segments) == 2:
+        return "cloudcast"
+    return "other"
+
+
+class Histogram(object):
+    """Counts of the values observed falling in each of the buckets, given by
+    their upper bounds, plus a last bucket for anything larger."""
+    def __init__(self, buckets=METRICS_LATENCY_BUCKETS):
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def get_quantile(self, quantile):
+        """The upper bound of the bucket the quantile falls in."""
+        rank = quantile * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def get_stats(self):
+        stats = {"count": self.count, "mean": 0.0, "buckets": {}}
+        if self.count:
+            stats["mean"] = self.total / self.count
+            stats["p50"] = self.get_quantile(0.5)
+            stats["p95"] = self.get_quantile(0.95)
+        for bound, count in zip(self.buckets + ["inf"], self.counts):
+            stats["buckets"]["<=" + str(bound)] = count
+        return stats
+
+
+class Metrics(object):
+    """Named counters and histograms, which may be updated by several threads.
+    Names are dotted, from the general to the particular, e.g.
+    "api.requests.followers"."""
+    def __init__(self, buckets=METRICS_LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.started = time.time()
+        self.counters = {}
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def incr(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, value):
+        with self.lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram(self.buckets)
+            self.histograms[name].observe(value)
+
+    @contextmanager
+    def timed(self, name):
+        """Observe the time the with block takes, in seconds, even if it fails.
+        """
+        started = time.time()
+        try:
+            yield
+        finally:
+            self.observe(name, time.time() - started)
+
+    def get_stats(self):
+        """Return all the metrics, with the rate per second of each counter
+        since the metrics were started."""
+        with self.lock:
+            uptime = max(time.time() - self.started, 1e-6)
+            counters = dict((name, {"total": value, "rate": value / uptime})
+                            for name, value in self.counters.iteritems())
+            histograms = dict((name, histogram.get_stats())
+                              for name, histogram in self.histograms.iteritems())
+        return {"time": time.time(), "uptime": uptime, "pid": os.getpid(),
+                "counters": counters, "histograms": histograms}
+
+    def to_json(self):
+        return json.dumps(self.get_stats(), indent=2, sort_keys=True)
+
+
+# The metrics of the process, shared by the API and the crawler by default
+METRICS = Metrics()
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = self.server.metrics.to_json()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        return
+
+
+def serve_metrics(port, metrics=METRICS, host="localhost"):
+    """Serve the metrics as JSON over HTTP, from a background thread, and
+    return the server."""
+    server = HTTPServer((host, port), MetricsHandler)
+    server.metrics = metrics
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def write_metrics(filename, metrics=METRICS, interval=METRICS_WRITE_INTERVAL):
+    """Write the metrics as JSON to a file every 'interval' seconds, from a
+    background thread. The file is replaced in one go, so it can be read at
+    any time."""
+    def write():
+        while True:
+            with open(filename + ".tmp", "w") as outfile:
+                outfile.write(metrics.to_json())
+            os.rename(filename + ".tmp", filename)
+            time.sleep(interval)
+    thread = threading.Thread(target=write)
+    thread.daemon = True
+    thread.start()
+    return thread
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+"""A pool of persistent HTTP connections to the API, kept per route (i.e. per
+proxy, or the direct connection)."""
+
+import threading
+import time
+import httplib2
+
+from settings import POOL_MAX_IDLE, POOL_IDLE_TIMEOUT, POOL_SOCKET_TIMEOUT
+from throttle import route_key
+
+
+class ConnectionPool(object):
+    """Hands out httplib2 connections for a route, reusing idle ones so that
+    their TCP connections, which httplib2 keeps alive under HTTP/1.1, stay warm
+    when switching between proxies.
+
+    A connection is only ever used by the thread which checked it out. When it
+    is checked back in it is kept for reuse, unless the request on it failed,
+    the route already has 'max_idle' idle connections, or it then stays idle
+    for longer than 'idle_timeout' seconds, in which case it is closed."""
+    def __init__(self, max_idle=POOL_MAX_IDLE, idle_timeout=POOL_IDLE_TIMEOUT,
+                 socket_timeout=POOL_SOCKET_TIMEOUT):
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self.socket_timeout = socket_timeout
+        # Idle connections per route, as (connection, time last used) pairs
+        self.idle = {}
+        self.lock = threading.Lock()
+        self.stats = {"created": 0, "reused": 0, "expired": 0, "failed": 0,
+                      "overflowed": 0}
+
+    def checkout(self, proxy):
+        """Return a connection through the given proxy (or None for a direct
+        one), reusing the most recently used idle connection if there is one.
+        """
+        key = route_key(proxy)
+        expired = []
+        connection = None
+        with self.lock:
+            idle = self.idle.get(key, [])
+            now = time.time()
+            while idle:
+                candidate, last_used = idle.pop()
+                if self.is_healthy(candidate, now - last_used):
+                    connection = candidate
+                    self.stats["reused"] += 1
+                    break
+                expired.append(candidate)
+                self.stats["expired"] += 1
+            if connection is None:
+                self.stats["created"] += 1
+        for each in expired:
+            self.close(each)
+        if connection is None:
+            connection = httplib2.Http(proxy_info=proxy,
+                                       timeout=self.socket_timeout)
+        return connection
+
+    def checkin(self, proxy, connection, healthy=True):
+        """Return a connection to the pool once a request on it is over."""
+        key = route_key(proxy)
+        with self.lock:
+            if not healthy:
+                self.stats["failed"] += 1
+            else:
+                idle = self.idle.setdefault(key, [])
+                if len(idle) < self.max_idle:
+                    idle.append((connection, time.time()))
+                    return
+                self.stats["overflowed"] += 1
+        self.close(connection)
+
+    def is_healthy(self, connection, idle_time):
+        """An idle connection is fit for reuse if it hasn't been idle for so
+        long that the server will have closed it, and its sockets haven't been
+        closed already."""
+        if idle_time > self.idle_timeout:
+            return False
+        for conn in connection.connections.values():
+            if getattr(conn, "sock", None) is None:
+                return False
+        return True
+
+    def close(self, connection):
+        for conn in connection.connections.values():
+            try:
+                conn.close()
+            except Exception:
+                pass
+        connection.connections.clear()
+
+    def close_all(self):
+        with self.lock:
+            idle, self.idle = self.idle, {}
+        for connections in idle.values():
+            for connection, last_used in connections:
+                self.close(connection)
+
+    def get_stats(self):
+        """Return the pool's counters, plus the proportion of checkouts that
+        reused a connection."""
+        with self.lock:
+            stats = dict(self.stats)
+            stats["idle"] = sum(len(each) for each in self.idle.values())
+        checkouts = stats["created"] + stats["reused"]
+        stats["reuse_rate"] = 0.0
+        if checkouts:
+            stats["reuse_rate"] = float(stats["reused"]) / checkouts
+        return stats
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+"""Projections declare which parts of a resource's data are wanted, so that the
+rest need not be fetched or stored."""
+
+from settings import METACONN_COUNTS
+
+# Fields identifying a resource, which populating it relies on, so are always
+# kept: the username is the User's _id
+IDENTITY_FIELDS = ["_id", "username", "key"]
+
+
+class Projection(object):
+    """A projection of a base resource (e.g. a User) and its dynamic resources.
+
+    'fields' lists the fields of the base data to keep, 'metaconns' the
+    metaconnections to fetch (further limited by the API's whitelist) and
+    'cloudcast_fields' the fields to keep of each cloudcast, where None means
+    all of them. Each cloudcast's full data is fetched, as the crawler has
+    always stored it, unless 'full_cloudcasts' is unset, in which case the
+    cloudcasts are taken from the listing of a user's cloudcasts, only fetching
+    the fields missing from it. The kept metaconnections and their count
+    fields are always kept, as are the IDENTITY_FIELDS."""
+    def __init__(self, fields=None, metaconns=None, cloudcast_fields=None,
+                 full_cloudcasts=True):
+        self.fields = fields
+        self.metaconns = metaconns
+        self.cloudcast_fields = cloudcast_fields
+        self.full_cloudcasts = full_cloudcasts
+
+    def keeps_metaconn(self, metaconn):
+        return self.metaconns is None or metaconn in self.metaconns
+
+    def get_base_fields(self):
+        """Return the set of fields kept of the base data, or None if all."""
+        if self.fields is None:
+            return None
+        kept = set(self.fields)
+        kept.update(IDENTITY_FIELDS)
+        for conn in (self.metaconns or METACONN_COUNTS.keys()):
+            kept.add(conn)
+            if conn in METACONN_COUNTS:
+                kept.add(METACONN_COUNTS[conn])
+        return kept
+
+    def apply(self, data):
+        """Return the base data with only the projected fields left in it."""
+        kept = self.get_base_fields()
+        if kept is None:
+            return data
+        return dict((field, value) for field, value in data.iteritems()
+                    if field in kept)
+
+    def apply_to_cloudcast(self, cloudcast):
+        if self.cloudcast_fields is None:
+            return cloudcast
+        return dict((field, value) for field, value in cloudcast.iteritems()
+                    if field in self.cloudcast_fields)
+
+
+# Everything, as the crawler has always stored it
+FULL_PROJECTION = Projection()
+
+# Just enough for the analytics (stats, mongomix and the recommender): the
+# usernames, the counts and the user/slug edges
+ANALYTICS_PROJECTION = Projection(
+                        fields=["username", "name", "type", "key",
+                                "created_time", "updated_time"],
+                        metaconns=["cloudcasts", "followers", "following",
+                                   "favorites", "listens"],
+                        cloudcast_fields=["key", "slug", "name",
+                                          "created_time"],
+                        full_cloudcasts=False)
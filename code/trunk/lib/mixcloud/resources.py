@@ -8,6 +8,8 @@ import json
 
 from settings import DEBUG
 from settings import ANNOTATION_TYPES, CATEGORIES, SEARCH_TYPES, ITEMS_PER_PAGE
+from settings import METACONN_COUNTS, CLOUDCAST_REQUIRED_FIELDS
+from projection import FULL_PROJECTION
 
 
 class MixcloudResourceException(Exception):
@@ -70,11 +72,16 @@ class BaseResource(Resource):
      
     Optionally, a Unix epoch timestamp could also be passed to the resource to
     specify the time up to which dynamic resources are returned, where this is 
-    applicable."""
-    def __init__(self, api, until=None):
+    applicable, and another one to only return those since then, e.g. since
+    the resource was last fetched.
+    
+    What is fetched and kept can be narrowed down with a Projection, see 
+    projection.py and set_projection()."""
+    def __init__(self, api, until=None, since=None):
         Resource.__init__(self, api)
         # self.resource_params = {"metadata": 1}
         self.dyn_resources = {}
+        self.projection = FULL_PROJECTION
         # For some metaconnections, we may want to specify a time with which to
         # limit the dynamic resources returned, notably favorites and cloudcasts
         # Default to the current time.
@@ -82,6 +89,7 @@ class BaseResource(Resource):
             self.metaconns_until = int(time.time())
         else:
             self.metaconns_until = int(until)
+        self.metaconns_since = since
         
     def set_until_time(self, until=time.time()):
         self.metaconns_until = int(until)
@@ -90,21 +98,79 @@ class BaseResource(Resource):
     def propogate_until_time(self):
         for conn in self.dyn_resources:
             self.dyn_resources[conn].set_until_param(self.metaconns_until)    
+
+    def set_since_time(self, since):
+        """Only fetch the dynamic resources' items since the time given, where
+        they can be fetched by time, or all of them again if since is None."""
+        self.metaconns_since = since
+        self.propogate_since_time()
+
+    def propogate_since_time(self):
+        for conn in self.dyn_resources:
+            self.dyn_resources[conn].set_since_param(self.metaconns_since)
+
+    def set_projection(self, projection):
+        self.projection = projection
+        self.propogate_projection()
+
+    def propogate_projection(self):
+        for conn in self.dyn_resources:
+            self.dyn_resources[conn].set_projection(self.projection)
+
+    def propogate_counts(self):
+        """Let the dynamic resources know how many items to expect, from the 
+        counts in the base data, so their pages can be fetched in parallel."""
+        for conn in self.dyn_resources:
+            count_field = METACONN_COUNTS.get(conn)
+            if count_field in self.data:
+                self.dyn_resources[conn].set_expected_count(
+                                                        self.data[count_field])
                
     def populate(self):
         """Run this after initialising an instance to gather all relevant 
         data."""
         self.fetch_data()
         self.populate_metaconns()
+        self.data = self.projection.apply(self.data)
 
-    def populate_metaconns(self):
-        """Fetch the relevant dynamic resources and store them. Beware of 
-        fetch_data()'s overwriting!"""
+    def populate_metaconns(self, metaconns=None):
+        """Fetch the relevant dynamic resources and store them, or only those in
+        'metaconns' if given. Beware of fetch_data()'s overwriting!"""
         self.propogate_until_time()
-        for conn in self.api.metaconns_whitelist:
-            if conn in self.dyn_resources.keys():
+        self.propogate_since_time()
+        self.propogate_counts()
+        self.propogate_projection()
+        for conn in self.get_relevant_metaconns():
+            if metaconns is None or conn in metaconns:
                 conn_data = self.get_metaconn(conn)
                 self.data[conn] = conn_data
+
+    def get_relevant_metaconns(self):
+        return [conn for conn in self.api.metaconns_whitelist
+                if conn in self.dyn_resources.keys() and
+                   self.projection.keeps_metaconn(conn)]
+
+    def is_updated_since(self, old_data):
+        """Whether the resource was updated since old_data was fetched, as told
+        by its updated_time. Old data without one can't tell, and isn't."""
+        return ("updated_time" in old_data and
+                old_data["updated_time"] != self.data.get("updated_time"))
+
+    def get_changed_metaconns(self, old_data):
+        """Return the metaconnections which need fetching again to bring 
+        old_data (e.g. as last stored) up to date with the base data: those
+        whose counts have changed, and those old_data lacks altogether, or all
+        of them if the resource was updated since, as an edit need not change
+        any count."""
+        updated = self.is_updated_since(old_data)
+        changed = []
+        for conn in self.get_relevant_metaconns():
+            count_field = METACONN_COUNTS.get(conn)
+            if (updated or conn not in old_data or 
+                (count_field is not None and
+                 old_data.get(count_field) != self.data.get(count_field))):
+                changed.append(conn)
+        return changed
         
     def get_metaconn(self, metaconn):
         """Fetch the clean (relevant) data for a particular dynamic resource 
@@ -113,6 +179,15 @@ class BaseResource(Resource):
             print "Populating", metaconn, "..."
         if metaconn in self.dyn_resources.keys():
             return self.dyn_resources[metaconn].get_clean_data()
+
+    def iter_metaconn(self, metaconn):
+        """Like get_metaconn(), but yield the clean items one at a time as they
+        are fetched instead of returning them all at once."""
+        self.propogate_until_time()
+        self.propogate_since_time()
+        self.propogate_counts()
+        self.propogate_projection()
+        return self.dyn_resources[metaconn].iter_clean_data()
                 
     def get_field(self, fieldname):
         try:
@@ -126,8 +201,8 @@ class BaseResource(Resource):
 class InteractiveResource(BaseResource):
     """The User and Cloudcast resources are this class's children, as they have
     the "comments" and "favorites" dynamic resources in common."""
-    def __init__(self, api, user, resource=None, until=None):
-        BaseResource.__init__(self, api, until)
+    def __init__(self, api, user, resource=None, until=None, since=None):
+        BaseResource.__init__(self, api, until, since)
         self.resource_key.append(user)
         if resource: 
             self.resource_key.append(resource)
@@ -171,16 +246,41 @@ class CategoryResource(BaseResource):
 ################################################################################
 
 class DynResource(Resource):
+    # Whether the items can be fetched by time, with until and since params
+    pages_by_time = True
+
     def __init__(self, api):
         Resource.__init__(self, api)
         self.resource_params = {"limit": ITEMS_PER_PAGE}
         self.paged = True
+        # Number of items the resource is known to have, if any
+        self.expected_count = None
         
     def get_clean_data(self):
         """By "clean" we mean "relevant". This will always be a list of items,
         but the items could be simply strings (e.g. usernames), a list of pairs
         ([ username, slug] ) or full dictionaries of data (cloudcast JSONs)."""
-        return self.get_data()
+        return list(self.iter_clean_data())
+
+    def iter_clean_data(self):
+        """Yield the clean items of the resource, fetching them one page at a 
+        time, so only a page of raw data is held in memory at once."""
+        for page in self.iter_pages():
+            for item in page:
+                yield self.clean_item(item)
+
+    def iter_pages(self):
+        """Yield the raw items of the resource a page at a time, from the data 
+        already fetched if there is any."""
+        if self.data:
+            yield self.data
+            return
+        for page in self.api.iter_pages(self):
+            yield page
+
+    def clean_item(self, item):
+        """Return the relevant part of a single raw item of the resource."""
+        return item
         
     def set_until_param(self, until):
         """Update dynamic resource with a date that will be used when fetching
@@ -188,28 +288,56 @@ class DynResource(Resource):
         update of the resource_params class variable with an "until" field."""
         self.resource_params.update({"until": until})
 
+    def set_since_param(self, since):
+        """Only fetch the items since the time given, or all of them if since
+        is None. The expected count, if any, is then ignored, as it covers all
+        the items."""
+        if since is None:
+            self.resource_params.pop("since", None)
+        else:
+            self.resource_params.update({"since": int(since)})
+
+    def set_projection(self, projection):
+        """Narrow down the data fetched and kept for the resource. Only some 
+        resources have anything to narrow down, so by default this is a stub.
+        """
+        return
+
+    def set_expected_count(self, count):
+        """Set the number of items the resource is expected to have, which lets
+        the API fetch all of its pages at once if it is paged by offset."""
+        self.expected_count = int(count)
+
 
 class SocialDynResource(DynResource):
     """ This is for code shared between the Followers and Following dynamic
     resource classes."""
+    pages_by_time = False
+
     def __init__(self, api):
         DynResource.__init__(self, api)
         self.resource_params.update({"offset": 0})
     
     def get_clean_data(self):
         """Returns the list of the users for the dynamic resource."""
-        self.get_data()
         clean_list = []
         try:
-            clean_list = [user["username"] for user in self.data]
+            clean_list = DynResource.get_clean_data(self)
         except KeyError:
             pass
         return clean_list
-    
+
+    def clean_item(self, item):
+        return item["username"]
+
     def set_until_param(self, until):
         """Social resources do not take until dates as parameters so this method
         is a stub."""
         return
+
+    def set_since_param(self, since):
+        """Likewise for since dates."""
+        return
     
 class SimpleInteractionDynResource(DynResource):
     """The Favorites, Cloudcasts and Listens dynamic resources inherit from
@@ -219,13 +347,9 @@ class SimpleInteractionDynResource(DynResource):
     def __init__(self, api):
         DynResource.__init__(self, api)
 
-    def get_clean_data(self):
-        self.get_data() 
-        clean_list = []
-        for item in self.data:
-            clean_list.append({"user": item["user"]["username"], 
-                               "cloudcast_slug": item["slug"]})
-        return clean_list     
+    def clean_item(self, item):
+        return {"user": item["user"]["username"], 
+                "cloudcast_slug": item["slug"]}
 
 class Followers(SocialDynResource):
     def __init__(self, api, user):
@@ -240,25 +364,74 @@ class Following(SocialDynResource):
 
 
 class Cloudcasts(SimpleInteractionDynResource):
-    def __init__(self, api, user_or_cat):
+    """By default, every cloudcast in the listing is fetched in full. The 
+    listing already holds most of each cloudcast's JSON data though, so with
+    full_detail unset (e.g. by a projection) that is used as is, and a 
+    cloudcast is only fetched individually if it is missing one of the 
+    required fields, in which case only those fields are filled in. Either
+    way, the fetches for a page of the listing are made concurrently."""
+    def __init__(self, api, user_or_cat, full_detail=True,
+                 required_fields=CLOUDCAST_REQUIRED_FIELDS):
         SimpleInteractionDynResource.__init__(self, api)
         self.resource_key = [user_or_cat, "cloudcasts"]
+        self.full_detail = full_detail
+        self.required_fields = required_fields
+        self.projection = FULL_PROJECTION
+
+    def set_projection(self, projection):
+        """Fetch full cloudcasts as the projection says, and make sure only the
+        fields it keeps are required, or fetched, for each cloudcast."""
+        self.projection = projection
+        self.full_detail = projection.full_cloudcasts
+        if projection.cloudcast_fields is not None:
+            self.required_fields = projection.cloudcast_fields
     
     def get_clean_data(self):
         """"Clean" data for the cloudcast resource should actually be a list of 
         each cloudcast's full JSON data, so here we fetch those. For user, slug
         pairs use get_clean_clean_data() on a Cloudcasts instance.""" 
-        clean_data = []
-        key_list = self.get_clean_clean_data()
-        for item in key_list:
-            cloudcast = Cloudcast(self.api, 
-                                  item["user"], 
-                                  item["cloudcast_slug"])
-            clean_data.append(cloudcast.get_data())
-        return clean_data
+        return list(self.iter_clean_data())
+
+    def iter_clean_data(self):
+        for page in self.iter_pages():
+            for item in self.complete_page(page):
+                yield self.projection.apply_to_cloudcast(item)
+
+    def complete_page(self, page):
+        """Return the page's cloudcasts with their missing data fetched."""
+        incomplete = [index for index, item in enumerate(page)
+                      if self.is_incomplete(item)]
+        if not incomplete:
+            return page
+        uris = []
+        for index in incomplete:
+            pair = SimpleInteractionDynResource.clean_item(self, page[index])
+            cloudcast = Cloudcast(self.api, pair["user"], pair["cloudcast_slug"])
+            uris.append(self.api.get_uri(cloudcast.resource_key, 
+                                         cloudcast.resource_params))
+        details = self.api.request_many(uris, patient=True)
+        completed = list(page)
+        for index, detail in zip(incomplete, details):
+            if self.full_detail:
+                completed[index] = detail
+            else:
+                item = dict(page[index])
+                for field in self.required_fields:
+                    if field not in item and field in detail:
+                        item[field] = detail[field]
+                completed[index] = item
+        return completed
+
+    def is_incomplete(self, item):
+        if self.full_detail:
+            return True
+        for field in self.required_fields:
+            if field not in item:
+                return True
+        return False
         
     def get_clean_clean_data(self):
-        return SimpleInteractionDynResource.get_clean_data(self)
+        return list(SimpleInteractionDynResource.iter_clean_data(self))
 
 
 class Favorites(SimpleInteractionDynResource, SocialDynResource):
@@ -291,6 +464,12 @@ class Favorites(SimpleInteractionDynResource, SocialDynResource):
         else:
             # Otherwise, this dyn resource is associated with a cloudcast
             return SocialDynResource.get_clean_data(self)
+
+    def clean_item(self, item):
+        if len(self.resource_key) == 2:
+            return SimpleInteractionDynResource.clean_item(self, item)
+        else:
+            return SocialDynResource.clean_item(self, item)
             
         
 class Listens(SimpleInteractionDynResource):
@@ -389,8 +568,9 @@ class UserpickCloudcasts(DynResource):
 ################################################################################
 
 class User(InteractiveResource):
-    def __init__(self, api, username, until=None):
-        InteractiveResource.__init__(self, api, username, until=until)
+    def __init__(self, api, username, until=None, projection=None, since=None):
+        InteractiveResource.__init__(self, api, username, until=until,
+                                     since=since)
         # Augment the User resource with dynamic resources further to those
         # inherited from InteractiveResource
         self.dyn_resources.update({
@@ -402,6 +582,8 @@ class User(InteractiveResource):
         })
         # for MongoDB's benefit, set _id field to username, which is unique
         self.data["_id"] = self.resource_key[0]
+        if projection:
+            self.set_projection(projection)
         
             
     def populate(self):
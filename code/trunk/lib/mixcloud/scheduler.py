@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+"""Scheduling of requests over the available routes (proxies, or the direct 
+connection) to the API."""
+
+import threading
+import time
+
+from settings import SCHEDULER_SMOOTHING, SCHEDULER_MAX_ERROR_RATE
+from throttle import route_key
+
+
+class RouteStats(object):
+    """Running statistics of the requests made through a route, as
+    exponentially weighted moving averages."""
+    def __init__(self, smoothing=SCHEDULER_SMOOTHING):
+        self.smoothing = smoothing
+        self.latency = 0.0
+        self.error_rate = 0.0
+        self.in_flight = 0
+        self.requests = 0
+
+    def update(self, latency, ok):
+        alpha = self.smoothing
+        if self.requests == 0:
+            self.latency = latency
+        else:
+            self.latency = alpha * latency + (1 - alpha) * self.latency
+        self.error_rate = alpha * (0.0 if ok else 1.0) + \
+                          (1 - alpha) * self.error_rate
+        self.requests += 1
+
+
+class ProxyScheduler(object):
+    """Picks the route each request should go through: of the routes that 
+    aren't blocked by the API, the one expected to answer soonest, given the 
+    wait for its rate limiter's next token, its recent latency, the requests
+    already in flight on it and its recent error rate. Untried routes look 
+    fastest, so each gets tried. With enough concurrent requests, all the 
+    routes are kept busy at their own pace."""
+    def __init__(self, routes, limiter):
+        self.routes = list(routes) or [None]
+        self.limiter = limiter
+        self.stats = dict((route_key(route), RouteStats())
+                          for route in self.routes)
+        self.lock = threading.Lock()
+
+    def score(self, route):
+        """Expected time, in seconds, until a request on route is answered."""
+        stats = self.stats[route_key(route)]
+        error_rate = min(stats.error_rate, SCHEDULER_MAX_ERROR_RATE)
+        return (self.limiter.bucket(route).wait_time() +
+                stats.latency * (1 + stats.in_flight) / (1 - error_rate))
+
+    def choose(self):
+        """Return the best route that isn't blocked and count a request as in
+        flight on it, or raise LookupError if all routes are blocked."""
+        with self.lock:
+            available = [route for route in self.routes 
+                         if not self.limiter.is_blocked(route)]
+            if not available:
+                raise LookupError("All routes are blocked")
+            best = min(available, key=self.score)
+            self.stats[route_key(best)].in_flight += 1
+            return best
+
+    def finish(self, route, started, ok=True):
+        """Record the outcome of a request on route, started at 'started'."""
+        with self.lock:
+            stats = self.stats[route_key(route)]
+            stats.in_flight -= 1
+            stats.update(time.time() - started, ok)
+
+    def next_available_in(self):
+        """Seconds until the first blocked route is available again."""
+        return self.limiter.next_available_in(self.routes)
+
+    def get_stats(self):
+        with self.lock:
+            return dict((key, {"latency": stats.latency,
+                               "error_rate": stats.error_rate,
+                               "in_flight": stats.in_flight,
+                               "requests": stats.requests,
+                               "cooldown": self.limiter.bucket(route).cooldown()})
+                        for route in self.routes
+                        for key, stats in [(route_key(route),
+                                            self.stats[route_key(route)])])
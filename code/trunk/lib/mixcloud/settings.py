@@ -20,6 +20,22 @@ DEFAULT_METACONNS_WHITELIST = [
                                "favorites", 
                                "listens"
                                ]
+# Fields in a base resource's data holding the item count of a metaconnection
+METACONN_COUNTS = {
+                   "cloudcasts": "cloudcast_count",
+                   "followers": "follower_count",
+                   "following": "following_count",
+                   "favorites": "favorite_count",
+                   "listens": "listen_count",
+                   "comments": "comment_count",
+                   "listeners": "listener_count"
+                   }
+
+# Fields which a cloudcast's data taken from a listing of cloudcasts must have,
+# otherwise they are fetched from the cloudcast's own resource
+CLOUDCAST_REQUIRED_FIELDS = ["key", "slug", "name", "user", "created_time", 
+                             "tags"]
+
 DEFAULT_METACONNS_BLACKLIST = [
                                "comments", 
                                "feed", 
@@ -29,6 +45,35 @@ DEFAULT_METACONNS_BLACKLIST = [
 
 RESPECT_TIME = 0.2 #in seconds
 
+# Token bucket rate limiting per route (proxy), see throttle.py. Each route 
+# starts at one request every RESPECT_TIME seconds and adapts from there.
+RATE_LIMIT_BURST = 5 # max tokens a bucket can hold
+RATE_LIMIT_MIN_RATE = 0.5 # requests per second
+RATE_LIMIT_MAX_RATE = 20.0 # requests per second
+RATE_LIMIT_INCREASE = 0.05 # rate increment after each successful request
+RATE_LIMIT_BACKOFF = 0.5 # rate multiplier when the route gets blocked
+DEFAULT_RETRY_AFTER = 60 # in seconds, if a 403 comes without retry-after
+
+# On-disk response cache, see cache.py
+RESPONSE_CACHE_TTL = 7 * 24 * 60 * 60 # in seconds, before revalidation
+RESPONSE_CACHE_MAX_SIZE = 1024 * 1024 * 1024 # in bytes
+
+# Persistent connections kept per route, see pool.py
+POOL_MAX_IDLE = 8 # idle connections kept per route
+POOL_IDLE_TIMEOUT = 60 # in seconds, before an idle connection is closed
+POOL_SOCKET_TIMEOUT = 30 # in seconds, for each request
+
+# Number of worker threads used by MixcloudAPI.request_many(), per route
+CONCURRENT_REQUESTS = 4
+
+# Route scheduling, see scheduler.py
+SCHEDULER_SMOOTHING = 0.2 # weight of the latest request in the moving averages
+SCHEDULER_MAX_ERROR_RATE = 0.9 # cap on the error rate used to rank routes
+
+# Metrics, see metrics.py
+METRICS_LATENCY_BUCKETS = [0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+METRICS_WRITE_INTERVAL = 10 # in seconds, when writing the metrics to a file
+
 CATEGORIES = [
     "business", "comedy", "culture", "drum-and-bass", "dubstep-bass",
     "education", "electronica", "funk-soul", "hip-hop", "indie", "jazz-ambient",
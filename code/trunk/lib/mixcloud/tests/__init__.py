@@ -0,0 +1,5 @@
+"""Test and benchmark scripts. Those named *_test.py are unit tests, which can
+all be run from lib with:
+
+    python -m unittest discover -t . -s mixcloud/tests -p "*_test.py"
+"""
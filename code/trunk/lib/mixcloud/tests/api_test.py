@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+"""Behavioural tests of the concurrent requests in mixcloud/api.py, with the
+requests themselves stood in for, so nothing goes over the network. Waiting out
+the rate limit is recorded rather than slept."""
+
+import threading
+import unittest
+
+from mixcloud import api
+from mixcloud.api import MixcloudAPI, MixcloudAPIRateLimitException
+from mixcloud.throttle import unlimited
+
+
+class RateLimitedAPI(MixcloudAPI):
+    """Answers each URI with its own page, counting the requests, except that
+    the URIs in 'blocked' hit the rate limit the first time they are asked
+    for."""
+    def __init__(self, blocked=()):
+        MixcloudAPI.__init__(self, limiter=unlimited())
+        self.blocked = set(blocked)
+        self.requested = {}
+        self.lock = threading.Lock()
+
+    def request(self, uri):
+        with self.lock:
+            self.requested[uri] = self.requested.get(uri, 0) + 1
+            if uri in self.blocked:
+                self.blocked.remove(uri)
+                raise MixcloudAPIRateLimitException(uri=uri, retry=0)
+        return {"data": [uri]}
+
+
+class Paged(object):
+    """A resource paged by offset, with a known number of items."""
+    resource_key = ["amirhhz", "followers"]
+    resource_params = {"offset": 0, "limit": 2}
+    expected_count = 8
+
+
+class RequestManyTest(unittest.TestCase):
+    def setUp(self):
+        self.sleeps = []
+        self.sleep = api.sleep
+        api.sleep = self.sleeps.append
+
+    def tearDown(self):
+        api.sleep = self.sleep
+
+    def test_in_order(self):
+        client = RateLimitedAPI()
+        uris = ["a", "b", "c", "d"]
+        self.assertEqual(client.request_many(uris, workers=3),
+                         [{"data": [uri]} for uri in uris])
+
+    def test_impatient_raises(self):
+        client = RateLimitedAPI(blocked=["b"])
+        self.assertRaises(MixcloudAPIRateLimitException,
+                          client.request_many, ["a", "b", "c"], 3)
+
+    def test_patient_retries_only_blocked(self):
+        client = RateLimitedAPI(blocked=["b"])
+        pages = client.request_many(["a", "b", "c"], 3, patient=True)
+        self.assertEqual(pages, [{"data": [uri]} for uri in ["a", "b", "c"]])
+        self.assertEqual(client.requested, {"a": 1, "b": 2, "c": 1})
+        self.assertEqual(self.sleeps, [1])
+
+    def test_iter_pages_retries_only_blocked(self):
+        client = RateLimitedAPI()
+        uris = client.get_page_uris(Paged())
+        client.blocked.add(uris[2])
+        pages = list(client.iter_pages(Paged(), window=4))
+        self.assertEqual(pages, [[uri] for uri in uris])
+        self.assertEqual(sorted(client.requested.values()), [1, 1, 1, 2])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+"""Behavioural tests of the response cache in mixcloud/cache.py, kept in an
+in-memory database. Time passing is simulated by moving the responses' times
+back, so nothing sleeps."""
+
+import unittest
+
+from mixcloud.cache import ResponseCache
+
+URI = "http://api.mixcloud.com/amirhhz/"
+
+
+class ResponseCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = ResponseCache(":memory:", ttl=60, max_size=10)
+
+    def tearDown(self):
+        self.cache.close()
+
+    def age(self, uri, seconds):
+        """Make a cached response seconds older, as stored and accessed."""
+        self.cache.db.execute("""UPDATE responses SET stored = stored - ?,
+                                 accessed = accessed - ? WHERE uri = ?""",
+                              (seconds, seconds, uri))
+
+    def test_fresh(self):
+        self.assertEqual(self.cache.get(URI), None)
+        self.cache.put(URI, "{}")
+        cached = self.cache.get(URI)
+        self.assertEqual(cached["content"], "{}")
+        self.assertTrue(cached["fresh"])
+
+    def test_revalidation(self):
+        self.cache.put(URI, "{}", etag='"v1"', last_modified="yesterday")
+        self.age(URI, 61)
+        cached = self.cache.get(URI)
+        self.assertFalse(cached["fresh"])
+        self.assertEqual(self.cache.get_validators(cached),
+                         {"if-none-match": '"v1"',
+                          "if-modified-since": "yesterday"})
+        # As after a 304
+        self.cache.refresh(URI)
+        self.assertTrue(self.cache.get(URI)["fresh"])
+
+    def test_expired_without_validators(self):
+        self.cache.put(URI, "{}")
+        self.cache.put(URI + "kept/", "{}", etag='"v1"')
+        self.age(URI, 61)
+        self.age(URI + "kept/", 61)
+        self.cache.put(URI + "other/", "{}")
+        self.assertEqual(self.cache.get(URI), None)
+        self.assertFalse(self.cache.get(URI + "kept/")["fresh"])
+        self.assertEqual(self.cache.size, 4)
+
+    def test_size_eviction(self):
+        self.cache.put(URI + "a/", "aaaa")
+        self.cache.put(URI + "b/", "bbbb")
+        self.age(URI + "a/", 2)
+        self.age(URI + "b/", 1)
+        # a was used last, so b is evicted first
+        self.cache.get(URI + "a/")
+        self.cache.put(URI + "c/", "cccc")
+        self.assertEqual(self.cache.get(URI + "b/"), None)
+        self.assertEqual(self.cache.get(URI + "a/")["content"], "aaaa")
+        self.assertEqual(self.cache.get(URI + "c/")["content"], "cccc")
+        self.assertEqual(self.cache.size, 8)
+
+    def test_replace_keeps_size(self):
+        self.cache.put(URI, "aaaa")
+        self.cache.put(URI, "bb")
+        self.assertEqual(self.cache.size, 2)
+
+    def test_time_bounded_not_cached(self):
+        for uri in [URI + "listens/?until=100", URI + "listens/?since=100",
+                    URI + "favorites/?limit=20&until=100"]:
+            self.cache.put(uri, "{}")
+            self.assertEqual(self.cache.get(uri), None)
+        self.assertEqual(self.cache.size, 0)
+        self.cache.put(URI + "listens/?limit=20", "{}")
+        self.assertEqual(self.cache.get(URI + "listens/?limit=20")["content"],
+                         "{}")
+
+
+if __name__ == "__main__":
+    unittest.main()
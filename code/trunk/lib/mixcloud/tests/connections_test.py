@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+"""Tests of the lazy proxies in connections.py."""
+
+import unittest
+
+from connections import Lazy
+
+
+class LazyTest(unittest.TestCase):
+    def setUp(self):
+        self.created = []
+
+    def make(self, value):
+        def factory():
+            self.created.append(value)
+            return value
+        return Lazy(factory)
+
+    def test_not_created_until_used(self):
+        lazy = self.make(["a", "b"])
+        self.assertEqual(self.created, [])
+        self.assertEqual(lazy[1], "b")
+        self.assertEqual(lazy.index("b"), 1)
+        self.assertEqual(len(self.created), 2)
+
+    def test_forwards_truth_length_and_iteration(self):
+        self.assertFalse(self.make([]))
+        self.assertTrue(self.make(["a"]))
+        self.assertEqual(len(self.make(["a", "b"])), 2)
+        self.assertEqual(list(self.make(["a", "b"])), ["a", "b"])
+
+
+if __name__ == "__main__":
+    unittest.main()
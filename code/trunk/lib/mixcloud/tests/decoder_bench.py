@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+"""Micro-benchmark of the JSON decoders available to MixcloudAPI, run on API
+payloads rebuilt from captured user data (by default the mongomix team.*.json
+files). Takes the filenames of the captured data as optional arguments."""
+
+import json
+import os
+import timeit
+
+from mixcloud.decoders import get_available_decoders, get_decoder
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            "..", "..", "mongomix")
+DEFAULT_FIXTURES = [os.path.join(FIXTURES_DIR, "team.1.json"),
+                    os.path.join(FIXTURES_DIR, "team.2.json")]
+
+REPEAT = 3
+NUMBER = 20
+
+
+def load_payloads(filenames):
+    """Return (description, content) pairs of the payloads the API
+    would have sent for the captured users: each user's base document and a
+    page of their cloudcasts."""
+    payloads = []
+    for filename in filenames:
+        with open(filename, "r") as infile:
+            users = json.load(infile)
+        for username, user in users.iteritems():
+            base = dict(user)
+            for conn in ("cloudcasts", "followers", "following", "favorites",
+                         "listens"):
+                base.pop(conn, None)
+            payloads.append(("user " + username, json.dumps(base)))
+            if user.get("cloudcasts"):
+                page = json.dumps({"data": user["cloudcasts"]})
+                payloads.append(("cloudcasts " + username, page))
+    return payloads
+
+
+def bench(decoder, payloads):
+    def run():
+        for description, content in payloads:
+            decoder.decode(content)
+    return min(timeit.repeat(run, repeat=REPEAT, number=NUMBER)) / NUMBER
+
+
+def main(filenames):
+    payloads = load_payloads(filenames)
+    size = sum(len(content) for description, content in payloads)
+    print len(payloads), "payloads,", size, "bytes in total"
+    print "decoder".ljust(12), "time (ms)".rjust(10), "MB/s".rjust(8)
+    for name in get_available_decoders():
+        decoder = get_decoder(name)
+        elapsed = bench(decoder, payloads)
+        print name.ljust(12), ("%.2f" % (elapsed * 1000)).rjust(10),
+        print ("%.1f" % (size / elapsed / 1e6)).rjust(8)
+
+
+if __name__ == "__main__":
+    import sys
+    try:
+        main(sys.argv[1:] or DEFAULT_FIXTURES)
+    except KeyboardInterrupt:
+        print "\nBYE!"
@@ -0,0 +1,346 @@
+#!/usr/bin/env python
+"""A local stand-in for api.mixcloud.com, serving the users of captured data (by
+default the mongomix team.*.json files), of a store of crawled users or of a
+generated graph, so that the API client and the crawler can be run and timed
+without going anywhere near the real API. Point a MixcloudAPI at it with
+api_root=server.root.
+
+Responses are rebuilt from the users' stored documents: the base data without
+the metaconnections, and the metaconnections as pages of items, paged by offset
+and limit with "next" links, as the API does. The server can be made to respond
+slowly, to cap the page size and to block clients sending too many requests,
+with a 403 and a retry-after header, like the API's rate limit.
+
+Run it on its own with the filenames of the captured data as optional
+arguments, see --help for the other options."""
+
+import calendar
+import json
+import os
+import random
+import threading
+import time
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from urllib import urlencode
+from urlparse import urlparse, parse_qsl
+
+from mixcloud.settings import METACONNS, METACONN_COUNTS, ITEMS_PER_PAGE
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            "..", "..", "mongomix")
+DEFAULT_FIXTURES = [os.path.join(FIXTURES_DIR, "team.1.json"),
+                    os.path.join(FIXTURES_DIR, "team.2.json")]
+
+DEFAULT_PORT = 8765
+
+# The metaconnections stored for users, as usernames or as (user, slug) pairs
+SOCIAL_METACONNS = ["followers", "following"]
+INTERACTION_METACONNS = ["listens", "favorites"]
+
+TIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+
+def load_fixtures(filenames):
+    """Return the users of captured data, by username. Each file holds a JSON
+    object of users' documents by username; later files win."""
+    users = {}
+    for filename in filenames:
+        with open(filename, "r") as infile:
+            users.update(json.load(infile))
+    return users
+
+
+def load_store(store, limit=0):
+    """Return the users in a store of crawled users (a MongoDB collection), by
+    username, or only the first 'limit' of them."""
+    users = {}
+    cursor = store.find(spec={"username": {"$exists": True}}, limit=limit,
+                        timeout=False)
+    for user in cursor:
+        users[user["username"]] = user
+    return users
+
+
+def generate_users(count, degree=20, seed=0):
+    """Return 'count' generated users, by username, each following and followed
+    by about 'degree' others, with a few cloudcasts each and listens and
+    favorites among them. The same seed gives the same users."""
+    rand = random.Random(seed)
+    usernames = ["user%d" % index for index in range(count)]
+    users = {}
+    for username in usernames:
+        users[username] = {"username": username, "key": "/%s/" % username,
+                           "name": username.capitalize(), "type": "user",
+                           "followers": [], "cloudcasts": []}
+        for index in range(rand.randint(0, 3)):
+            slug = "%s-mix-%d" % (username, index)
+            users[username]["cloudcasts"].append({
+                "key": "/%s/%s/" % (username, slug), "slug": slug,
+                "name": "Mix %d" % index, "type": "cloudcast",
+                "user": {"username": username, "key": "/%s/" % username},
+                "created_time": time.strftime(TIME_FORMAT, time.gmtime(
+                                    rand.randint(1230768000, 1325376000))),
+                "tags": []})
+    cloudcasts = [(user["username"], cloudcast["slug"])
+                  for user in users.itervalues()
+                  for cloudcast in user["cloudcasts"]]
+    for username in usernames:
+        user = users[username]
+        user["following"] = rand.sample(usernames, min(degree, count))
+        for followed in user["following"]:
+            users[followed]["followers"].append(username)
+        for conn in INTERACTION_METACONNS:
+            picked = rand.sample(cloudcasts, min(degree, len(cloudcasts)))
+            user[conn] = [{"user": owner, "cloudcast_slug": slug}
+                          for owner, slug in picked]
+    for user in users.itervalues():
+        for conn, count_field in METACONN_COUNTS.iteritems():
+            if conn in user:
+                user[count_field] = len(user[conn])
+    return users
+
+
+def get_item_time(item):
+    """The Unix time an item was created at, or None if it isn't known."""
+    try:
+        return calendar.timegm(time.strptime(item["created_time"],
+                                             TIME_FORMAT))
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class FakeAPIHandler(BaseHTTPRequestHandler):
+    # Keep connections alive, as the API client's pool expects
+    protocol_version = "HTTP/1.1"
+    # Send each response in one go, rather than a write per header, which with
+    # Nagle's algorithm would hold up every response on a kept-alive connection
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        server = self.server
+        uri = urlparse(self.path)
+        segments = [each for each in uri.path.split("/") if each]
+        params = dict(parse_qsl(uri.query))
+        server.wait()
+        retry = server.get_retry_after()
+        if retry:
+            self.respond(403, {"error": {"type": "RateLimitException",
+                                         "retry_after": retry}},
+                         {"retry-after": str(retry)})
+            return
+        data = server.get_resource(segments, params)
+        if data is None:
+            self.respond(404, {"error": {"type": "NotFound"}})
+        else:
+            self.respond(200, data)
+
+    def respond(self, status, data, headers=None):
+        body = json.dumps(data)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).iteritems():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.record(status, len(body))
+
+    def log_message(self, format, *args):
+        return
+
+
+class FakeAPIServer(ThreadingMixIn, HTTPServer):
+    """Serves the given users' documents, by username, as the API would, each
+    request taking 'latency' seconds plus up to 'jitter' more. Pages hold at
+    most 'page_size' items, whatever limit is asked for.
+
+    With a rate limit, in requests per second across all clients, every request
+    beyond it, and any in the 'retry_after' seconds following, gets a 403. Users
+    not in the documents are not found, unless 'stub_missing' is set, in which
+    case they are served as users with no connections at all."""
+    daemon_threads = True
+
+    def __init__(self, users, host="localhost", port=DEFAULT_PORT, latency=0,
+                 jitter=0, page_size=ITEMS_PER_PAGE, rate_limit=None,
+                 retry_after=1, stub_missing=False):
+        HTTPServer.__init__(self, (host, port), FakeAPIHandler)
+        self.users = users
+        self.cloudcasts = {}
+        for user in users.itervalues():
+            for cloudcast in user.get("cloudcasts") or []:
+                if isinstance(cloudcast, dict) and "slug" in cloudcast:
+                    self.cloudcasts[(user["username"],
+                                     cloudcast["slug"])] = cloudcast
+        self.latency = latency
+        self.jitter = jitter
+        self.page_size = page_size
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.stub_missing = stub_missing
+        self.window = []
+        self.blocked_until = 0
+        self.stats = {"requests": 0, "bytes": 0, "status": {}}
+        self.lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def root(self):
+        host, port = self.server_address[:2]
+        return "http://%s:%d" % (host, port)
+
+    def start(self):
+        """Serve from a background thread, and return the server."""
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def wait(self):
+        if self.latency or self.jitter:
+            time.sleep(self.latency + random.uniform(0, self.jitter))
+
+    def get_retry_after(self):
+        """Count a request against the rate limit, and return the seconds the
+        client has to wait for if it is blocked, or 0 if it isn't."""
+        if self.rate_limit is None:
+            return 0
+        now = time.time()
+        with self.lock:
+            if now < self.blocked_until:
+                return max(1, int(round(self.blocked_until - now)))
+            self.window = [each for each in self.window if now - each < 1]
+            if len(self.window) >= self.rate_limit:
+                self.blocked_until = now + self.retry_after
+                return self.retry_after
+            self.window.append(now)
+        return 0
+
+    def record(self, status, size):
+        with self.lock:
+            self.stats["requests"] += 1
+            self.stats["bytes"] += size
+            self.stats["status"][status] = \
+                self.stats["status"].get(status, 0) + 1
+
+    def get_user(self, username):
+        if username in self.users:
+            return self.users[username]
+        if self.stub_missing:
+            return {"username": username, "key": "/%s/" % username,
+                    "name": username, "type": "user"}
+        return None
+
+    def get_resource(self, segments, params):
+        """Return the data of the resource at the path's segments, or None if
+        there is no such resource."""
+        if not segments:
+            return None
+        user = self.get_user(segments[0])
+        if user is None:
+            return None
+        if len(segments) == 1:
+            return self.get_base(user)
+        if len(segments) == 2 and segments[1] in METACONNS:
+            return self.get_page(segments, params,
+                                 self.get_items(user, segments[1]))
+        cloudcast = self.cloudcasts.get((segments[0], segments[1]))
+        if cloudcast is None:
+            return None
+        if len(segments) == 2:
+            return cloudcast
+        if len(segments) == 3 and segments[2] in METACONNS:
+            return self.get_page(segments, params, [])
+        return None
+
+    def get_base(self, user):
+        base = dict((field, value) for field, value in user.iteritems()
+                    if field not in METACONNS and field != "_id")
+        base["metadata"] = {"connections": dict(
+            (conn, "%s/%s/%s/" % (self.root, user["username"], conn))
+            for conn in SOCIAL_METACONNS + INTERACTION_METACONNS +
+                        ["cloudcasts", "comments", "feed"])}
+        return base
+
+    def get_items(self, user, conn):
+        """Rebuild the raw items of a user's metaconnection from the clean ones
+        stored."""
+        stored = user.get(conn) or []
+        if conn in SOCIAL_METACONNS:
+            return [{"username": username, "key": "/%s/" % username}
+                    for username in stored]
+        if conn in INTERACTION_METACONNS:
+            return [{"user": {"username": item["user"],
+                              "key": "/%s/" % item["user"]},
+                     "slug": item["cloudcast_slug"],
+                     "key": "/%s/%s/" % (item["user"], item["cloudcast_slug"])}
+                    for item in stored]
+        return stored
+
+    def get_page(self, segments, params, items):
+        """Return the page of items asked for by the offset and limit params,
+        keeping only those created after the since param, if any. Items whose
+        creation time isn't known are taken to be older than any since."""
+        if "since" in params:
+            since = float(params["since"])
+            items = [item for item in items if get_item_time(item) > since]
+        offset = int(params.get("offset", 0))
+        limit = min(int(params.get("limit", self.page_size)), self.page_size)
+        page = {"data": items[offset:offset+limit], "paging": {}}
+        if offset + limit < len(items):
+            next_params = dict(params)
+            next_params["offset"] = offset + limit
+            next_params["limit"] = limit
+            page["paging"]["next"] = (self.root + "/" + "/".join(segments) +
+                                      "/?" + urlencode(next_params))
+        return page
+
+
+if __name__ == "__main__":
+    from optparse import OptionParser
+
+    parser = OptionParser(usage="usage: %prog [options] [fixtures ...]")
+    parser.add_option("-p", "--port", dest="port", type="int",
+                      default=DEFAULT_PORT)
+    parser.add_option("-g", "--generate", dest="generate", type="int",
+                      default=0,
+                      help="Serve this many generated users instead of the "
+                      "captured ones")
+    parser.add_option("-d", "--degree", dest="degree", type="int", default=20,
+                      help="Connections of each generated user")
+    parser.add_option("-l", "--latency", dest="latency", type="float",
+                      default=0.0, help="Seconds each request takes")
+    parser.add_option("-j", "--jitter", dest="jitter", type="float",
+                      default=0.0,
+                      help="Up to how many more seconds a request takes")
+    parser.add_option("-s", "--page-size", dest="page_size", type="int",
+                      default=ITEMS_PER_PAGE)
+    parser.add_option("-r", "--rate-limit", dest="rate_limit", type="float",
+                      default=None,
+                      help="Requests per second allowed before blocking")
+    parser.add_option("-a", "--retry-after", dest="retry_after", type="int",
+                      default=1, help="Seconds a blocked client waits for")
+    parser.add_option("-m", "--stub-missing", action="store_true",
+                      dest="stub_missing", default=False,
+                      help="Serve unknown users as users with no connections")
+    options, args = parser.parse_args()
+
+    if options.generate:
+        users = generate_users(options.generate, options.degree)
+    else:
+        users = load_fixtures(args or DEFAULT_FIXTURES)
+    server = FakeAPIServer(users, port=options.port, latency=options.latency,
+                           jitter=options.jitter, page_size=options.page_size,
+                           rate_limit=options.rate_limit,
+                           retry_after=options.retry_after,
+                           stub_missing=options.stub_missing)
+    print "Serving", len(users), "users at", server.root
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print "\nBYE!"
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+"""Behavioural tests of the connection pool in mixcloud/pool.py, with stand-ins
+for httplib2's connections, so nothing goes over the network."""
+
+import unittest
+
+from mixcloud.pool import ConnectionPool
+
+
+class FakeProxy(object):
+    def __init__(self, port):
+        self.port = port
+
+    def astuple(self):
+        return ("localhost", self.port)
+
+
+class FakeSocketConnection(object):
+    def __init__(self):
+        self.sock = object()
+
+    def close(self):
+        self.sock = None
+
+
+class FakeHttp(object):
+    """Like httplib2.Http, with one open connection."""
+    def __init__(self):
+        self.connections = {"http:localhost": FakeSocketConnection()}
+
+    def is_closed(self):
+        return not self.connections
+
+
+class ConnectionPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.pool = ConnectionPool(max_idle=2, idle_timeout=60)
+
+    def test_reuse(self):
+        connection = FakeHttp()
+        self.pool.checkin(None, connection)
+        self.assertTrue(self.pool.checkout(None) is connection)
+        stats = self.pool.get_stats()
+        self.assertEqual(stats["reused"], 1)
+        self.assertEqual(stats["idle"], 0)
+        self.assertEqual(stats["reuse_rate"], 1.0)
+
+    def test_most_recent_first(self):
+        first, second = FakeHttp(), FakeHttp()
+        self.pool.checkin(None, first)
+        self.pool.checkin(None, second)
+        self.assertTrue(self.pool.checkout(None) is second)
+        self.assertTrue(self.pool.checkout(None) is first)
+
+    def test_per_route(self):
+        connection = FakeHttp()
+        self.pool.checkin(FakeProxy(1), connection)
+        self.assertFalse(self.pool.checkout(FakeProxy(2)) is connection)
+        self.assertFalse(self.pool.checkout(None) is connection)
+        self.assertTrue(self.pool.checkout(FakeProxy(1)) is connection)
+        self.assertEqual(self.pool.get_stats()["created"], 2)
+
+    def test_failed_closed(self):
+        connection = FakeHttp()
+        self.pool.checkin(None, connection, healthy=False)
+        self.assertTrue(connection.is_closed())
+        self.assertEqual(self.pool.get_stats()["failed"], 1)
+        self.assertEqual(self.pool.get_stats()["idle"], 0)
+
+    def test_overflow_closed(self):
+        connections = [FakeHttp() for i in range(3)]
+        for connection in connections:
+            self.pool.checkin(None, connection)
+        self.assertTrue(connections[2].is_closed())
+        self.assertFalse(connections[0].is_closed())
+        self.assertEqual(self.pool.get_stats()["overflowed"], 1)
+
+    def test_idle_timeout(self):
+        connection = FakeHttp()
+        self.pool.checkin(None, connection)
+        self.pool.idle_timeout = -1
+        self.assertFalse(self.pool.checkout(None) is connection)
+        self.assertTrue(connection.is_closed())
+        self.assertEqual(self.pool.get_stats()["expired"], 1)
+
+    def test_closed_socket(self):
+        connection = FakeHttp()
+        self.pool.checkin(None, connection)
+        connection.connections.values()[0].close()
+        self.assertFalse(self.pool.checkout(None) is connection)
+        self.assertEqual(self.pool.get_stats()["expired"], 1)
+
+    def test_close_all(self):
+        connections = [FakeHttp(), FakeHttp()]
+        self.pool.checkin(None, connections[0])
+        self.pool.checkin(FakeProxy(1), connections[1])
+        self.pool.close_all()
+        self.assertTrue(connections[0].is_closed())
+        self.assertTrue(connections[1].is_closed())
+        self.assertEqual(self.pool.get_stats()["idle"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+"""Behavioural tests of the projections in mixcloud/projection.py."""
+
+import unittest
+
+from mixcloud.projection import (Projection, FULL_PROJECTION,
+                                 ANALYTICS_PROJECTION)
+
+USER = {"_id": "a", "username": "a", "name": "A", "biog": "...",
+        "cloudcasts": [], "cloudcast_count": 0, "listens": [],
+        "listen_count": 0, "favorites": [], "favorite_count": 0}
+
+CLOUDCAST = {"key": "/a/mix/", "slug": "mix", "name": "Mix",
+             "description": "..."}
+
+
+class ProjectionTest(unittest.TestCase):
+    def test_full(self):
+        self.assertEqual(FULL_PROJECTION.apply(USER), USER)
+        self.assertEqual(FULL_PROJECTION.apply_to_cloudcast(CLOUDCAST),
+                         CLOUDCAST)
+        self.assertEqual(FULL_PROJECTION.get_base_fields(), None)
+        self.assertTrue(FULL_PROJECTION.keeps_metaconn("comments"))
+        self.assertTrue(FULL_PROJECTION.full_cloudcasts)
+
+    def test_fields(self):
+        projected = Projection(fields=["username"]).apply(USER)
+        # The _id, metaconnections and their counts are always kept
+        self.assertEqual(projected,
+                         dict((field, value) for field, value in USER.items()
+                              if field not in ["name", "biog"]))
+
+    def test_metaconns(self):
+        projection = Projection(fields=["username"], metaconns=["listens"])
+        self.assertTrue(projection.keeps_metaconn("listens"))
+        self.assertFalse(projection.keeps_metaconn("cloudcasts"))
+        self.assertEqual(projection.get_base_fields(),
+                         set(["_id", "username", "key", "listens",
+                              "listen_count"]))
+        self.assertEqual(sorted(projection.apply(USER).keys()),
+                         ["_id", "listen_count", "listens", "username"])
+
+    def test_identity_always_kept(self):
+        projection = Projection(fields=["name"], metaconns=["listens"])
+        self.assertEqual(projection.get_base_fields(),
+                         set(["_id", "username", "key", "name", "listens",
+                              "listen_count"]))
+        self.assertEqual(projection.apply(dict(USER, key="/a/")),
+                         {"_id": "a", "username": "a", "key": "/a/",
+                          "name": "A", "listens": [], "listen_count": 0})
+
+    def test_cloudcast_fields(self):
+        projection = Projection(cloudcast_fields=["key", "slug"])
+        self.assertEqual(projection.apply_to_cloudcast(CLOUDCAST),
+                         {"key": "/a/mix/", "slug": "mix"})
+        self.assertEqual(projection.apply(USER), USER)
+
+    def test_analytics(self):
+        self.assertFalse(ANALYTICS_PROJECTION.full_cloudcasts)
+        self.assertFalse(ANALYTICS_PROJECTION.keeps_metaconn("comments"))
+        projected = ANALYTICS_PROJECTION.apply(USER)
+        self.assertFalse("biog" in projected)
+        self.assertEqual(projected["listen_count"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+"""Behavioural tests of the rate limiting in mixcloud/throttle.py. Time passing
+is simulated by moving the buckets' clocks back, so nothing sleeps."""
+
+import unittest
+
+from mixcloud.throttle import TokenBucket, RateLimiter, unlimited
+
+
+class FakeProxy(object):
+    def __init__(self, port):
+        self.port = port
+
+    def astuple(self):
+        return ("localhost", self.port)
+
+
+class TokenBucketTest(unittest.TestCase):
+    def make_bucket(self, **params):
+        defaults = {"rate": 10, "capacity": 5, "min_rate": 1, "max_rate": 20,
+                    "increase": 1, "backoff": 0.5}
+        defaults.update(params)
+        return TokenBucket(**defaults)
+
+    def elapse(self, bucket, seconds):
+        bucket.updated -= seconds
+        bucket.blocked_until -= seconds
+
+    def test_first_request_free(self):
+        bucket = self.make_bucket()
+        self.assertEqual(bucket.wait_time(), 0)
+        self.assertEqual(bucket.reserve(), 0)
+
+    def test_requests_queue_up(self):
+        bucket = self.make_bucket()
+        bucket.reserve()
+        self.assertAlmostEqual(bucket.reserve(), 0.1, places=2)
+        self.assertAlmostEqual(bucket.reserve(), 0.2, places=2)
+
+    def test_wait_time_takes_no_token(self):
+        bucket = self.make_bucket()
+        bucket.reserve()
+        self.assertAlmostEqual(bucket.wait_time(), 0.1, places=2)
+        self.assertAlmostEqual(bucket.wait_time(), 0.1, places=2)
+
+    def test_refill_up_to_capacity(self):
+        bucket = self.make_bucket()
+        self.elapse(bucket, 60)
+        for i in range(5):
+            self.assertEqual(bucket.reserve(), 0)
+        self.assertTrue(bucket.reserve() > 0)
+
+    def test_rate_creeps_up(self):
+        bucket = self.make_bucket(max_rate=11.5)
+        bucket.succeeded()
+        self.assertEqual(bucket.rate, 11)
+        bucket.succeeded()
+        self.assertEqual(bucket.rate, 11.5)
+
+    def test_block(self):
+        bucket = self.make_bucket(min_rate=4)
+        self.elapse(bucket, 60)
+        bucket.block(30)
+        self.assertAlmostEqual(bucket.cooldown(), 30, places=1)
+        self.assertEqual(bucket.rate, 5)
+        self.assertTrue(bucket.reserve() >= 29.9)
+        bucket.block(30)
+        self.assertEqual(bucket.rate, 4)
+
+    def test_unblocked(self):
+        bucket = self.make_bucket()
+        bucket.block(30)
+        self.elapse(bucket, 31)
+        self.assertEqual(bucket.cooldown(), 0)
+        self.assertEqual(bucket.reserve(), 0)
+
+
+class RateLimiterTest(unittest.TestCase):
+    def test_bucket_per_route(self):
+        limiter = RateLimiter(rate=10)
+        self.assertTrue(limiter.bucket(None) is limiter.bucket(None))
+        self.assertTrue(limiter.bucket(FakeProxy(1)) is
+                        limiter.bucket(FakeProxy(1)))
+        self.assertFalse(limiter.bucket(FakeProxy(1)) is
+                         limiter.bucket(FakeProxy(2)))
+        self.assertEqual(limiter.bucket(None).rate, 10)
+
+    def test_block_one_route(self):
+        limiter = RateLimiter()
+        limiter.record_block(FakeProxy(1), 30)
+        self.assertTrue(limiter.is_blocked(FakeProxy(1)))
+        self.assertFalse(limiter.is_blocked(FakeProxy(2)))
+        self.assertEqual(limiter.next_available_in([FakeProxy(1),
+                                                    FakeProxy(2)]), 0)
+        self.assertTrue(limiter.next_available_in([FakeProxy(1)]) > 29)
+
+    def test_unlimited(self):
+        limiter = unlimited()
+        for i in range(1000):
+            self.assertEqual(limiter.acquire(None), 0)
+        limiter.record_block(None, 30)
+        self.assertTrue(limiter.is_blocked(None))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+"""Rate limiting for requests to the API, with a token bucket per route (i.e.
+per proxy, or the direct connection)."""
+
+import threading
+import time
+from time import sleep
+
+from settings import (RESPECT_TIME, RATE_LIMIT_BURST, RATE_LIMIT_MIN_RATE,
+                      RATE_LIMIT_MAX_RATE, RATE_LIMIT_INCREASE,
+                      RATE_LIMIT_BACKOFF)
+
+
+# Requests per second so high that requests never wait for a token
+UNLIMITED_RATE = 1e9
+
+
+def route_key(proxy):
+    """Hashable key identifying the route a request goes through."""
+    if proxy is None:
+        return None
+    return proxy.astuple()
+
+
+class TokenBucket(object):
+    """A token bucket which refills at 'rate' tokens per second, up to
+    'capacity' tokens. Each request takes a token, waiting for one if the bucket
+    is empty.
+
+    The rate is adapted to what the API allows: it creeps up by 'increase' after
+    every successful request and is cut by the 'backoff' factor whenever the
+    route gets blocked, at which point no tokens are handed out until the
+    retry-after period is over."""
+    def __init__(self, rate=1.0/RESPECT_TIME, capacity=RATE_LIMIT_BURST,
+                 min_rate=RATE_LIMIT_MIN_RATE, max_rate=RATE_LIMIT_MAX_RATE,
+                 increase=RATE_LIMIT_INCREASE, backoff=RATE_LIMIT_BACKOFF):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.min_rate = float(min_rate)
+        self.max_rate = float(max_rate)
+        self.increase = float(increase)
+        self.backoff = float(backoff)
+        self.tokens = 1.0
+        self.blocked_until = 0
+        # Time up to which tokens have been accounted for, which is in the
+        # future while the route is blocked
+        self.updated = time.time()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        if now > self.updated:
+            self.tokens = min(self.capacity,
+                              self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def reserve(self):
+        """Take a token and return the number of seconds to wait before it may
+        be used. Tokens can be owed, so concurrent callers queue up fairly."""
+        with self.lock:
+            now = time.time()
+            self._refill(now)
+            self.tokens -= 1
+            ready = max(self.updated, now)
+            if self.tokens < 0:
+                ready += -self.tokens / self.rate
+            return max(0, ready - now)
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait > 0:
+            sleep(wait)
+        return wait
+
+    def wait_time(self):
+        """Seconds a request would have to wait for a token if it took one now.
+        """
+        with self.lock:
+            now = time.time()
+            self._refill(now)
+            ready = max(self.updated, now)
+            if self.tokens < 1:
+                ready += (1 - self.tokens) / self.rate
+            return max(0, ready - now)
+
+    def succeeded(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def block(self, retry):
+        """The route was blocked for 'retry' seconds: hold back all tokens
+        until then and slow down afterwards."""
+        with self.lock:
+            now = time.time()
+            self.blocked_until = max(self.blocked_until, now + retry)
+            self.updated = max(self.updated, self.blocked_until)
+            self.tokens = min(self.tokens, 0)
+            self.rate = max(self.min_rate, self.rate * self.backoff)
+
+    def cooldown(self):
+        """Seconds left until the route is no longer blocked."""
+        return max(0, self.blocked_until - time.time())
+
+
+class RateLimiter(object):
+    """Keeps a TokenBucket for every route requests are sent through."""
+    def __init__(self, **bucket_params):
+        self.bucket_params = bucket_params
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def bucket(self, proxy):
+        key = route_key(proxy)
+        with self.lock:
+            if key not in self.buckets:
+                self.buckets[key] = TokenBucket(**self.bucket_params)
+            return self.buckets[key]
+
+    def acquire(self, proxy):
+        return self.bucket(proxy).acquire()
+
+    def record_success(self, proxy):
+        self.bucket(proxy).succeeded()
+
+    def record_block(self, proxy, retry):
+        self.bucket(proxy).block(retry)
+
+    def is_blocked(self, proxy):
+        return self.bucket(proxy).cooldown() > 0
+
+    def next_available_in(self, proxies):
+        """Seconds until the first of the given routes is unblocked."""
+        return min(self.bucket(proxy).cooldown() for proxy in proxies)
+
+
+def unlimited():
+    """A RateLimiter which never holds requests back, except while the API has
+    blocked a route, e.g. for benchmarks against a local stand-in for the API.
+    """
+    return RateLimiter(rate=UNLIMITED_RATE, capacity=UNLIMITED_RATE,
+                       min_rate=UNLIMITED_RATE, max_rate=UNLIMITED_RATE)
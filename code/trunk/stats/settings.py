@@ -1,7 +1,11 @@
 #!/usr/bin/env python
-"""Stats scripts settings."""
+"""Stats scripts settings. The scripts are run from this directory with lib
+on the path, like the crawler:
 
-import pymongo
+    PYTHONPATH=../lib python stats.py"""
+
+from connections import lazy_connection, lazy_database, lazy_collection
+from jsonconfig import MongoConfig
 
 DEBUG = False
 
@@ -19,13 +23,17 @@ MONGO_PASSWORD = None
 MONGO_SLAVE_OK = False #whether or not  
 MONGO_TIMEOUT = None #network timeout for the connection in seconds
 
-MONGO_CONNECTION = pymongo.Connection(host=MONGO_HOST,
-                                      port=MONGO_PORT,
-                                      slave_okay=MONGO_SLAVE_OK,
-                                      network_timeout=MONGO_TIMEOUT)
-
-MONGO_DB = MONGO_CONNECTION[MONGO_DBNAME]
-MONGO_COLLECTION = MONGO_DB[MONGO_COLLECTION_NAME]
+MONGO_CONFIG = MongoConfig(host=MONGO_HOST,
+                           port=MONGO_PORT,
+                           slave_okay=MONGO_SLAVE_OK,
+                           network_timeout=MONGO_TIMEOUT,
+                           dbname=MONGO_DBNAME,
+                           collection=MONGO_COLLECTION_NAME)
+
+# Only connected to when first used, see connections.py
+MONGO_CONNECTION = lazy_connection(MONGO_CONFIG)
+MONGO_DB = lazy_database(MONGO_CONFIG)
+MONGO_COLLECTION = lazy_collection(MONGO_CONFIG)
 
 ################################################################################
 